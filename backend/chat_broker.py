@@ -0,0 +1,500 @@
+"""
+Cross-Process Chat Broker for AgriChain
+Routes chat events and online presence between uvicorn workers so a message
+handled by one worker reaches sockets held by another
+
+Backends (CHAT_BROKER environment variable):
+  local - single process, nothing to route (default)
+  unix  - workers on one host talk through a Unix domain socket hub
+  redis - workers anywhere talk through Redis PUBLISH/SUBSCRIBE
+"""
+
+import asyncio
+import fcntl
+import json
+import os
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+from urllib.parse import urlparse
+
+CHANNEL = "agrichain:chat"
+# Workers re-announce their users this often; peers silent for 3 intervals are dropped
+HEARTBEAT_SECONDS = 15.0
+RECONNECT_SECONDS = 1.0
+
+Deliver = Callable[[str, dict], Awaitable[None]]
+
+
+class ChatBroker:
+    """Broker interface; the local backend routes nothing"""
+
+    def __init__(self):
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+    async def start(self, deliver: Deliver, local_users: Callable[[], List[str]]):
+        """deliver(receiver_email, message) hands remote messages to local sockets"""
+
+    async def stop(self):
+        pass
+
+    def publish(self, receiver_email: str, message: dict):
+        """Route a message to other workers holding sockets for receiver_email"""
+
+    def presence_changed(self, user_email: str, online: bool):
+        """Announce that a user's first socket opened / last socket closed on this worker"""
+
+    def is_online(self, user_email: str) -> bool:
+        """True if the user has sockets on another worker"""
+        return False
+
+    def online_users(self) -> Set[str]:
+        return set()
+
+
+class LocalBroker(ChatBroker):
+    """Single-process deployments"""
+
+
+class FrameBroker(ChatBroker):
+    """
+    Shared logic for brokers exchanging JSON frames
+    Frames: message, presence, hello (full user snapshot), sync (ask for hellos), bye
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.remote_presence: Dict[str, Set[str]] = {}  # user -> worker ids
+        self.worker_users: Dict[str, Set[str]] = {}  # worker id -> users
+        self.worker_seen: Dict[str, float] = {}
+        self._outbox: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._deliver: Optional[Deliver] = None
+        self._local_users: Callable[[], List[str]] = list
+
+    async def start(self, deliver: Deliver, local_users: Callable[[], List[str]]):
+        self._deliver = deliver
+        self._local_users = local_users
+        self._outbox = asyncio.Queue()
+        self._tasks = [
+            asyncio.create_task(self._run()),
+            asyncio.create_task(self._heartbeat())
+        ]
+
+    async def stop(self):
+        await self._send_now({"kind": "bye", "from": self.worker_id})
+        for task in self._tasks:
+            task.cancel()
+
+    # Subclasses implement transport
+    async def _run(self):
+        raise NotImplementedError
+
+    async def _send_now(self, frame: dict):
+        raise NotImplementedError
+
+    def _queue(self, frame: dict):
+        frame["from"] = self.worker_id
+        if self._outbox is not None:
+            self._outbox.put_nowait(frame)
+
+    async def _drain_outbox(self):
+        while True:
+            frame = await self._outbox.get()
+            await self._send_now(frame)
+
+    def _hello(self) -> dict:
+        return {"kind": "hello", "from": self.worker_id, "users": self._local_users()}
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            self._queue(self._hello())
+            cutoff = time.monotonic() - HEARTBEAT_SECONDS * 3
+            for worker in [w for w, seen in self.worker_seen.items() if seen < cutoff]:
+                print(f"[BROKER] Worker {worker} went silent, dropping its presence")
+                self._forget_worker(worker)
+
+    def publish(self, receiver_email: str, message: dict):
+        self._queue({"kind": "message", "to": receiver_email, "message": message})
+
+    def presence_changed(self, user_email: str, online: bool):
+        self._queue({"kind": "presence", "user": user_email, "online": online})
+
+    def is_online(self, user_email: str) -> bool:
+        return bool(self.remote_presence.get(user_email))
+
+    def online_users(self) -> Set[str]:
+        return {user for user, workers in self.remote_presence.items() if workers}
+
+    def _set_presence(self, worker: str, user: str, online: bool):
+        users = self.worker_users.setdefault(worker, set())
+        workers = self.remote_presence.setdefault(user, set())
+        if online:
+            users.add(user)
+            workers.add(worker)
+        else:
+            users.discard(user)
+            workers.discard(worker)
+            if not workers:
+                del self.remote_presence[user]
+
+    def _forget_worker(self, worker: str):
+        for user in self.worker_users.pop(worker, set()):
+            self._set_presence(worker, user, False)
+        self.worker_users.pop(worker, None)
+        self.worker_seen.pop(worker, None)
+
+    def _forget_all(self):
+        for worker in list(self.worker_users):
+            self._forget_worker(worker)
+
+    async def handle_frame(self, frame: dict):
+        worker = frame.get("from")
+        if not worker or worker == self.worker_id:
+            return
+        kind = frame.get("kind")
+        if kind != "bye":
+            self.worker_seen[worker] = time.monotonic()
+
+        if kind == "message":
+            await self._deliver(frame["to"], frame["message"])
+        elif kind == "presence":
+            self._set_presence(worker, frame["user"], frame["online"])
+        elif kind == "hello":
+            for user in self.worker_users.get(worker, set()) - set(frame["users"]):
+                self._set_presence(worker, user, False)
+            for user in frame["users"]:
+                self._set_presence(worker, user, True)
+        elif kind == "sync":
+            self._queue(self._hello())
+        elif kind == "bye":
+            self._forget_worker(worker)
+
+    def _on_connected(self):
+        """Announce ourselves and ask everyone else for their users"""
+        self._queue(self._hello())
+        self._queue({"kind": "sync"})
+
+
+class UnixSocketBroker(FrameBroker):
+    """
+    Workers on one host share a hub on a Unix domain socket
+    Whichever worker holds the lock file runs the hub (relaying newline-delimited
+    JSON frames between peers); if it dies another worker takes over.
+    """
+
+    def __init__(self, socket_path: str):
+        super().__init__()
+        self.socket_path = socket_path
+        self._lock_file = None
+        self._peers: Dict[asyncio.StreamWriter, Optional[str]] = {}
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._server = None
+
+    def _try_become_hub(self) -> bool:
+        lock_file = open(self.socket_path + ".lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file  # Held for the life of this process
+        return True
+
+    async def _start_hub(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # Left behind by a dead hub
+        self._server = await asyncio.start_unix_server(self._serve_peer, path=self.socket_path)
+        print(f"[BROKER] Worker {self.worker_id} is the chat hub at {self.socket_path}")
+
+    async def _serve_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._peers[writer] = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                frame = json.loads(line)
+                self._peers[writer] = frame.get("from")
+                self._relay(line, exclude=writer)
+                await self.handle_frame(frame)
+        except (ConnectionError, json.JSONDecodeError, asyncio.CancelledError):
+            pass  # Peer went away or the hub is shutting down
+        finally:
+            worker = self._peers.pop(writer, None)
+            writer.close()
+            if worker:
+                bye = {"kind": "bye", "from": worker}
+                self._relay((json.dumps(bye) + "\n").encode())
+                self._forget_worker(worker)
+
+    async def stop(self):
+        await super().stop()
+        if self._server is not None:
+            self._server.close()
+            for peer in list(self._peers):
+                peer.close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+
+    def _relay(self, line: bytes, exclude: Optional[asyncio.StreamWriter] = None):
+        for peer in list(self._peers):
+            if peer is not exclude:
+                try:
+                    peer.write(line)
+                except Exception:
+                    self._peers.pop(peer, None)
+
+    async def _run(self):
+        drain = asyncio.create_task(self._drain_outbox())
+        try:
+            while True:
+                if self._server is None and self._try_become_hub():
+                    await self._start_hub()
+                    self._on_connected()
+                if self._server is not None:
+                    await asyncio.Event().wait()  # Hub serves until cancelled
+
+                try:
+                    reader, self._writer = await asyncio.open_unix_connection(self.socket_path)
+                except (FileNotFoundError, ConnectionRefusedError):
+                    await asyncio.sleep(RECONNECT_SECONDS)
+                    continue
+
+                self._on_connected()
+                try:
+                    while True:
+                        line = await reader.readline()
+                        if not line:
+                            break
+                        await self.handle_frame(json.loads(line))
+                except (ConnectionError, json.JSONDecodeError):
+                    pass
+                print("[BROKER] Lost connection to chat hub, reconnecting")
+                self._writer = None
+                self._forget_all()
+        finally:
+            drain.cancel()
+
+    async def _send_now(self, frame: dict):
+        line = (json.dumps(frame) + "\n").encode()
+        if self._server is not None:
+            self._relay(line)
+        elif self._writer is not None:
+            try:
+                self._writer.write(line)
+                await self._writer.drain()
+            except ConnectionError:
+                pass  # Reader side notices and reconnects
+
+
+def _encode_command(*args: str) -> bytes:
+    """Encode a command in the Redis serialization protocol (RESP)"""
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg.encode() if isinstance(arg, str) else arg
+        parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+    return b"".join(parts)
+
+
+async def _read_reply(reader: asyncio.StreamReader):
+    """Read one RESP reply"""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("connection closed")
+    prefix, body = line[:1], line[1:-2]
+    if prefix == b"+":
+        return body.decode()
+    if prefix == b"-":
+        raise RuntimeError(body.decode())
+    if prefix == b":":
+        return int(body)
+    if prefix == b"$":
+        length = int(body)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if prefix == b"*":
+        return [await _read_reply(reader) for _ in range(int(body))]
+    raise RuntimeError(f"unexpected reply: {line!r}")
+
+
+class RedisBroker(FrameBroker):
+    """Frames travel over a Redis PUBLISH/SUBSCRIBE channel (no client library needed)"""
+
+    def __init__(self, url: str, channel: str = CHANNEL):
+        super().__init__()
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.channel = channel
+        self._publisher: Optional[tuple] = None
+        # One PUBLISH in flight at a time: replies are matched to commands by order,
+        # and stop() publishes while the outbox drain may be mid-command
+        self._publish_lock = asyncio.Lock()
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            try:
+                writer.write(_encode_command("AUTH", self.password))
+                await _read_reply(reader)
+            except BaseException:
+                writer.close()
+                raise
+        return reader, writer
+
+    async def _run(self):
+        drain = None
+        while True:
+            subscriber = None
+            try:
+                self._publisher = await self._connect()
+                subscriber = await self._connect()
+                reader, writer = subscriber
+                writer.write(_encode_command("SUBSCRIBE", self.channel))
+                await _read_reply(reader)  # Subscription confirmation
+                if drain is None or drain.done():
+                    drain = asyncio.create_task(self._drain_outbox())
+                self._on_connected()
+
+                while True:
+                    reply = await _read_reply(reader)
+                    if isinstance(reply, list) and reply and reply[0] == b"message":
+                        await self.handle_frame(json.loads(reply[2]))
+            except asyncio.CancelledError:
+                if drain:
+                    drain.cancel()
+                raise
+            except (OSError, ConnectionError, RuntimeError) as e:
+                print(f"[BROKER] Redis connection lost ({e}), reconnecting")
+            finally:
+                # Both connections are replaced on reconnect; don't leak the old sockets
+                publisher, self._publisher = self._publisher, None
+                for connection in (publisher, subscriber):
+                    if connection is not None:
+                        connection[1].close()
+            self._forget_all()
+            await asyncio.sleep(RECONNECT_SECONDS)
+
+    async def _send_now(self, frame: dict):
+        async with self._publish_lock:
+            if self._publisher is None:
+                return
+            reader, writer = self._publisher
+            try:
+                writer.write(_encode_command("PUBLISH", self.channel, json.dumps(frame)))
+                await writer.drain()
+                await _read_reply(reader)
+            except (OSError, ConnectionError, RuntimeError):
+                if self._publisher is not None and self._publisher[1] is writer:
+                    self._publisher = None
+                writer.close()
+
+
+class MiniRedisServer:
+    """
+    In-repo stand-in speaking just enough RESP (PING, AUTH, SUBSCRIBE, PUBLISH)
+    to run the Redis backend locally and in tests without a Redis install
+    """
+
+    def __init__(self):
+        self.subscribers: Dict[str, Set[asyncio.StreamWriter]] = {}
+        self.server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        self.server = await asyncio.start_server(self._serve, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                command = await _read_reply(reader)
+                name = command[0].decode().upper()
+                args = command[1:]
+                if name == "PING":
+                    writer.write(b"+PONG\r\n")
+                elif name == "AUTH":
+                    writer.write(b"+OK\r\n")
+                elif name == "SUBSCRIBE":
+                    for index, channel in enumerate(args, 1):
+                        self.subscribers.setdefault(channel.decode(), set()).add(writer)
+                        writer.write(b"*3\r\n" + _encode_command("subscribe", channel)[4:]
+                                     + f":{index}\r\n".encode())
+                elif name == "PUBLISH":
+                    channel, data = args[0].decode(), args[1]
+                    receivers = self.subscribers.get(channel, set())
+                    push = _encode_command("message", channel, data)
+                    for receiver in list(receivers):
+                        receiver.write(push)
+                    writer.write(f":{len(receivers)}\r\n".encode())
+                else:
+                    writer.write(f"-ERR unknown command '{name}'\r\n".encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass  # Client went away or the stand-in is shutting down
+        finally:
+            for receivers in self.subscribers.values():
+                receivers.discard(writer)
+            writer.close()
+
+
+def create_broker() -> ChatBroker:
+    """Build the broker selected by CHAT_BROKER / CHAT_BROKER_SOCKET / CHAT_BROKER_URL"""
+    backend = os.getenv("CHAT_BROKER", "local").lower()
+    if backend == "unix":
+        return UnixSocketBroker(os.getenv("CHAT_BROKER_SOCKET", "/tmp/agrichain-chat.sock"))
+    if backend == "redis":
+        return RedisBroker(os.getenv("CHAT_BROKER_URL", "redis://localhost:6379/0"))
+    return LocalBroker()
+
+
+if __name__ == "__main__":
+    # Route a message and presence between two "workers" over each backend
+    import tempfile
+
+    async def exercise(make_broker) -> None:
+        inbox: List[tuple] = []
+
+        async def deliver(receiver: str, message: dict):
+            inbox.append((receiver, message))
+
+        worker_a, worker_b = make_broker(), make_broker()
+        await worker_a.start(deliver, lambda: [])
+        await asyncio.sleep(0.2)
+        await worker_b.start(deliver, lambda: ["farmer@test.com"])
+        await asyncio.sleep(0.3)
+
+        print(f"    farmer online (seen from A): {worker_a.is_online('farmer@test.com')}")
+        worker_a.publish("farmer@test.com", {"type": "new_message", "message": "Namaste"})
+        await asyncio.sleep(0.2)
+        print(f"    delivered on B: {inbox}")
+
+        worker_b.presence_changed("farmer@test.com", False)
+        await asyncio.sleep(0.2)
+        print(f"    farmer online after disconnect: {worker_a.is_online('farmer@test.com')}")
+
+        await worker_b.stop()
+        await worker_a.stop()
+
+    async def main():
+        print("Testing Unix socket broker...")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "chat.sock")
+            await exercise(lambda: UnixSocketBroker(path))
+
+        print("Testing Redis broker against the local stand-in...")
+        stand_in = MiniRedisServer()
+        port = await stand_in.start()
+        await exercise(lambda: RedisBroker(f"redis://127.0.0.1:{port}/0"))
+        await stand_in.stop()
+
+    asyncio.run(main())
+    print("\n[OK] Chat broker working correctly!")
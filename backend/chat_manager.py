@@ -1,13 +1,32 @@
 """
 Chat System Manager for AgriChain
 Handles message storage, retrieval, and conversation management
+
+Several workers can share one data directory: messages, conversations, read
+marks and delivery cursors are written under a file lock, merged with what the
+other workers wrote. The search index, the client-id de-duplication cache and
+the newest seq per conversation are per-process; they catch up with messages
+other workers stored whenever the messages file has changed since this worker
+last saw it. Read marks from other workers are picked up on flush.
 """
 
 import json
+import os
 from datetime import datetime
 from pathlib import Path
 from typing import List, Dict, Optional
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+
+from sortedcontainers import SortedList
+
+from chat_search import ChatSearchIndex, DEFAULT_PAGE_SIZE
+from file_lock import file_lock
+from sequence_allocator import SequenceAllocator
+
+# Recent (sender, client_id) pairs remembered for de-duplicating client retries
+CLIENT_ID_CACHE_SIZE = 10000
+# Most messages pushed in one offline-sync frame; the client asks for the next page
+SYNC_MAX_MESSAGES = 1000
 
 class ChatManager:
     def __init__(self, data_dir: str = "data"):
@@ -15,12 +34,62 @@ class ChatManager:
         self.data_dir.mkdir(exist_ok=True)
         self.messages_file = self.data_dir / "chat_messages.json"
         self.conversations_file = self.data_dir / "conversations.json"
+        self.cursors_file = self.data_dir / "chat_cursors.json"
+        self.read_state_file = self.data_dir / "read_state.json"
+        self.sequence_file = self.data_dir / "chat_sequence.json"
+        # Held by whichever worker is writing the chat files
+        self.lock_file = self.data_dir / "chat.lock"
         
         # Initialize files if they don't exist
         if not self.messages_file.exists():
             self._save_messages([])
         if not self.conversations_file.exists():
             self._save_conversations({})
+
+        messages = self._load_messages()
+        self._stamp_legacy_seqs(messages)
+        # Message seqs (and ids) come from here, never from the size of the store;
+        # the file is only written once the first message is sent
+        # One number per block keeps seqs in the order messages reach the file,
+        # whichever worker sent them
+        highest_seq = max((msg["seq"] for msg in messages), default=0)
+        self.sequence = SequenceAllocator(self.sequence_file, block_size=1,
+                                          initial_value=lambda: highest_seq)
+
+        # (sender_email, client_id) -> message, seeded from the newest stored messages
+        self._client_ids: OrderedDict = OrderedDict()
+        for msg in messages[-CLIENT_ID_CACHE_SIZE:]:
+            self._remember_client_id(msg)
+
+        # Newest message seq per conversation, the value a "read all" mark moves to
+        # (conversations saved since also record it as "last_seq")
+        self._conversation_last_seq: Dict[str, int] = {}
+        for msg in messages:
+            self._conversation_last_seq[msg.get("conversation_id")] = msg["seq"]
+
+        # Full-text index, kept in step with send_message / delete_conversation
+        self.search_index = ChatSearchIndex()
+        self.search_index.build((msg["seq"], msg) for msg in messages)
+
+        # Newest seq and messages file version the indexes above have taken in
+        self._absorbed_seq = highest_seq
+        self._messages_stamp = self._file_stamp(self.messages_file)
+
+        # Highest message seq each user's client has confirmed receiving
+        self.delivery_cursors: Dict[str, int] = self._load_cursors()
+
+        # Conversations stay in memory (reloaded when another worker saves them);
+        # each user gets a list ordered by (last_message_time, conversation_id)
+        # and a running unread total
+        self.conversations: Dict[str, Dict] = {}
+        self._conversations_stamp: Optional[tuple] = None
+        # (conversation_id, email) -> unread count cleared by mark_as_read, not yet saved
+        self._unsaved_reads: Dict[tuple, int] = {}
+        self._refresh_conversations()
+
+        # Last-read seq per (user, conversation); changes are flushed in batches
+        self.read_marks: Dict[str, Dict[str, int]] = self._load_read_state()
+        self._read_state_dirty = False
     
     def _load_messages(self) -> List[Dict]:
         """Load all messages from JSON file"""
@@ -31,11 +100,17 @@ class ChatManager:
             print(f"[ERROR] Failed to load messages: {e}")
             return []
     
+    def _write_json(self, path: Path, data, indent: int = 2):
+        """Replace a file atomically, so other workers never read half of it"""
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+        os.replace(tmp, path)
+    
     def _save_messages(self, messages: List[Dict]):
         """Save all messages to JSON file"""
         try:
-            with open(self.messages_file, 'w', encoding='utf-8') as f:
-                json.dump(messages, f, ensure_ascii=False, indent=2)
+            self._write_json(self.messages_file, messages)
         except Exception as e:
             print(f"[ERROR] Failed to save messages: {e}")
     
@@ -51,32 +126,202 @@ class ChatManager:
     def _save_conversations(self, conversations: Dict):
         """Save conversations index"""
         try:
-            with open(self.conversations_file, 'w', encoding='utf-8') as f:
-                json.dump(conversations, f, ensure_ascii=False, indent=2)
+            self._write_json(self.conversations_file, conversations)
         except Exception as e:
             print(f"[ERROR] Failed to save conversations: {e}")
     
-    def _get_conversation_id(self, user1_email: str, user2_email: str) -> str:
+    @staticmethod
+    def _file_stamp(path: Path) -> Optional[tuple]:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    
+    def _refresh_conversations(self):
+        """Reload conversations if another worker saved them since this one last did"""
+        stamp = self._file_stamp(self.conversations_file)
+        if stamp is not None and stamp == self._conversations_stamp:
+            return
+        conversations = self._load_conversations()
+        # Reads marked here but not saved yet still apply on top of the other workers' counts
+        for (conv_id, email), cleared in self._unsaved_reads.items():
+            if conv_id in conversations:
+                unread = conversations[conv_id]["unread_count"]
+                unread[email] = max(0, unread.get(email, 0) - cleared)
+        
+        self.conversations = conversations
+        self._user_conversations: Dict[str, SortedList] = defaultdict(SortedList)
+        self._unread_totals: Dict[str, int] = defaultdict(int)
+        for conv_id, conv_data in conversations.items():
+            self._index_conversation(conv_id, conv_data)
+            for email, count in conv_data.get("unread_count", {}).items():
+                self._unread_totals[email] += count
+        self._conversations_stamp = stamp
+    
+    def _refresh_messages(self):
+        """Catch the per-process indexes up if another worker saved messages since this one last did"""
+        stamp = self._file_stamp(self.messages_file)
+        if stamp is None or stamp == self._messages_stamp:
+            return
+        self._absorb_messages(self._load_messages())
+        self._messages_stamp = stamp
+    
+    def _absorb_messages(self, messages: List[Dict]):
+        """Index messages newer than the last absorbed seq and forget conversations deleted elsewhere"""
+        present = set()
+        for msg in messages:
+            present.add(msg.get("conversation_id"))
+            if msg["seq"] > self._absorbed_seq:
+                self._remember_client_id(msg)
+                self.search_index.add(msg["seq"], msg)
+                self._conversation_last_seq[msg.get("conversation_id")] = msg["seq"]
+        if messages:
+            self._absorbed_seq = max(self._absorbed_seq, messages[-1]["seq"])
+        for conversation_id in [c for c in self._conversation_last_seq if c not in present]:
+            self.search_index.remove_conversation(conversation_id)
+            del self._conversation_last_seq[conversation_id]
+    
+    def _commit_conversations(self):
+        """Save the in-memory conversations; call under the chat lock after a refresh"""
+        self._save_conversations(self.conversations)
+        self._conversations_stamp = self._file_stamp(self.conversations_file)
+        self._unsaved_reads.clear()
+    
+    def _load_cursors(self) -> Dict[str, int]:
+        """Load per-user delivery cursors"""
+        if not self.cursors_file.exists():
+            return {}
+        try:
+            with open(self.cursors_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[ERROR] Failed to load delivery cursors: {e}")
+            return {}
+    
+    def _save_cursors(self):
+        """Save per-user delivery cursors, merged with other workers' (cursors only move forward)"""
+        try:
+            with file_lock(self.lock_file):
+                for email, seq in self._load_cursors().items():
+                    if seq > self.delivery_cursors.get(email, 0):
+                        self.delivery_cursors[email] = seq
+                self._write_json(self.cursors_file, self.delivery_cursors)
+        except Exception as e:
+            print(f"[ERROR] Failed to save delivery cursors: {e}")
+    
+    def _load_read_state(self) -> Dict[str, Dict[str, int]]:
+        """Load read high-water marks"""
+        if not self.read_state_file.exists():
+            return {}
+        try:
+            with open(self.read_state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[ERROR] Failed to load read state: {e}")
+            return {}
+    
+    def flush_read_state(self) -> bool:
+        """Write read marks and unread counts if anything changed since the last flush"""
+        if not self._read_state_dirty:
+            return False
+        self._read_state_dirty = False
+        with file_lock(self.lock_file):
+            # Marks only move forward; keep the higher of ours and the other workers'
+            for email, marks in self._load_read_state().items():
+                ours = self.read_marks.setdefault(email, {})
+                for conv_id, seq in marks.items():
+                    if seq > ours.get(conv_id, 0):
+                        ours[conv_id] = seq
+            try:
+                self._write_json(self.read_state_file, self.read_marks)
+            except Exception as e:
+                print(f"[ERROR] Failed to save read state: {e}")
+            self._refresh_conversations()
+            self._commit_conversations()
+        return True
+    
+    def _with_read_flag(self, message: Dict) -> Dict:
+        """Copy of a stored message with read derived from the receiver's mark"""
+        mark = self.read_marks.get(message.get("receiver_email"), {}).get(message.get("conversation_id"), 0)
+        return dict(message, read=bool(message.get("read")) or message["seq"] <= mark)
+    
+    def _stamp_legacy_seqs(self, messages: List[Dict]):
+        """One-time migration: number messages stored before seqs existed, in file order"""
+        last_seq = 0
+        stamped = 0
+        for msg in messages:
+            if not msg.get("seq"):
+                msg["seq"] = last_seq + 1
+                stamped += 1
+            last_seq = msg["seq"]
+        if stamped:
+            self._save_messages(messages)
+            print(f"[CHAT] Assigned sequence numbers to {stamped} stored messages")
+    
+    def _index_conversation(self, conversation_id: str, conv_data: Dict):
+        key = (conv_data["last_message_time"], conversation_id)
+        for participant in conv_data["participants"]:
+            self._user_conversations[participant["email"]].add(key)
+    
+    def _unindex_conversation(self, conversation_id: str, conv_data: Dict):
+        key = (conv_data["last_message_time"], conversation_id)
+        for participant in conv_data["participants"]:
+            self._user_conversations[participant["email"]].discard(key)
+    
+    def get_conversation_id(self, user1_email: str, user2_email: str) -> str:
         """Generate consistent conversation ID for two users"""
         # Sort emails to ensure same conversation ID regardless of order
         emails = sorted([user1_email, user2_email])
         return f"{emails[0]}___{emails[1]}"
     
+    def _remember_client_id(self, message: Dict):
+        if message.get("client_id"):
+            key = (message["sender_email"], message["client_id"])
+            self._client_ids[key] = message
+            self._client_ids.move_to_end(key)
+            if len(self._client_ids) > CLIENT_ID_CACHE_SIZE:
+                self._client_ids.popitem(last=False)
+
+    def find_by_client_id(self, sender_email: str, client_id: Optional[str]) -> Optional[Dict]:
+        """Return the message a client already sent with this id (a retry), if any"""
+        if not client_id:
+            return None
+        # The first attempt may have been stored by another worker
+        self._refresh_messages()
+        return self._client_ids.get((sender_email, client_id))
+
     def send_message(self, sender_email: str, sender_name: str, 
                     receiver_email: str, receiver_name: str, 
-                    message: str) -> Dict:
+                    message: str, client_id: Optional[str] = None) -> Dict:
         """
         Send a message from sender to receiver
         Returns the created message object
+        client_id is the sender's own id for the message, used to de-duplicate retries.
         """
+        with file_lock(self.lock_file):
+            new_message = self._append_message(sender_email, sender_name, receiver_email,
+                                               receiver_name, message, client_id)
+        
+        print(f"[CHAT] Message sent: {sender_name} → {receiver_name}")
+        return new_message
+    
+    def _append_message(self, sender_email: str, sender_name: str,
+                        receiver_email: str, receiver_name: str,
+                        message: str, client_id: Optional[str]) -> Dict:
+        """send_message's work, done under the chat lock"""
         messages = self._load_messages()
-        conversations = self._load_conversations()
+        self._absorb_messages(messages)
+        self._refresh_conversations()
+        conversations = self.conversations
         
-        conversation_id = self._get_conversation_id(sender_email, receiver_email)
+        conversation_id = self.get_conversation_id(sender_email, receiver_email)
         
         # Create message object
+        seq = self.sequence.next()
         new_message = {
-            "message_id": f"MSG-{len(messages) + 1:06d}",
+            "message_id": f"MSG-{seq:06d}",
+            "seq": seq,
             "conversation_id": conversation_id,
             "sender_email": sender_email,
             "sender_name": sender_name,
@@ -86,10 +331,17 @@ class ChatManager:
             "timestamp": datetime.now().isoformat(),
             "read": False
         }
+        if client_id:
+            new_message["client_id"] = client_id
         
         # Add message
         messages.append(new_message)
         self._save_messages(messages)
+        self._messages_stamp = self._file_stamp(self.messages_file)
+        self._absorbed_seq = seq
+        self._remember_client_id(new_message)
+        self.search_index.add(seq, new_message)
+        self._conversation_last_seq[conversation_id] = seq
         
         # Update conversations index
         if conversation_id not in conversations:
@@ -100,130 +352,164 @@ class ChatManager:
                 ],
                 "last_message": message[:50],
                 "last_message_time": new_message["timestamp"],
+                "last_seq": seq,
                 "unread_count": {sender_email: 0, receiver_email: 1}
             }
         else:
+            self._unindex_conversation(conversation_id, conversations[conversation_id])
             conversations[conversation_id]["last_message"] = message[:50]
             conversations[conversation_id]["last_message_time"] = new_message["timestamp"]
+            conversations[conversation_id]["last_seq"] = seq
             # Increment unread count for receiver
             conversations[conversation_id]["unread_count"][receiver_email] = \
                 conversations[conversation_id]["unread_count"].get(receiver_email, 0) + 1
+        self._index_conversation(conversation_id, conversations[conversation_id])
+        self._unread_totals[receiver_email] += 1
         
-        self._save_conversations(conversations)
-        
-        print(f"[CHAT] Message sent: {sender_name} → {receiver_name}")
+        self._commit_conversations()
         return new_message
     
+    def get_undelivered_messages(self, user_email: str, limit: int = SYNC_MAX_MESSAGES) -> Dict:
+        """
+        The oldest `limit` messages received since the user's delivery cursor,
+        across all conversations, in seq order; has_more is set when there are more
+        Messages are stored in seq order, so the scan starts at the cursor by bisection.
+        """
+        messages = self._load_messages()
+        cursor = self.delivery_cursors.get(user_email, 0)
+        low, high = 0, len(messages)
+        while low < high:
+            middle = (low + high) // 2
+            if messages[middle]["seq"] <= cursor:
+                low = middle + 1
+            else:
+                high = middle
+        
+        pending = []
+        has_more = False
+        for msg in messages[low:]:
+            if msg.get("receiver_email") == user_email:
+                if len(pending) == limit:
+                    has_more = True
+                    break
+                pending.append(self._with_read_flag(msg))
+        
+        return {
+            "messages": pending,
+            "cursor": cursor,
+            "latest_seq": self.sequence.last_allocated,
+            "has_more": has_more
+        }
+    
+    def advance_delivery_cursor(self, user_email: str, seq: int) -> int:
+        """Record that the user's client holds everything up to seq; cursors never move back"""
+        current = self.delivery_cursors.get(user_email, 0)
+        if seq > current:
+            self.delivery_cursors[user_email] = seq
+            self._save_cursors()
+            return seq
+        return current
+    
     def get_conversation_history(self, user1_email: str, user2_email: str, 
-                                 limit: int = 100) -> List[Dict]:
+                                 limit: int = 100, before_seq: Optional[int] = None) -> List[Dict]:
         """
         Get chat history between two users
-        Returns list of messages sorted by timestamp
+        Returns up to `limit` messages older than before_seq (newest page when None),
+        oldest first; pass the first returned seq as before_seq for the previous page
         """
         messages = self._load_messages()
-        conversation_id = self._get_conversation_id(user1_email, user2_email)
+        conversation_id = self.get_conversation_id(user1_email, user2_email)
         
-        # Filter messages for this conversation
-        conversation_messages = [
-            msg for msg in messages 
-            if msg.get("conversation_id") == conversation_id
-        ]
+        # Messages are stored in seq order, so walk back from the newest
+        conversation_messages = []
+        for msg in reversed(messages):
+            if before_seq is not None and msg["seq"] >= before_seq:
+                continue
+            if msg.get("conversation_id") == conversation_id:
+                conversation_messages.append(self._with_read_flag(msg))
+                if len(conversation_messages) == limit:
+                    break
         
-        # Sort by timestamp (newest first) and limit
-        conversation_messages.sort(key=lambda x: x["timestamp"], reverse=True)
-        return conversation_messages[:limit][::-1]  # Reverse to show oldest first
+        return conversation_messages[::-1]  # Reverse to show oldest first
     
     def get_user_conversations(self, user_email: str) -> List[Dict]:
         """
         Get all conversations for a user
-        Returns list of conversations with last message
+        Returns list of conversations with last message, newest first
         """
-        conversations = self._load_conversations()
-        
+        self._refresh_conversations()
         user_conversations = []
-        for conv_id, conv_data in conversations.items():
-            # Check if user is part of this conversation
-            participant_emails = [p["email"] for p in conv_data["participants"]]
-            if user_email in participant_emails:
-                # Find the other participant
-                other_participant = next(
-                    p for p in conv_data["participants"] 
-                    if p["email"] != user_email
-                )
-                
-                user_conversations.append({
-                    "conversation_id": conv_id,
-                    "other_user": other_participant,
-                    "last_message": conv_data["last_message"],
-                    "last_message_time": conv_data["last_message_time"],
-                    "unread_count": conv_data["unread_count"].get(user_email, 0)
-                })
+        for _, conv_id in reversed(self._user_conversations.get(user_email, ())):
+            conv_data = self.conversations[conv_id]
+            # Find the other participant
+            other_participant = next(
+                p for p in conv_data["participants"] 
+                if p["email"] != user_email
+            )
+            
+            user_conversations.append({
+                "conversation_id": conv_id,
+                "other_user": dict(other_participant),
+                "last_message": conv_data["last_message"],
+                "last_message_time": conv_data["last_message_time"],
+                "unread_count": conv_data["unread_count"].get(user_email, 0)
+            })
         
-        # Sort by last message time (newest first)
-        user_conversations.sort(key=lambda x: x["last_message_time"], reverse=True)
         return user_conversations
     
-    def mark_as_read(self, user_email: str, conversation_id: str):
-        """Mark all messages in a conversation as read for a user"""
-        messages = self._load_messages()
-        conversations = self._load_conversations()
-        
-        # Mark messages as read
-        updated = False
-        for msg in messages:
-            if (msg.get("conversation_id") == conversation_id and 
-                msg.get("receiver_email") == user_email and 
-                not msg.get("read")):
-                msg["read"] = True
-                updated = True
-        
-        if updated:
-            self._save_messages(messages)
+    def mark_as_read(self, user_email: str, conversation_id: str) -> Optional[int]:
+        """
+        Mark everything in a conversation as read for a user
+        Only the user's high-water mark moves; nothing is written until
+        flush_read_state runs. Returns the new mark, or None if it didn't move.
+        """
+        # The newest message may have been stored by another worker
+        self._refresh_conversations()
+        conv_data = self.conversations.get(conversation_id, {})
+        last_seq = max(conv_data.get("last_seq", 0), self._conversation_last_seq.get(conversation_id, 0))
+        marks = self.read_marks.setdefault(user_email, {})
+        if marks.get(conversation_id, 0) >= last_seq:
+            return None
+        marks[conversation_id] = last_seq
         
         # Reset unread count
-        if conversation_id in conversations:
-            conversations[conversation_id]["unread_count"][user_email] = 0
-            self._save_conversations(conversations)
+        if conversation_id in self.conversations:
+            unread = self.conversations[conversation_id]["unread_count"]
+            cleared = unread.get(user_email, 0)
+            self._unread_totals[user_email] -= cleared
+            unread[user_email] = 0
+            key = (conversation_id, user_email)
+            self._unsaved_reads[key] = self._unsaved_reads.get(key, 0) + cleared
+        self._read_state_dirty = True
+        return last_seq
     
     def get_unread_count(self, user_email: str) -> int:
         """Get total unread message count for a user"""
-        conversations = self._load_conversations()
-        total_unread = 0
-        
-        for conv_data in conversations.values():
-            total_unread += conv_data.get("unread_count", {}).get(user_email, 0)
-        
-        return total_unread
+        self._refresh_conversations()
+        return self._unread_totals.get(user_email, 0)
     
-    def search_messages(self, user_email: str, search_query: str) -> List[Dict]:
-        """Search messages for a user"""
-        messages = self._load_messages()
-        
-        # Get all conversations involving this user
-        user_messages = [
-            msg for msg in messages
-            if msg.get("sender_email") == user_email or 
-               msg.get("receiver_email") == user_email
-        ]
-        
-        # Filter by search query
-        search_query = search_query.lower()
-        results = [
-            msg for msg in user_messages
-            if search_query in msg.get("message", "").lower() or
-               search_query in msg.get("sender_name", "").lower() or
-               search_query in msg.get("receiver_name", "").lower()
-        ]
-        
-        results.sort(key=lambda x: x["timestamp"], reverse=True)
-        return results
+    def search_messages(self, user_email: str, search_query: str,
+                        offset: int = 0, limit: int = DEFAULT_PAGE_SIZE) -> Dict:
+        """
+        Ranked full-text search over a user's messages (text and participant names)
+        Use "quoted phrases" for exact matches; returns one page of results.
+        """
+        self._refresh_messages()
+        return self.search_index.search(user_email, search_query, offset, limit)
     
     def delete_conversation(self, user1_email: str, user2_email: str) -> bool:
         """Delete entire conversation between two users"""
+        with file_lock(self.lock_file):
+            return self._remove_conversation(user1_email, user2_email)
+    
+    def _remove_conversation(self, user1_email: str, user2_email: str) -> bool:
+        """delete_conversation's work, done under the chat lock"""
         messages = self._load_messages()
-        conversations = self._load_conversations()
+        self._absorb_messages(messages)
+        self._refresh_conversations()
+        conversations = self.conversations
         
-        conversation_id = self._get_conversation_id(user1_email, user2_email)
+        conversation_id = self.get_conversation_id(user1_email, user2_email)
         
         # Remove messages
         messages = [
@@ -231,11 +517,21 @@ class ChatManager:
             if msg.get("conversation_id") != conversation_id
         ]
         self._save_messages(messages)
+        self._messages_stamp = self._file_stamp(self.messages_file)
+        
+        self.search_index.remove_conversation(conversation_id)
+        self._conversation_last_seq.pop(conversation_id, None)
+        for marks in self.read_marks.values():
+            if marks.pop(conversation_id, None) is not None:
+                self._read_state_dirty = True
         
         # Remove conversation
         if conversation_id in conversations:
-            del conversations[conversation_id]
-            self._save_conversations(conversations)
+            conv_data = conversations.pop(conversation_id)
+            self._unindex_conversation(conversation_id, conv_data)
+            for email, count in conv_data.get("unread_count", {}).items():
+                self._unread_totals[email] -= count
+            self._commit_conversations()
             return True
         
         return False
@@ -0,0 +1,206 @@
+"""
+Full-Text Chat Search for AgriChain
+Per-user inverted index over message text and participant names, with
+BM25 ranking, quoted phrase queries and pagination (English + Hindi)
+"""
+
+import math
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+# Latin letters/digits and the Devanagari block (vowel signs and virama included,
+# so "टमाटर" stays one token); zero-width joiners are dropped before matching
+TOKEN_PATTERN = re.compile(r"[a-z0-9\u0900-\u097f]+")
+ZERO_WIDTH = dict.fromkeys(map(ord, "\u200c\u200d"))
+# Name tokens are placed past the text so phrases never span the two fields
+NAME_POSITION_OFFSET = 100000
+NAME_WEIGHT = 0.5
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, normalize and split text into searchable tokens"""
+    text = unicodedata.normalize("NFC", text or "").lower().translate(ZERO_WIDTH)
+    return TOKEN_PATTERN.findall(text)
+
+
+def parse_query(query: str) -> Tuple[List[str], List[List[str]]]:
+    """Split a query into bare terms and "quoted phrases" """
+    phrases = [tokenize(phrase) for phrase in re.findall(r'"([^"]*)"', query)]
+    terms = tokenize(re.sub(r'"[^"]*"', " ", query))
+    return terms, [phrase for phrase in phrases if phrase]
+
+
+class UserIndex:
+    """Postings for the messages one user can see"""
+
+    def __init__(self):
+        # token -> {seq: [positions]}
+        self.postings: Dict[str, Dict[int, List[int]]] = defaultdict(dict)
+        self.doc_lengths: Dict[int, int] = {}
+        self.total_length = 0
+
+    def add(self, seq: int, positions: Dict[str, List[int]], length: int):
+        postings = self.postings
+        for token, token_positions in positions.items():
+            postings[token][seq] = token_positions
+        self.doc_lengths[seq] = length
+        self.total_length += length
+
+    def remove(self, seq: int, tokens: Iterable[str]):
+        for token in set(tokens):
+            docs = self.postings.get(token)
+            if docs is not None:
+                docs.pop(seq, None)
+                if not docs:
+                    del self.postings[token]
+        self.total_length -= self.doc_lengths.pop(seq, 0)
+
+
+class ChatSearchIndex:
+    """Inverted index kept per user, so a search only touches that user's messages"""
+
+    def __init__(self):
+        self.users: Dict[str, UserIndex] = defaultdict(UserIndex)
+        self.messages: Dict[int, Dict] = {}
+        self.conversation_docs: Dict[str, set] = defaultdict(set)
+
+    def build(self, messages: Iterable[Tuple[int, Dict]]):
+        """Index stored (seq, message) pairs from scratch"""
+        self.users.clear()
+        self.messages.clear()
+        self.conversation_docs.clear()
+        for seq, message in messages:
+            self.add(seq, message)
+
+    @staticmethod
+    def _tokens(message: Dict) -> Tuple[List[str], List[str]]:
+        names = f"{message.get('sender_name', '')} {message.get('receiver_name', '')}"
+        return tokenize(message.get("message", "")), tokenize(names)
+
+    def add(self, seq: int, message: Dict):
+        text_tokens, name_tokens = self._tokens(message)
+        # Position lists are built once and shared (read-only) by both participants
+        positions: Dict[str, List[int]] = {}
+        for position, token in enumerate(text_tokens):
+            positions.setdefault(token, []).append(position)
+        for position, token in enumerate(name_tokens, NAME_POSITION_OFFSET):
+            positions.setdefault(token, []).append(position)
+
+        self.messages[seq] = message
+        self.conversation_docs[message.get("conversation_id")].add(seq)
+        for user_email in {message.get("sender_email"), message.get("receiver_email")}:
+            self.users[user_email].add(seq, positions, len(text_tokens))
+
+    def remove_conversation(self, conversation_id: str):
+        for seq in self.conversation_docs.pop(conversation_id, set()):
+            message = self.messages.pop(seq)
+            text_tokens, name_tokens = self._tokens(message)
+            for user_email in {message.get("sender_email"), message.get("receiver_email")}:
+                index = self.users.get(user_email)
+                if index is not None:
+                    index.remove(seq, text_tokens + name_tokens)
+
+    @staticmethod
+    def _phrase_matches(index: UserIndex, seq: int, phrase: List[str]) -> int:
+        """Number of times the phrase occurs in a message"""
+        starts = set(index.postings[phrase[0]][seq])
+        for offset, token in enumerate(phrase[1:], 1):
+            starts &= {position - offset for position in index.postings[token][seq]}
+            if not starts:
+                return 0
+        return len(starts)
+
+    def search(self, user_email: str, query: str, offset: int = 0,
+               limit: int = DEFAULT_PAGE_SIZE) -> Dict:
+        """
+        Ranked search; every term and phrase must match
+        Returns {"total", "offset", "limit", "results"} with the best matches first.
+        """
+        limit = max(1, min(MAX_PAGE_SIZE, limit))
+        offset = max(0, offset)
+        terms, phrases = parse_query(query)
+        index = self.users.get(user_email)
+        required = set(terms) | {token for phrase in phrases for token in phrase}
+        if index is None or not required or any(token not in index.postings for token in required):
+            return {"total": 0, "offset": offset, "limit": limit, "results": []}
+
+        # Intersect starting from the rarest token
+        ordered = sorted(required, key=lambda token: len(index.postings[token]))
+        candidates = set(index.postings[ordered[0]])
+        for token in ordered[1:]:
+            candidates.intersection_update(index.postings[token])
+            if not candidates:
+                break
+
+        documents = len(index.doc_lengths)
+        average_length = index.total_length / documents if documents else 1.0
+        scored = []
+        for seq in candidates:
+            phrase_hits = [self._phrase_matches(index, seq, phrase) for phrase in phrases]
+            if not all(phrase_hits):
+                continue
+
+            length_norm = 1 - B + B * index.doc_lengths[seq] / (average_length or 1.0)
+            score = 0.0
+            for token in required:
+                positions = index.postings[token][seq]
+                text_hits = sum(1 for position in positions if position < NAME_POSITION_OFFSET)
+                tf = text_hits + NAME_WEIGHT * (len(positions) - text_hits)
+                df = len(index.postings[token])
+                idf = math.log(1 + (documents - df + 0.5) / (df + 0.5))
+                score += idf * tf * (K1 + 1) / (tf + K1 * length_norm)
+            score += sum(phrase_hits)  # Exact phrase occurrences outrank scattered terms
+            scored.append((score, seq))
+
+        # Best score first, newest message first among equals
+        scored.sort(key=lambda item: (-item[0], -item[1]))
+        page = scored[offset:offset + limit]
+        return {
+            "total": len(scored),
+            "offset": offset,
+            "limit": limit,
+            "results": [dict(self.messages[seq], seq=seq, score=round(score, 3)) for score, seq in page]
+        }
+
+
+if __name__ == "__main__":
+    # Benchmark index build and query latency on synthetic bilingual chat
+    import random
+    import time
+
+    print("Testing chat search index...")
+    rng = random.Random(3)
+    words = ("fresh tomatoes onions wheat rice price per kg delivery tomorrow organic "
+             "mandi quality sample payment टमाटर प्याज गेहूं चावल ताज़ा कीमत किलो कल डिलीवरी").split()
+    users = [f"user{i}@test.com" for i in range(200)]
+
+    index = ChatSearchIndex()
+    started = time.perf_counter()
+    for seq in range(1, 200_001):
+        sender, receiver = rng.sample(users, 2)
+        index.add(seq, {
+            "message_id": f"MSG-{seq:06d}",
+            "conversation_id": "___".join(sorted((sender, receiver))),
+            "sender_email": sender, "sender_name": sender.split("@")[0].title(),
+            "receiver_email": receiver, "receiver_name": receiver.split("@")[0].title(),
+            "message": " ".join(rng.choices(words, k=rng.randint(3, 15)))
+        })
+    print(f"  Indexed 200,000 messages in {time.perf_counter() - started:.2f}s")
+
+    for query in ("tomatoes", "fresh tomatoes price", '"per kg"', "टमाटर कीमत", '"ताज़ा टमाटर"'):
+        started = time.perf_counter()
+        result = index.search("user7@test.com", query, limit=5)
+        elapsed = (time.perf_counter() - started) * 1000
+        top = result["results"][0]["message"] if result["results"] else "-"
+        print(f"  {query!r:24} {result['total']:5} hits in {elapsed:6.2f} ms  top: {top}")
+
+    print("\n[OK] Chat search working correctly!")
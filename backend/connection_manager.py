@@ -0,0 +1,389 @@
+"""
+WebSocket Connection Manager for AgriChain Chat
+Tracks every open socket per user (phone, laptop, ...) and fans messages
+out to all of them through per-socket bounded send queues; a chat broker
+carries messages and presence to sockets held by other workers.
+Idle sockets are pinged and silent ones reaped, so presence has no ghosts.
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from chat_broker import ChatBroker, LocalBroker
+
+# Outbound messages buffered per socket before the client counts as a slow consumer
+SEND_QUEUE_SIZE = 256
+# Message types that may be merged or dropped under pressure instead of queued
+LOW_PRIORITY_TYPES = {"typing"}
+# Close code sent to clients that can't keep up (1013 = try again later)
+SLOW_CONSUMER_CLOSE_CODE = 1013
+# Server pings a socket after this many idle seconds and drops it after HEARTBEAT_TIMEOUT
+HEARTBEAT_INTERVAL = float(os.getenv("CHAT_HEARTBEAT_INTERVAL", "25"))
+HEARTBEAT_TIMEOUT = float(os.getenv("CHAT_HEARTBEAT_TIMEOUT", "60"))
+# Close code for sockets that stopped answering (1001 = going away)
+STALE_CLOSE_CODE = 1001
+
+
+class PresenceStore:
+    """Last-seen timestamps per user, saved to data/presence.json in batches"""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else None
+        self.last_seen: Dict[str, str] = {}
+        self._dirty = False
+        if self.path and self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.last_seen = json.load(f)
+            except Exception as e:
+                print(f"[ERROR] Failed to load presence: {e}")
+
+    def mark_seen(self, user_email: str):
+        self.last_seen[user_email] = datetime.now().isoformat()
+        self._dirty = True
+
+    def flush(self) -> bool:
+        if not self._dirty or not self.path:
+            return False
+        self._dirty = False
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.last_seen, f, indent=2)
+        except Exception as e:
+            print(f"[ERROR] Failed to save presence: {e}")
+        return True
+
+
+class Connection:
+    """
+    One open socket with its own bounded outbound queue drained by a writer task
+    Senders only enqueue, so a client on a slow link never blocks them.
+    """
+
+    def __init__(self, connection_id: int, user_email: str, websocket,
+                 max_queue: int = SEND_QUEUE_SIZE):
+        self.connection_id = connection_id
+        self.user_email = user_email
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.queue: deque = deque()
+        # Low-priority entries still waiting, keyed so newer ones replace older
+        self._pending: Dict[tuple, list] = {}
+        self._ready = asyncio.Event()
+        self.writer: Optional[asyncio.Task] = None
+        self.dropped = 0
+        # Monotonic time of the last frame received from the client
+        self.last_seen = time.monotonic()
+        self.pinged = False
+
+    def _coalesce_key(self, message: dict) -> Optional[tuple]:
+        message_type = message.get("type")
+        if message_type in LOW_PRIORITY_TYPES:
+            return (message_type, message.get("sender_email"))
+        return None
+
+    def enqueue(self, message: dict) -> bool:
+        """
+        Queue a message for this socket
+        Returns False if it was dropped; raises OverflowError when the client
+        has fallen too far behind on messages that must not be lost.
+        """
+        key = self._coalesce_key(message)
+        if key is not None and key in self._pending:
+            self._pending[key][0] = message  # Merge into the queued event
+            return True
+
+        if len(self.queue) >= self.max_queue:
+            if key is not None:
+                self.dropped += 1
+                return False
+            raise OverflowError(f"send queue full ({self.max_queue})")
+
+        entry = [message, key]
+        self.queue.append(entry)
+        if key is not None:
+            self._pending[key] = entry
+        self._ready.set()
+        return True
+
+    async def run_writer(self):
+        """Drain the queue onto the socket until it fails or is cancelled"""
+        while True:
+            while not self.queue:
+                self._ready.clear()
+                await self._ready.wait()
+            message, key = self.queue.popleft()
+            if key is not None:
+                self._pending.pop(key, None)
+            await self.websocket.send_json(message)
+
+
+class ConnectionManager:
+    def __init__(self, max_queue: int = SEND_QUEUE_SIZE, presence: Optional[PresenceStore] = None,
+                 heartbeat_interval: float = HEARTBEAT_INTERVAL,
+                 heartbeat_timeout: float = HEARTBEAT_TIMEOUT):
+        # Store active connections: {user_email: {connection_id: Connection}}
+        self.active_connections: Dict[str, Dict[int, Connection]] = {}
+        self._connection_ids = itertools.count(1)
+        self.max_queue = max_queue
+        self.broker: ChatBroker = LocalBroker()
+        self.presence = presence or PresenceStore()
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = max(heartbeat_timeout, heartbeat_interval)
+        # One (due, connection_id, user_email) entry per socket; touch() only updates
+        # last_seen and the entry re-checks it when it comes due
+        self._deadlines: List[tuple] = []
+        self._deadline_added: Optional[asyncio.Event] = None
+        self._reaper: Optional[asyncio.Task] = None
+
+    def start_reaper(self):
+        """Start the heartbeat/reaper task (needs a running event loop)"""
+        if self._reaper is None or self._reaper.done():
+            self._deadline_added = asyncio.Event()
+            self._reaper = asyncio.create_task(self._run_reaper())
+
+    async def _run_reaper(self):
+        while True:
+            if not self._deadlines:
+                self._deadline_added.clear()
+                await self._deadline_added.wait()
+                continue
+            delay = self._deadlines[0][0] - time.monotonic()
+            if delay > 0:
+                self._deadline_added.clear()
+                try:
+                    await asyncio.wait_for(self._deadline_added.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, connection_id, user_email = heapq.heappop(self._deadlines)
+            connection = self.active_connections.get(user_email, {}).get(connection_id)
+            if connection is not None:
+                self._check_heartbeat(connection)
+
+    def _schedule(self, connection: Connection, due: float):
+        if self._deadline_added and (not self._deadlines or due < self._deadlines[0][0]):
+            self._deadline_added.set()  # Wake the reaper for an earlier deadline
+        heapq.heappush(self._deadlines, (due, connection.connection_id, connection.user_email))
+
+    def _check_heartbeat(self, connection: Connection):
+        idle = time.monotonic() - connection.last_seen
+        if idle >= self.heartbeat_timeout:
+            print(f"[CHAT] Reaping stale connection {connection.user_email} "
+                  f"({connection.connection_id}), silent for {idle:.0f}s")
+            self._close(connection, STALE_CLOSE_CODE)
+        elif idle >= self.heartbeat_interval:
+            if not connection.pinged:
+                connection.pinged = True
+                self.send_to_connection(connection.user_email, connection.connection_id, {"type": "ping"})
+            self._schedule(connection, connection.last_seen + self.heartbeat_timeout)
+        else:
+            self._schedule(connection, connection.last_seen + self.heartbeat_interval)
+
+    def touch(self, user_email: str, connection_id: int):
+        """Record that a frame arrived on this socket"""
+        connection = self.active_connections.get(user_email, {}).get(connection_id)
+        if connection is not None:
+            connection.last_seen = time.monotonic()
+            connection.pinged = False
+
+    async def attach_broker(self, broker: ChatBroker):
+        """Start routing chat across workers through the given broker"""
+        self.broker = broker
+        await broker.start(self.deliver_local, self.get_local_users)
+        print(f"[CHAT] Using {type(broker).__name__} (worker {broker.worker_id})")
+
+    async def connect(self, websocket, user_email: str, accept: bool = True) -> int:
+        """Accept a socket (unless the caller already has), register it as one more session and start its writer"""
+        if accept:
+            await websocket.accept()
+        connection = Connection(next(self._connection_ids), user_email, websocket, self.max_queue)
+        if user_email not in self.active_connections:
+            self.broker.presence_changed(user_email, True)
+        self.active_connections.setdefault(user_email, {})[connection.connection_id] = connection
+        connection.writer = asyncio.create_task(self._write(connection))
+        self._schedule(connection, connection.last_seen + self.heartbeat_interval)
+        self.presence.mark_seen(user_email)
+        print(f"[CHAT] User connected: {user_email} "
+              f"(devices: {len(self.active_connections[user_email])}, users: {len(self.active_connections)})")
+        return connection.connection_id
+
+    async def _write(self, connection: Connection):
+        try:
+            await connection.run_writer()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[ERROR] Failed to send message to {connection.user_email} "
+                  f"({connection.connection_id}): {e}")
+            self.disconnect(connection.user_email, connection.connection_id)
+
+    def disconnect(self, user_email: str, connection_id: int):
+        """Remove one session; the user stays online while other sessions remain"""
+        sessions = self.active_connections.get(user_email)
+        if sessions and connection_id in sessions:
+            connection = sessions.pop(connection_id)
+            if connection.writer and connection.writer is not asyncio.current_task():
+                connection.writer.cancel()
+            if not sessions:
+                del self.active_connections[user_email]
+                self.broker.presence_changed(user_email, False)
+                self.presence.mark_seen(user_email)
+            print(f"[CHAT] User disconnected: {user_email} (users: {len(self.active_connections)})")
+
+    def _close(self, connection: Connection, code: int):
+        """Forget a socket and close it in the background"""
+        self.disconnect(connection.user_email, connection.connection_id)
+
+        async def close():
+            try:
+                await connection.websocket.close(code=code)
+            except Exception:
+                pass  # Already gone
+
+        asyncio.create_task(close())
+
+    def _drop_slow_consumer(self, connection: Connection):
+        print(f"[CHAT] Disconnecting slow consumer {connection.user_email} ({connection.connection_id})")
+        self._close(connection, SLOW_CONSUMER_CLOSE_CODE)
+
+    def send_to_connection(self, user_email: str, connection_id: int, message: dict) -> bool:
+        """Queue a message for one specific session (e.g. a pong)"""
+        connection = self.active_connections.get(user_email, {}).get(connection_id)
+        if not connection:
+            return False
+        try:
+            return connection.enqueue(message)
+        except OverflowError:
+            self._drop_slow_consumer(connection)
+            return False
+
+    async def send_personal_message(self, message: dict, receiver_email: str) -> bool:
+        """
+        Queue message for every open session of a user, on this worker and any
+        other; True if any device accepted it (or another worker holds one)
+        Returns immediately - delivery happens on each connection's writer task.
+        """
+        remote = self.broker.is_online(receiver_email)
+        if remote:
+            self.broker.publish(receiver_email, message)
+
+        delivered = await self.deliver_local(message=message, receiver_email=receiver_email)
+        if not delivered and not remote:
+            print(f"[CHAT] User offline: {receiver_email}")
+        return delivered or remote
+
+    async def deliver_local(self, receiver_email: str, message: dict) -> bool:
+        """Queue message for the user's sessions held by this worker only"""
+        sessions = self.active_connections.get(receiver_email)
+        if not sessions:
+            return False
+
+        delivered = False
+        for connection_id in list(sessions):
+            delivered = self.send_to_connection(receiver_email, connection_id, message) or delivered
+        return delivered
+
+    def is_user_online(self, user_email: str) -> bool:
+        """Check if user is currently online on any worker"""
+        return user_email in self.active_connections or self.broker.is_online(user_email)
+
+    def get_presence(self, user_emails: List[str]) -> Dict[str, Dict]:
+        """Online flag and last-seen time for each user"""
+        now = datetime.now().isoformat()
+        return {
+            email: {
+                "is_online": self.is_user_online(email),
+                "last_seen": now if self.is_user_online(email) else self.presence.last_seen.get(email)
+            }
+            for email in user_emails
+        }
+
+    def get_local_users(self) -> List[str]:
+        """Users with at least one socket on this worker"""
+        return list(self.active_connections.keys())
+
+    def get_online_users(self) -> List[str]:
+        """Get list of all online users across workers"""
+        return list(set(self.active_connections) | self.broker.online_users())
+
+
+# Singleton instance
+manager = ConnectionManager(presence=PresenceStore(Path("data") / "presence.json"))
+
+
+if __name__ == "__main__":
+    # Benchmark fan-out latency with 10k connected users, plus slow clients
+    import builtins
+    import random
+
+    class FakeWebSocket:
+        """Stands in for a real socket; delay simulates a slow link"""
+
+        def __init__(self, fail: bool = False, delay: float = 0.0):
+            self.fail = fail
+            self.delay = delay
+            self.received = 0
+
+        async def accept(self):
+            pass
+
+        async def close(self, code: int = 1000):
+            pass
+
+        async def send_json(self, message: dict):
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise ConnectionResetError("socket closed")
+            self.received += 1
+
+    async def benchmark(users: int = 10_000):
+        builtins_print = builtins.print
+        builtins.print = lambda *args, **kwargs: None  # Silence per-connection logs
+        try:
+            bench = ConnectionManager(max_queue=64)
+            rng = random.Random(42)
+            sockets = []
+            for index in range(users):
+                for device in range(rng.choice((1, 1, 2, 3))):
+                    # 1% dead sockets, 1% clients on a 2G-like link
+                    socket = FakeWebSocket(fail=rng.random() < 0.01,
+                                           delay=0.2 if rng.random() < 0.01 else 0.0)
+                    sockets.append(socket)
+                    await bench.connect(socket, f"user{index}@test.com")
+
+            latencies = []
+            started = time.perf_counter()
+            for burst in range(10):
+                for index in range(users):
+                    t0 = time.perf_counter()
+                    await bench.send_personal_message({"type": "new_message", "n": burst},
+                                                      f"user{index}@test.com")
+                    latencies.append((time.perf_counter() - t0) * 1_000_000)
+                await asyncio.sleep(0)
+            elapsed = time.perf_counter() - started
+            await asyncio.sleep(0.5)  # Let writers drain
+
+            remaining = sum(len(s) for s in bench.active_connections.values())
+            delivered = sum(socket.received for socket in sockets)
+        finally:
+            builtins.print = builtins_print
+
+        latencies.sort()
+        print(f"  Users: {users}, sockets: {len(sockets)}, still connected: {remaining}")
+        print(f"  Sender side: {len(latencies) / elapsed:,.0f} messages/s, "
+              f"p50 {latencies[len(latencies) // 2]:.1f} us, p99 {latencies[int(len(latencies) * 0.99)]:.1f} us")
+        print(f"  Socket sends completed: {delivered:,}")
+
+    print("Benchmarking ConnectionManager fan-out...")
+    asyncio.run(benchmark())
+    print("\n[OK] ConnectionManager benchmark complete!")
@@ -4,30 +4,279 @@ Handles delivery partner assignment, tracking, and notifications
 """
 
 import json
-import random
-from datetime import datetime, timedelta
+import os
+import threading
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
 import uuid
 
+from sortedcontainers import SortedList
+
+from eta import FINISHED_STATUSES, EtaModel
+from file_lock import file_lock
+from geo import GridIndex, Point, geocode
+from tracking_codec import TrackingLog, pack_tracking, unpack_tracking
+
+# Partners considered for each pickup, closest first
+NEAREST_CANDIDATES = 5
+# Partners this much farther than the closest one still compete on rating
+RATING_TIE_KM = 1.0
+
+
+def job_id(delivery: Dict) -> str:
+    """What a partner is reserved for: the whole route, or the single delivery"""
+    return delivery.get("route_id") or delivery["delivery_id"]
+
+
+class DeliveryFinishedError(ValueError):
+    """Status change for a delivery that is already delivered, cancelled or failed"""
+
+
+class PartnerPool:
+    """
+    In-memory availability of every partner, reserved and released atomically
+    The spatial index of available partners lives here too, so the search for a
+    partner and the reservation that follows it happen under one lock. The pool
+    is this worker's view of the files: DeliveryManager rebuilds it whenever
+    another worker has written them, and only reserves under the file lock.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.status: Dict[str, str] = {}
+        self.ratings: Dict[str, float] = {}
+        self.points: Dict[str, Point] = {}
+        # partner_id -> the job (route id, or delivery id off-route) they are out on
+        self.jobs: Dict[str, str] = {}
+        self.index = GridIndex()
+    
+    def load(self, partners: Iterable[Dict], deliveries: Iterable[Dict] = ()):
+        with self._lock:
+            for delivery in deliveries:
+                if delivery["status"] not in FINISHED_STATUSES:
+                    self.jobs[delivery["partner_id"]] = job_id(delivery)
+            for partner in partners:
+                partner_id = partner["partner_id"]
+                status = partner["status"]
+                if status == "on_delivery" and partner_id not in self.jobs:
+                    # Left busy by a delivery that ended without freeing them
+                    print(f"[DELIVERY] Partner {partner_id} has no open delivery; available again")
+                    status = "available"
+                self.status[partner_id] = status
+                self.ratings[partner_id] = partner["rating"]
+                point = geocode(partner.get("current_location"))
+                if point:
+                    self.points[partner_id] = point
+                self._reindex(partner_id)
+    
+    def _reindex(self, partner_id: str):
+        point = self.points.get(partner_id)
+        if self.status.get(partner_id) == "available" and point:
+            self.index.insert(partner_id, point, self.ratings[partner_id])
+        else:
+            self.index.remove(partner_id)
+    
+    def is_available(self, partner_id: str) -> bool:
+        return self.status.get(partner_id) == "available"
+    
+    def reserve(self, partner_id: str) -> bool:
+        """Compare-and-set available -> on_delivery; False if someone else got there first"""
+        with self._lock:
+            if self.status.get(partner_id) != "available":
+                return False
+            self.status[partner_id] = "on_delivery"
+            self.index.remove(partner_id)
+            return True
+    
+    def reserve_nearest(self, point: Optional[Point]) -> Optional[Tuple[str, Optional[float]]]:
+        """
+        Reserve the closest available partner to a point; among those within
+        RATING_TIE_KM of the closest, the best rated wins. Without a point (or
+        nobody on the map) the best rated available partner is taken.
+        Returns (partner_id, distance_km), or None when nobody is available.
+        """
+        with self._lock:
+            nearest = self.index.nearest(point, k=NEAREST_CANDIDATES) if point else []
+            if nearest:
+                closest = nearest[0][0]
+                distance, partner_id, _ = max(
+                    (item for item in nearest if item[0] <= closest + RATING_TIE_KM),
+                    key=lambda item: (item[2], -item[0])
+                )
+            else:
+                available = [pid for pid, status in self.status.items() if status == "available"]
+                if not available:
+                    return None
+                partner_id, distance = max(available, key=lambda pid: self.ratings[pid]), None
+            self.status[partner_id] = "on_delivery"
+            self.index.remove(partner_id)
+            return partner_id, distance
+    
+    def claim(self, partner_id: str, job: str):
+        """Record which job a reserved partner was sent out on"""
+        with self._lock:
+            self.jobs[partner_id] = job
+    
+    def holds(self, partner_id: str, job: str) -> bool:
+        return self.jobs.get(partner_id) == job
+    
+    def release(self, partner_id: str, location: Optional[str] = None,
+                job: Optional[str] = None) -> bool:
+        """
+        Make a partner available again (optionally somewhere new). With a job,
+        only if that is still what the partner is out on; False otherwise.
+        """
+        with self._lock:
+            if job is not None and self.jobs.get(partner_id) != job:
+                return False
+            self.jobs.pop(partner_id, None)
+            self.status[partner_id] = "available"
+            point = geocode(location) if location else None
+            if point:
+                self.points[partner_id] = point
+            self._reindex(partner_id)
+            return True
+    
+    def move(self, partner_id: str, point: Point):
+        """New position for a partner; availability is left as it is"""
+        with self._lock:
+            self.points[partner_id] = point
+            self._reindex(partner_id)
+
+
+class DeliveryIndex:
+    """
+    In-memory lookups over deliveries: by id and order id, per partner and
+    overall in assigned_at order, per status, and per-partner counters.
+    put() is called with every delivery this worker creates or changes;
+    DeliveryManager builds a new index when another worker has written the
+    deliveries file, so reads only stat it.
+    """
+    
+    def __init__(self, deliveries: Iterable[Dict] = ()):
+        self._lock = threading.Lock()
+        self.by_id: Dict[str, Dict] = {}
+        self.by_order: Dict[str, str] = {}
+        # (assigned_at, delivery_id), oldest first
+        self.by_partner: Dict[str, SortedList] = {}
+        self.by_time = SortedList()
+        self.by_status: Dict[str, Set[str]] = {}
+        # partner_id -> {"total", "completed", "active"}
+        self.counters: Dict[str, Dict[str, int]] = {}
+        for delivery in deliveries:
+            self.put(delivery)
+    
+    def _count(self, delivery: Dict, step: int):
+        counts = self.counters.setdefault(delivery["partner_id"], {"total": 0, "completed": 0, "active": 0})
+        counts["total"] += step
+        if delivery["status"] == "delivered":
+            counts["completed"] += step
+        elif delivery["status"] not in FINISHED_STATUSES:
+            counts["active"] += step
+    
+    def put(self, delivery: Dict):
+        """Add a delivery, or replace its previous version and move it between statuses"""
+        delivery_id = delivery["delivery_id"]
+        with self._lock:
+            previous = self.by_id.get(delivery_id)
+            if previous is None:
+                key = (delivery.get("assigned_at", ""), delivery_id)
+                self.by_time.add(key)
+                self.by_partner.setdefault(delivery["partner_id"], SortedList()).add(key)
+                # The first delivery of an order is the one it is tracked by
+                self.by_order.setdefault(delivery["order_id"], delivery_id)
+            else:
+                self.by_status[previous["status"]].discard(delivery_id)
+                self._count(previous, -1)
+            self.by_id[delivery_id] = delivery
+            self.by_status.setdefault(delivery["status"], set()).add(delivery_id)
+            self._count(delivery, 1)
+    
+    def get(self, delivery_id: str) -> Optional[Dict]:
+        return self.by_id.get(delivery_id)
+    
+    def get_by_order(self, order_id: str) -> Optional[Dict]:
+        delivery_id = self.by_order.get(order_id)
+        return self.by_id.get(delivery_id) if delivery_id else None
+    
+    def newest_first(self, partner_id: Optional[str] = None, status: Optional[str] = None) -> List[Dict]:
+        with self._lock:
+            if partner_id:
+                keys = list(self.by_partner.get(partner_id, ()))
+            elif status:
+                keys = sorted((self.by_id[d].get("assigned_at", ""), d) for d in self.by_status.get(status, ()))
+            else:
+                keys = list(self.by_time)
+            members = self.by_status.get(status, set()) if status else None
+            return [self.by_id[delivery_id] for _, delivery_id in reversed(keys)
+                    if members is None or delivery_id in members]
+    
+    def partner_counts(self, partner_id: str) -> Dict[str, int]:
+        return dict(self.counters.get(partner_id, {"total": 0, "completed": 0, "active": 0}))
+
+
 class DeliveryManager:
     def __init__(self, data_dir: str = "data"):
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(exist_ok=True)
         self.deliveries_file = self.data_dir / "deliveries.json"
         self.partners_file = self.data_dir / "delivery_partners.json"
+        self.journal_file = self.data_dir / "delivery_journal.json"
+        self.lock_file = self.data_dir / "deliveries.lock"
+        
+        # Serializes read-modify-write of the two files: the thread lock within
+        # this worker, the file lock across workers sharing the data directory
+        self._lock = threading.RLock()
+        with self._lock, file_lock(self.lock_file):
+            self._recover()
+            
+            # Initialize files
+            if not self.deliveries_file.exists():
+                self._save_deliveries([])
+            if not self.partners_file.exists():
+                self._initialize_delivery_partners()
+            
+            deliveries = self._load_deliveries()
+            partners = self._load_partners()
+            # Versions of the two files the pool and index below reflect
+            self._synced = self._stamps()
+        
+        # Availability and location of every partner, for nearest-partner search;
+        # open deliveries say which job each busy partner is on
+        self.pool = PartnerPool()
+        self.pool.load(partners, deliveries)
+        self.partner_ids = {partner["partner_id"] for partner in partners}
+        
+        # Per-partner pace learned from completed deliveries
+        self.eta = EtaModel()
+        self.eta.learn_history(deliveries)
         
-        # Initialize files
-        if not self.deliveries_file.exists():
-            self._save_deliveries([])
-        if not self.partners_file.exists():
-            self._initialize_delivery_partners()
+        # Lookups for the read endpoints, kept current by every write below
+        # (and rebuilt when another worker writes)
+        self.index = DeliveryIndex(deliveries)
+        
+        # Called with the deliveries that changed after every save
+        self._listeners: List[Callable[[List[Dict]], None]] = []
+    
+    def add_listener(self, callback: Callable[[List[Dict]], None]):
+        """Register a callback for created and updated deliveries (e.g. live tracking)"""
+        self._listeners.append(callback)
+    
+    def _notify(self, deliveries: List[Dict]):
+        for callback in self._listeners:
+            try:
+                callback(deliveries)
+            except Exception as e:
+                print(f"[ERROR] Delivery listener failed: {e}")
     
     def _load_deliveries(self) -> List[Dict]:
-        """Load all deliveries"""
+        """Load all deliveries (tracking histories as lazily decoded TrackingLogs)"""
         try:
             with open(self.deliveries_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+                deliveries = json.load(f)
+            unpack_tracking(deliveries)
+            return deliveries
         except Exception as e:
             print(f"[ERROR] Failed to load deliveries: {e}")
             return []
@@ -35,8 +284,7 @@ class DeliveryManager:
     def _save_deliveries(self, deliveries: List[Dict]):
         """Save deliveries"""
         try:
-            with open(self.deliveries_file, 'w', encoding='utf-8') as f:
-                json.dump(deliveries, f, ensure_ascii=False, indent=2)
+            self._write_json(self.deliveries_file, pack_tracking(deliveries))
         except Exception as e:
             print(f"[ERROR] Failed to save deliveries: {e}")
     
@@ -52,11 +300,87 @@ class DeliveryManager:
     def _save_partners(self, partners: List[Dict]):
         """Save delivery partners"""
         try:
-            with open(self.partners_file, 'w', encoding='utf-8') as f:
-                json.dump(partners, f, ensure_ascii=False, indent=2)
+            self._write_json(self.partners_file, partners)
         except Exception as e:
             print(f"[ERROR] Failed to save partners: {e}")
     
+    @staticmethod
+    def _write_json(path: Path, data, indent: Optional[int] = 2):
+        """Atomically replace a file (write temp, fsync, rename)"""
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    
+    @staticmethod
+    def _file_stamp(path: Path) -> Optional[tuple]:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    
+    def _stamps(self) -> Tuple[Optional[tuple], Optional[tuple]]:
+        return self._file_stamp(self.deliveries_file), self._file_stamp(self.partners_file)
+    
+    def _refresh(self):
+        """
+        Rebuild the index and partner pool from the files if another worker
+        wrote them since this one last did; call holding both locks, before
+        deciding anything on what the pool or index say
+        """
+        deliveries_stamp, partners_stamp = self._stamps()
+        if (deliveries_stamp, partners_stamp) == self._synced:
+            return
+        if deliveries_stamp != self._synced[0]:
+            deliveries = self._load_deliveries()
+            for delivery in deliveries:
+                previous = self.index.get(delivery["delivery_id"])
+                if delivery["status"] == "delivered" and (previous is None or previous["status"] != "delivered"):
+                    self.eta.learn(delivery)
+            self.index = DeliveryIndex(deliveries)
+        partners = self._load_partners()
+        pool = PartnerPool()
+        pool.load(partners, self.index.by_id.values())
+        self.pool = pool
+        self.partner_ids = {partner["partner_id"] for partner in partners}
+        self._synced = (deliveries_stamp, partners_stamp)
+    
+    def _catch_up(self):
+        """Refresh before a read; the locks are only taken if another worker has written"""
+        if self._stamps() != self._synced:
+            with self._lock, file_lock(self.lock_file):
+                self._refresh()
+    
+    def _commit(self, deliveries: List[Dict], partners: List[Dict]):
+        """
+        Write deliveries and partners as one transaction: both go to a journal
+        first, so a crash between replacing the two files is rolled forward on
+        the next start instead of leaving them disagreeing
+        """
+        deliveries = pack_tracking(deliveries)
+        self._write_json(self.journal_file, {"deliveries": deliveries, "partners": partners}, indent=None)
+        self._write_json(self.deliveries_file, deliveries)
+        self._write_json(self.partners_file, partners)
+        self.journal_file.unlink()
+    
+    def _recover(self):
+        """Finish a transaction interrupted by a crash"""
+        if not self.journal_file.exists():
+            return
+        try:
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                journal = json.load(f)
+        except Exception as e:
+            # The journal is replaced atomically, so this is damage, not a crash mid-write
+            print(f"[DELIVERY] Discarding incomplete journal: {e}")
+            self.journal_file.unlink()
+            return
+        self._commit(journal["deliveries"], journal["partners"])
+        print("[DELIVERY] Recovered interrupted delivery/partner write")
+    
     def _initialize_delivery_partners(self):
         """Initialize mock delivery partners"""
         partners = [
@@ -118,27 +442,91 @@ class DeliveryManager:
                                delivery_location: str) -> Dict:
         """
         Assign a delivery partner to an order
-        Returns delivery details with partner info
+        Returns delivery details with partner info; raises ValueError when no
+        partner is available (queue the order for batch dispatch instead)
         """
-        partners = self._load_partners()
-        
-        # Find available partner (simple random selection for demo)
-        available_partners = [p for p in partners if p["status"] == "available"]
+        point = geocode(pickup_location)
+        with self._lock, file_lock(self.lock_file):
+            self._refresh()
+            # Nearest available partner to the pickup, reserved so no one else gets them
+            reserved = self.pool.reserve_nearest(point)
+            if reserved is None:
+                raise ValueError("No delivery partner available")
+            partner_id, pickup_distance = reserved
+            
+            try:
+                partners = self._load_partners()
+                partner = next(p for p in partners if p["partner_id"] == partner_id)
+                delivery = self._build_delivery(order_id, pickup_location, delivery_location,
+                                                partner, pickup_distance)
+                partner["status"] = "on_delivery"
+                
+                # Delivery and partner status are written together
+                deliveries = self._load_deliveries()
+                deliveries.append(delivery)
+                self._commit(deliveries, partners)
+                self._synced = self._stamps()
+                self.index.put(delivery)
+                self.pool.claim(partner_id, job_id(delivery))
+            except Exception:
+                self.pool.release(partner_id)
+                raise
+        self._notify([delivery])
         
-        if not available_partners:
-            # If no one available, pick anyone (they'll be available soon)
-            available_partners = partners
+        print(f"[DELIVERY] Partner {partner['name']} assigned to order {order_id}")
+        return delivery
+    
+    def assign_batch(self, assignments: List[Dict]) -> List[Dict]:
+        """
+        Commit a dispatch plan ({"orders", "route", "partner_id", "distance_km"}
+        entries) in one transactional write of deliveries and partners. Every
+        order of a route gets its own delivery sharing the route's stop list.
+        Partners taken since the plan was made are skipped; their orders get no
+        delivery.
+        """
+        if not assignments:
+            return []
         
-        # Select partner (preferably highest rated)
-        partner = max(available_partners, key=lambda p: p["rating"])
+        created = []
+        with self._lock, file_lock(self.lock_file):
+            self._refresh()
+            reserved = [a for a in assignments if self.pool.reserve(a["partner_id"])]
+            try:
+                partners = self._load_partners()
+                by_id = {p["partner_id"]: p for p in partners}
+                for assignment in reserved:
+                    partner = by_id[assignment["partner_id"]]
+                    for order in assignment["orders"]:
+                        created.append(self._build_delivery(order["order_id"], order["pickup_location"],
+                                                            order["delivery_location"], partner,
+                                                            assignment.get("distance_km"), assignment.get("route")))
+                    partner["status"] = "on_delivery"
+                
+                if created:
+                    deliveries = self._load_deliveries()
+                    deliveries.extend(created)
+                    self._commit(deliveries, partners)
+                    self._synced = self._stamps()
+                    for delivery in created:
+                        self.index.put(delivery)
+                        self.pool.claim(delivery["partner_id"], job_id(delivery))
+            except Exception:
+                for assignment in reserved:
+                    self.pool.release(assignment["partner_id"])
+                raise
+        if created:
+            self._notify(created)
         
-        # Create delivery record
+        print(f"[DELIVERY] Batch assigned {len(created)} orders to "
+              f"{len({d['partner_id'] for d in created})} partners")
+        return created
+    
+    def _build_delivery(self, order_id: str, pickup_location: str, delivery_location: str,
+                        partner: Dict, pickup_distance: Optional[float],
+                        route: Optional[Dict] = None) -> Dict:
+        """New delivery record for a partner heading to a pickup (optionally as one drop of a route)"""
         delivery_id = f"DEL-{uuid.uuid4().hex[:8].upper()}"
         
-        # Calculate estimated delivery time (random between 30 min to 4 hours)
-        estimated_minutes = random.randint(30, 240)
-        estimated_delivery = datetime.now() + timedelta(minutes=estimated_minutes)
-        
         delivery = {
             "delivery_id": delivery_id,
             "order_id": order_id,
@@ -149,29 +537,26 @@ class DeliveryManager:
             "partner_rating": partner["rating"],
             "pickup_location": pickup_location,
             "delivery_location": delivery_location,
+            "pickup_distance_km": round(pickup_distance, 1) if pickup_distance is not None else None,
             "status": "assigned",
-            "estimated_delivery_time": estimated_delivery.isoformat(),
             "assigned_at": datetime.now().isoformat(),
-            "tracking_updates": [
+            "tracking_updates": TrackingLog.from_events([
                 {
                     "status": "assigned",
                     "message": f"Delivery partner {partner['name']} has been assigned",
                     "location": partner["current_location"],
                     "timestamp": datetime.now().isoformat()
                 }
-            ]
+            ])
         }
+        if route:
+            delivery["route_id"] = route["route_id"]
+            delivery["route_distance_km"] = route["distance_km"]
+            delivery["route_stops"] = route["stops"]
         
-        # Save delivery
-        deliveries = self._load_deliveries()
-        deliveries.append(delivery)
-        self._save_deliveries(deliveries)
-        
-        # Update partner status
-        partner["status"] = "on_delivery"
-        self._save_partners(partners)
-        
-        print(f"[DELIVERY] Partner {partner['name']} assigned to order {order_id}")
+        # Partner's location -> pickup(s) -> this drop
+        estimated_delivery = self.eta.estimate(delivery, partner["current_location"])
+        delivery["estimated_delivery_time"] = estimated_delivery.isoformat()
         return delivery
     
     def update_delivery_status(self, delivery_id: str, new_status: str, 
@@ -180,120 +565,182 @@ class DeliveryManager:
         """
         Update delivery status with tracking information
         Statuses: assigned → picked_up → in_transit → out_for_delivery → delivered
+        Raises DeliveryFinishedError once delivered, cancelled or failed
+        (including when another request finished it first)
         """
-        deliveries = self._load_deliveries()
-        
-        delivery = next((d for d in deliveries if d["delivery_id"] == delivery_id), None)
+        updated = self.apply_status_updates([(delivery_id, new_status, location, message)])
         
-        if not delivery:
+        if not updated:
+            current = self.index.get(delivery_id)
+            if current and current["status"] in FINISHED_STATUSES:
+                raise DeliveryFinishedError(f"Delivery {delivery_id} is already {current['status']}")
             raise ValueError(f"Delivery {delivery_id} not found")
         
-        # Update status
-        delivery["status"] = new_status
-        delivery["updated_at"] = datetime.now().isoformat()
-        
-        # Default messages based on status
-        status_messages = {
-            "picked_up": f"Order picked up from {delivery['pickup_location']}",
-            "in_transit": "Order is on the way to delivery location",
-            "out_for_delivery": "Order is out for delivery. Will arrive soon!",
-            "delivered": "Order delivered successfully",
-            "failed": "Delivery attempt failed. Will retry.",
-            "cancelled": "Delivery cancelled"
-        }
-        
-        # Add tracking update
-        update = {
-            "status": new_status,
-            "message": message or status_messages.get(new_status, "Status updated"),
-            "location": location or delivery.get("tracking_updates", [])[-1].get("location", "Unknown"),
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        delivery["tracking_updates"].append(update)
-        
-        # If delivered, mark completion time
-        if new_status == "delivered":
-            delivery["delivered_at"] = datetime.now().isoformat()
+        return updated[0]
+    
+    def apply_status_updates(self, updates: List[Tuple[str, str, Optional[str], Optional[str]]]) -> List[Dict]:
+        """
+        Apply (delivery_id, new_status, location, message) updates in order with
+        one load and one save of each file; unknown deliveries, and deliveries
+        already finished (replays, late events), are skipped
+        """
+        with self._lock, file_lock(self.lock_file):
+            self._refresh()
+            deliveries = self._load_deliveries()
+            by_id = {d["delivery_id"]: d for d in deliveries}
+            routes: Dict[str, List[Dict]] = {}
+            for d in deliveries:
+                if d.get("route_id"):
+                    routes.setdefault(d["route_id"], []).append(d)
+            partners = None
+            freed = []
             
-            # Free up delivery partner
-            partners = self._load_partners()
-            partner = next((p for p in partners if p["partner_id"] == delivery["partner_id"]), None)
-            if partner:
-                partner["status"] = "available"
-                partner["total_deliveries"] += 1
-                self._save_partners(partners)
-        
-        # Save updated deliveries
-        self._save_deliveries(deliveries)
+            # Default messages based on status
+            status_messages = {
+                "picked_up": "Order picked up from {pickup_location}",
+                "in_transit": "Order is on the way to delivery location",
+                "out_for_delivery": "Order is out for delivery. Will arrive soon!",
+                "delivered": "Order delivered successfully",
+                "failed": "Delivery attempt failed. Will retry.",
+                "cancelled": "Delivery cancelled"
+            }
+            
+            applied = []
+            # Applied deliveries plus route mates whose ETA moved, by id
+            changed: Dict[str, Dict] = {}
+            for delivery_id, new_status, location, message in updates:
+                delivery = by_id.get(delivery_id)
+                if not delivery or delivery["status"] in FINISHED_STATUSES:
+                    continue
+            
+                # Update status
+                now = datetime.now().isoformat()
+                delivery["status"] = new_status
+                delivery["updated_at"] = now
+            
+                # Add tracking update
+                update = {
+                    "status": new_status,
+                    "message": message or status_messages.get(new_status, "Status updated").format(**delivery),
+                    "location": location or delivery.get("tracking_updates", [])[-1].get("location", "Unknown"),
+                    "timestamp": now
+                }
+            
+                delivery["tracking_updates"].append(update)
+            
+                # Re-estimate from where the partner is now; on a route, the other
+                # open drops get closer as this one completes
+                position = location or (delivery["pickup_location"] if new_status == "picked_up" else update["location"])
+                route_mates = routes.get(delivery.get("route_id"), [])
+                completed = {d["order_id"] for d in route_mates if d["status"] == "delivered"}
+                for open_delivery in route_mates or [delivery]:
+                    if open_delivery["status"] not in FINISHED_STATUSES:
+                        open_delivery["estimated_delivery_time"] = self.eta.estimate(
+                            open_delivery, position, completed=completed
+                        ).isoformat()
+                        changed[open_delivery["delivery_id"]] = open_delivery
+            
+                # If delivered, mark completion time
+                if new_status == "delivered":
+                    delivery["delivered_at"] = now
+                    self.eta.learn(delivery)
+            
+                # Free up delivery partner once the last drop of their route is done,
+                # unless they have since been sent out on something else
+                route_open = any(d["status"] not in FINISHED_STATUSES for d in route_mates)
+                job = job_id(delivery)
+                if new_status in FINISHED_STATUSES and not route_open and self.pool.holds(delivery["partner_id"], job):
+                    if partners is None:
+                        partners = self._load_partners()
+                    partner = next((p for p in partners if p["partner_id"] == delivery["partner_id"]), None)
+                    if partner:
+                        partner["status"] = "available"
+                        if new_status == "delivered":
+                            partner["total_deliveries"] += 1
+                            # The partner is now wherever they dropped the order
+                            if geocode(delivery["delivery_location"]):
+                                partner["current_location"] = delivery["delivery_location"]
+                        freed.append((partner, job))
+            
+                applied.append(delivery)
+                changed[delivery_id] = delivery
+            
+            # Save updated deliveries (and partners freed by deliveries) together
+            if partners is not None:
+                self._commit(deliveries, partners)
+            elif applied:
+                self._save_deliveries(deliveries)
+            self._synced = self._stamps()
+            for delivery in changed.values():
+                self.index.put(delivery)
+            
+            # Back in the pool only once the write that frees them is on disk
+            for partner, job in freed:
+                self.pool.release(partner["partner_id"], partner["current_location"], job=job)
+        if changed:
+            self._notify(list(changed.values()))
         
-        print(f"[DELIVERY] {delivery_id} status updated to: {new_status}")
-        return delivery
+        if len(updates) == 1 and applied:
+            print(f"[DELIVERY] {applied[0]['delivery_id']} status updated to: {applied[0]['status']}")
+        elif updates:
+            print(f"[DELIVERY] Applied {len(applied)}/{len(updates)} status updates")
+        return applied
+    
+    def get_delivery(self, delivery_id: str) -> Optional[Dict]:
+        """Get a delivery by id"""
+        self._catch_up()
+        return self.index.get(delivery_id)
     
     def get_delivery_by_order(self, order_id: str) -> Optional[Dict]:
         """Get delivery details for an order"""
-        deliveries = self._load_deliveries()
-        return next((d for d in deliveries if d["order_id"] == order_id), None)
+        self._catch_up()
+        return self.index.get_by_order(order_id)
     
     def get_all_deliveries(self, partner_id: Optional[str] = None, 
                           status: Optional[str] = None) -> List[Dict]:
-        """Get all deliveries, optionally filtered"""
-        deliveries = self._load_deliveries()
-        
-        if partner_id:
-            deliveries = [d for d in deliveries if d.get("partner_id") == partner_id]
-        
-        if status:
-            deliveries = [d for d in deliveries if d.get("status") == status]
-        
-        # Sort by assigned_at (newest first)
-        deliveries.sort(key=lambda d: d.get("assigned_at", ""), reverse=True)
-        return deliveries
+        """Get all deliveries, optionally filtered, newest first"""
+        self._catch_up()
+        return self.index.newest_first(partner_id, status)
+    
+    def update_partner_locations(self, locations: Dict[str, str]):
+        """Move partners to their latest GPS fixes ("lat,lon") with one partners write"""
+        with self._lock, file_lock(self.lock_file):
+            self._refresh()
+            partners = self._load_partners()
+            moved = [p for p in partners if p["partner_id"] in locations]
+            for partner in moved:
+                partner["current_location"] = locations[partner["partner_id"]]
+            if moved:
+                self._save_partners(partners)
+                self._synced = self._stamps()
+            for partner in moved:
+                point = geocode(partner["current_location"])
+                if point:
+                    self.pool.move(partner["partner_id"], point)
     
     def get_available_partners(self) -> List[Dict]:
         """Get all available delivery partners"""
+        self._catch_up()
         partners = self._load_partners()
-        return [p for p in partners if p["status"] == "available"]
+        return [p for p in partners if self.pool.is_available(p["partner_id"])]
     
     def get_partner_stats(self, partner_id: str) -> Dict:
         """Get statistics for a delivery partner"""
+        self._catch_up()
         partners = self._load_partners()
         partner = next((p for p in partners if p["partner_id"] == partner_id), None)
         
         if not partner:
             return {}
         
-        deliveries = self._load_deliveries()
-        partner_deliveries = [d for d in deliveries if d["partner_id"] == partner_id]
-        
-        completed = len([d for d in partner_deliveries if d["status"] == "delivered"])
-        active = len([d for d in partner_deliveries if d["status"] not in ["delivered", "cancelled", "failed"]])
+        counts = self.index.partner_counts(partner_id)
         
         return {
             **partner,
-            "completed_deliveries": completed,
-            "active_deliveries": active,
-            "success_rate": round((completed / len(partner_deliveries) * 100) if partner_deliveries else 0, 1)
+            "completed_deliveries": counts["completed"],
+            "active_deliveries": counts["active"],
+            "success_rate": round((counts["completed"] / counts["total"] * 100) if counts["total"] else 0, 1)
         }
-    
-    def simulate_delivery_progress(self, delivery_id: str):
-        """
-        Simulate delivery progress through all stages
-        Useful for testing
-        """
-        stages = [
-            ("picked_up", "Order picked up from farm", 5),
-            ("in_transit", "On the way to delivery location", 10),
-            ("out_for_delivery", "Delivery partner nearby", 5),
-            ("delivered", "Successfully delivered", 0)
-        ]
-        
-        for status, message, delay in stages:
-            self.update_delivery_status(delivery_id, status, message=message)
-            print(f"  → {status}: {message}")
-            if delay:
-                import time
-                time.sleep(delay)  # Simulate real-time delays
 
 
 # Singleton instance
@@ -301,7 +748,7 @@ delivery_manager = DeliveryManager()
 
 
 if __name__ == "__main__":
-    # Test delivery system
+    # Test delivery system (test_delivery_manager.py has the concurrency tests)
     print("Testing Delivery Manager...")
     
     # Assign a delivery partner
@@ -319,7 +766,12 @@ if __name__ == "__main__":
     
     # Simulate delivery progress
     print("\n🚚 Simulating delivery progress...")
-    delivery_manager.simulate_delivery_progress(delivery['delivery_id'])
+    import asyncio
+    from delivery_simulator import DeliverySimulator
+    simulator = DeliverySimulator(delivery_manager, speedup=None)
+    simulator.schedule(delivery)
+    asyncio.run(simulator.run(until_idle=True))
+    print(f"   Status: {delivery_manager.get_delivery(delivery['delivery_id'])['status']}")
     
     print("\n[OK] Delivery Manager working correctly!")
 
@@ -0,0 +1,504 @@
+"""
+Crop Disease Catalog for AgriChain
+Per-class disease information (English and Hindi) with an O(1) lookup table
+built once at startup from every class label and its normalized variants
+"""
+
+import re
+from typing import Dict, List, Optional
+
+# Disease classes (PlantVillage dataset classes)
+DISEASE_CLASSES = [
+    "Apple___Apple_scab",
+    "Apple___Black_rot",
+    "Apple___Cedar_apple_rust",
+    "Apple___healthy",
+    "Blueberry___healthy",
+    "Cherry_(including_sour)___Powdery_mildew",
+    "Cherry_(including_sour)___healthy",
+    "Corn_(maize)___Cercospora_leaf_spot Gray_leaf_spot",
+    "Corn_(maize)___Common_rust_",
+    "Corn_(maize)___Northern_Leaf_Blight",
+    "Corn_(maize)___healthy",
+    "Grape___Black_rot",
+    "Grape___Esca_(Black_Measles)",
+    "Grape___Leaf_blight_(Isariopsis_Leaf_Spot)",
+    "Grape___healthy",
+    "Orange___Haunglongbing_(Citrus_greening)",
+    "Peach___Bacterial_spot",
+    "Peach___healthy",
+    "Pepper,_bell___Bacterial_spot",
+    "Pepper,_bell___healthy",
+    "Potato___Early_blight",
+    "Potato___Late_blight",
+    "Potato___healthy",
+    "Raspberry___healthy",
+    "Soybean___healthy",
+    "Squash___Powdery_mildew",
+    "Strawberry___Leaf_scorch",
+    "Strawberry___healthy",
+    "Tomato___Bacterial_spot",
+    "Tomato___Early_blight",
+    "Tomato___Late_blight",
+    "Tomato___Leaf_Mold",
+    "Tomato___Septoria_leaf_spot",
+    "Tomato___Spider_mites Two-spotted_spider_mite",
+    "Tomato___Target_Spot",
+    "Tomato___Tomato_Yellow_Leaf_Curl_Virus",
+    "Tomato___Tomato_mosaic_virus",
+    "Tomato___healthy"
+]
+
+# Disease information database
+DISEASE_INFO = {
+    "Late_blight": {
+        "treatment": "Apply copper-based fungicide (Bordeaux mixture) immediately. Remove and destroy infected leaves. Spray every 7-10 days during wet weather. Use fungicides like chlorothalonil or mancozeb.",
+        "prevention": "Ensure good air circulation, avoid overhead watering, and apply preventive fungicide sprays during humid weather. Plant resistant varieties. Remove infected plant debris. Maintain proper spacing between plants.",
+        "symptoms": "Dark brown to black lesions on leaves, white mold on leaf undersides, rapid plant death",
+        "causes": "Phytophthora infestans fungus, humid weather (80-100% humidity), cool temperatures (15-20°C)"
+    },
+    "Early_blight": {
+        "treatment": "Remove infected leaves immediately. Apply fungicides containing chlorothalonil, mancozeb, or copper. Spray every 7-14 days. Improve air circulation. Apply organic fungicides like neem oil.",
+        "prevention": "Crop rotation (3-4 year cycle), mulching to prevent soil splash, proper spacing, avoid overhead irrigation, remove plant debris, use resistant varieties.",
+        "symptoms": "Brown spots with concentric rings (target pattern), yellowing leaves, defoliation",
+        "causes": "Alternaria solani fungus, warm temperatures (24-29°C), high humidity, poor air circulation"
+    },
+    "Powdery_mildew": {
+        "treatment": "Spray with sulfur or potassium bicarbonate solution. Mix 1 tablespoon baking soda + 1 tablespoon vegetable oil in 1 gallon water. Apply weekly. Use milk spray (1:10 ratio with water). Apply fungicides if severe.",
+        "prevention": "Plant resistant varieties, maintain proper spacing (18-24 inches), avoid excess nitrogen fertilizer, water at soil level, prune for better air circulation, remove infected leaves promptly.",
+        "symptoms": "White powdery coating on leaves and stems, leaf curling, stunted growth, yellowing",
+        "causes": "Various powdery mildew fungi, high humidity (70-80%), moderate temperatures (20-25°C), shaded areas"
+    },
+    "Bacterial_spot": {
+        "treatment": "Remove infected plant parts. Apply copper-based bactericides. Use streptomycin sulfate for severe cases. Improve drainage. Avoid working with wet plants.",
+        "prevention": "Use disease-free seeds and transplants, crop rotation, avoid overhead watering, sanitize tools, maintain proper spacing, use resistant varieties.",
+        "symptoms": "Small dark spots with yellow halos, leaf dropping, fruit lesions",
+        "causes": "Xanthomonas bacteria, warm humid weather, water splash, contaminated tools"
+    },
+    "Leaf_scorch": {
+        "treatment": "Remove infected leaves. Improve watering schedule. Apply fungicides if fungal. Ensure proper drainage. Add mulch to maintain moisture.",
+        "prevention": "Consistent watering, proper drainage, mulching, avoid water stress, maintain soil nutrition, use resistant varieties.",
+        "symptoms": "Brown leaf edges, leaf curling, premature leaf drop",
+        "causes": "Water stress, fungal infection, poor drainage, nutrient deficiency"
+    },
+    "Healthy": {
+        "treatment": "No treatment needed. Continue current care routine. Monitor regularly for any changes.",
+        "prevention": "Maintain regular monitoring, proper watering schedule, balanced fertilization (NPK 10-10-10), good field sanitation, crop rotation, and integrated pest management.",
+        "symptoms": "None - plant is healthy",
+        "causes": "Good agricultural practices being followed"
+    },
+    "Apple_scab": {
+        "treatment": "Remove and destroy fallen leaves and infected fruit. Spray captan or myclobutanil from green tip until petal fall, every 7-10 days in wet weather.",
+        "prevention": "Plant scab-resistant varieties, prune for open canopy, rake and compost leaves in autumn, apply urea to fallen leaves to speed decay.",
+        "symptoms": "Olive-green to black velvety spots on leaves and fruit, cracked corky fruit, early leaf drop",
+        "causes": "Venturia inaequalis fungus, cool wet spring weather, infected leaf litter"
+    },
+    "Black_rot": {
+        "treatment": "Prune out cankers and mummified fruit. Apply captan or mancozeb sprays every 10-14 days from bloom. Remove infected clusters.",
+        "prevention": "Remove mummies and dead wood, keep canopy open, destroy pruned material, start protective sprays early in the season.",
+        "symptoms": "Brown leaf spots with purple margins (frog-eye), rotting fruit that shrivels into black mummies",
+        "causes": "Botryosphaeria obtusa (apple) or Guignardia bidwellii (grape) fungus, warm wet weather"
+    },
+    "Cedar_apple_rust": {
+        "treatment": "Apply myclobutanil or mancozeb from pink bud stage through early summer. Remove nearby juniper galls where possible.",
+        "prevention": "Plant rust-resistant varieties, remove red cedar/juniper hosts within a few hundred metres, apply preventive sprays in spring.",
+        "symptoms": "Bright yellow-orange spots on upper leaf surface, tube-like structures underneath, deformed fruit",
+        "causes": "Gymnosporangium juniperi-virginianae fungus alternating between juniper and apple hosts, wet spring weather"
+    },
+    "Cercospora_leaf_spot": {
+        "treatment": "Apply strobilurin or triazole fungicides at first sign of lesions on lower leaves. Repeat after 14 days if weather stays humid.",
+        "prevention": "Rotate with non-host crops, plough under residue, choose tolerant hybrids, avoid dense planting.",
+        "symptoms": "Rectangular grey to tan lesions bounded by leaf veins, lesions merge and blight whole leaves",
+        "causes": "Cercospora zeae-maydis fungus, high humidity, warm nights, infected crop residue"
+    },
+    "Common_rust": {
+        "treatment": "Spray mancozeb or propiconazole when pustules appear before tasseling. Usually no treatment needed late in the season.",
+        "prevention": "Grow resistant hybrids, plant early, maintain balanced nitrogen, monitor fields during cool humid spells.",
+        "symptoms": "Small cinnamon-brown powdery pustules on both leaf surfaces, leaves yellow and dry in severe cases",
+        "causes": "Puccinia sorghi fungus, windborne spores, cool temperatures (16-23°C) with heavy dew"
+    },
+    "Northern_Leaf_Blight": {
+        "treatment": "Apply propiconazole, azoxystrobin or mancozeb when lesions reach the third leaf below the ear. Repeat after 10-14 days if needed.",
+        "prevention": "Use resistant hybrids, rotate crops, bury infected residue, avoid continuous maize.",
+        "symptoms": "Long cigar-shaped grey-green to tan lesions (2.5-15 cm) on leaves, starting on lower leaves",
+        "causes": "Exserohilum turcicum fungus, moderate temperatures (18-27°C), prolonged leaf wetness"
+    },
+    "Esca": {
+        "treatment": "Prune out infected arms and trunks well below symptoms, seal large pruning wounds, remove dead vines. No curative spray exists.",
+        "prevention": "Prune in dry weather, protect wounds with sealant, disinfect pruning tools, use healthy planting material.",
+        "symptoms": "Tiger-stripe yellow and brown patterns between leaf veins, dark spots on berries, sudden vine collapse",
+        "causes": "Complex of wood-rotting fungi (Phaeomoniella, Phaeoacremonium) entering through pruning wounds"
+    },
+    "Leaf_blight": {
+        "treatment": "Remove infected leaves and spray copper oxychloride or mancozeb every 10-15 days during humid weather.",
+        "prevention": "Keep canopy open for airflow, avoid overhead irrigation, collect and destroy fallen leaves.",
+        "symptoms": "Irregular dark brown spots with yellow borders on leaves, premature leaf drop",
+        "causes": "Pseudocercospora vitis (Isariopsis) fungus, warm humid weather late in the season"
+    },
+    "Citrus_greening": {
+        "treatment": "No cure - remove and destroy infected trees to protect the orchard. Control psyllids with imidacloprid or neem oil sprays.",
+        "prevention": "Plant certified disease-free saplings, control Asian citrus psyllid, inspect orchards regularly, remove infected trees promptly.",
+        "symptoms": "Blotchy asymmetric leaf yellowing, small lopsided bitter fruit that stays green, twig dieback",
+        "causes": "Candidatus Liberibacter bacteria spread by the Asian citrus psyllid insect"
+    },
+    "Leaf_Mold": {
+        "treatment": "Increase ventilation and lower humidity. Remove infected leaves. Spray chlorothalonil or copper fungicide every 7-10 days.",
+        "prevention": "Keep relative humidity below 85% in polyhouses, space plants widely, water at the base, use resistant varieties.",
+        "symptoms": "Pale yellow spots on upper leaf surface with olive-green velvety mould underneath, leaves curl and drop",
+        "causes": "Passalora fulva fungus, humidity above 85%, poorly ventilated polyhouses"
+    },
+    "Septoria_leaf_spot": {
+        "treatment": "Remove lower infected leaves. Spray chlorothalonil, mancozeb or copper fungicide every 7-10 days.",
+        "prevention": "Rotate crops for 2-3 years, mulch to stop soil splash, stake plants, avoid wetting foliage.",
+        "symptoms": "Many small circular spots with dark borders and grey centres with black dots, starting on lower leaves",
+        "causes": "Septoria lycopersici fungus, wet weather, spores splashed from soil and infected debris"
+    },
+    "Spider_mites": {
+        "treatment": "Spray leaf undersides with water jets, then neem oil or insecticidal soap. Use abamectin or spiromesifen for heavy infestations.",
+        "prevention": "Avoid water stress and dusty conditions, conserve predatory mites, inspect leaf undersides weekly in hot dry weather.",
+        "symptoms": "Fine yellow speckling on leaves, fine webbing on undersides, leaves bronze and dry",
+        "causes": "Two-spotted spider mite (Tetranychus urticae), hot dry weather, excess nitrogen"
+    },
+    "Target_Spot": {
+        "treatment": "Remove infected leaves and spray chlorothalonil, mancozeb or azoxystrobin every 7-14 days.",
+        "prevention": "Improve airflow by pruning and staking, rotate crops, remove crop debris, avoid overhead watering.",
+        "symptoms": "Brown spots with concentric rings and light centres on leaves, stems and fruit",
+        "causes": "Corynespora cassiicola fungus, warm humid weather, long leaf wetness"
+    },
+    "Yellow_Leaf_Curl_Virus": {
+        "treatment": "No cure - uproot and destroy infected plants. Control whiteflies with yellow sticky traps, neem oil or imidacloprid.",
+        "prevention": "Use resistant varieties and virus-free seedlings, raise nurseries under insect-proof nets, remove weed hosts, control whiteflies early.",
+        "symptoms": "Upward curling and yellowing of leaf edges, stunted plants, flower drop and very low fruit set",
+        "causes": "Tomato yellow leaf curl virus spread by whiteflies (Bemisia tabaci)"
+    },
+    "Mosaic_virus": {
+        "treatment": "No cure - remove infected plants. Wash hands and disinfect tools with milk or bleach solution between plants.",
+        "prevention": "Use certified seed, avoid tobacco use near plants, disinfect tools, control weeds and aphids.",
+        "symptoms": "Light and dark green mottled mosaic pattern on leaves, leaf distortion, stunted growth",
+        "causes": "Tomato mosaic virus, spread by contact, tools, hands and infected seed"
+    },
+    "Unknown": {
+        "treatment": "The disease could not be identified. Take clear photos of affected leaves and consult your nearest Krishi Vigyan Kendra.",
+        "prevention": "Monitor the crop regularly, isolate affected plants and follow integrated pest management.",
+        "symptoms": "Not identified",
+        "causes": "Not identified"
+    }
+}
+
+
+# Hindi versions of DISEASE_INFO
+DISEASE_INFO_HI = {
+    "Late_blight": {
+        "name": "पछेती झुलसा",
+        "treatment": "तुरंत कॉपर आधारित फफूंदनाशक (बोर्डो मिश्रण) का छिड़काव करें। संक्रमित पत्तियाँ हटाकर नष्ट करें। नम मौसम में हर 7-10 दिन पर क्लोरोथालोनिल या मैंकोज़ेब का छिड़काव करें।",
+        "prevention": "हवा का अच्छा संचार रखें, ऊपर से सिंचाई न करें, नम मौसम में पहले से फफूंदनाशक छिड़कें, प्रतिरोधी किस्में लगाएँ और पौधों में उचित दूरी रखें।",
+        "symptoms": "पत्तियों पर गहरे भूरे से काले धब्बे, पत्तियों के नीचे सफेद फफूंद, पौधे का तेजी से सूखना",
+        "causes": "फाइटोफ्थोरा इन्फेस्टैंस कवक, नम मौसम (80-100% आर्द्रता), ठंडा तापमान (15-20°C)"
+    },
+    "Early_blight": {
+        "name": "अगेती झुलसा",
+        "treatment": "संक्रमित पत्तियाँ तुरंत हटाएँ। हर 7-14 दिन पर क्लोरोथालोनिल, मैंकोज़ेब या कॉपर फफूंदनाशक छिड़कें। नीम तेल जैसे जैविक उपाय भी अपनाएँ।",
+        "prevention": "3-4 साल का फसल चक्र अपनाएँ, मल्चिंग करें, पौधों में दूरी रखें, ऊपर से सिंचाई न करें, फसल अवशेष हटाएँ।",
+        "symptoms": "पत्तियों पर छल्लेदार भूरे धब्बे, पत्तियों का पीला पड़ना और झड़ना",
+        "causes": "अल्टरनेरिया सोलानी कवक, गर्म तापमान (24-29°C), अधिक नमी, कम हवा संचार"
+    },
+    "Powdery_mildew": {
+        "name": "चूर्णिल आसिता",
+        "treatment": "गंधक या पोटैशियम बाइकार्बोनेट घोल का छिड़काव करें। 1 चम्मच बेकिंग सोडा और 1 चम्मच तेल 4 लीटर पानी में मिलाकर हर सप्ताह छिड़कें।",
+        "prevention": "प्रतिरोधी किस्में लगाएँ, पौधों में उचित दूरी रखें, अधिक नाइट्रोजन न दें, जड़ों में पानी दें, संक्रमित पत्तियाँ जल्दी हटाएँ।",
+        "symptoms": "पत्तियों और तनों पर सफेद पाउडर जैसी परत, पत्तियों का मुड़ना, बढ़वार रुकना",
+        "causes": "चूर्णिल आसिता कवक, अधिक आर्द्रता (70-80%), मध्यम तापमान (20-25°C), छायादार स्थान"
+    },
+    "Bacterial_spot": {
+        "name": "जीवाणु धब्बा",
+        "treatment": "संक्रमित भाग हटाएँ। कॉपर आधारित जीवाणुनाशक छिड़कें। गंभीर स्थिति में स्ट्रेप्टोमाइसिन सल्फेट का प्रयोग करें। गीले पौधों पर काम न करें।",
+        "prevention": "रोगमुक्त बीज और पौध लगाएँ, फसल चक्र अपनाएँ, ऊपर से सिंचाई न करें, औज़ार साफ रखें।",
+        "symptoms": "पीले घेरे वाले छोटे गहरे धब्बे, पत्तियों का झड़ना, फलों पर घाव",
+        "causes": "ज़ैंथोमोनास जीवाणु, गर्म नम मौसम, पानी के छींटे, संक्रमित औज़ार"
+    },
+    "Leaf_scorch": {
+        "name": "पत्ती झुलसन",
+        "treatment": "संक्रमित पत्तियाँ हटाएँ। सिंचाई का नियमित समय रखें। फफूंद होने पर फफूंदनाशक छिड़कें। जल निकासी ठीक करें और मल्च लगाएँ।",
+        "prevention": "नियमित सिंचाई, अच्छी जल निकासी, मल्चिंग, पानी की कमी से बचाव, संतुलित पोषण।",
+        "symptoms": "पत्तियों के किनारे भूरे, पत्तियों का मुड़ना, समय से पहले झड़ना",
+        "causes": "पानी की कमी, कवक संक्रमण, खराब जल निकासी, पोषक तत्वों की कमी"
+    },
+    "Healthy": {
+        "name": "स्वस्थ",
+        "treatment": "किसी उपचार की आवश्यकता नहीं। वर्तमान देखभाल जारी रखें और नियमित निगरानी करें।",
+        "prevention": "नियमित निगरानी, सही सिंचाई, संतुलित उर्वरक (NPK 10-10-10), खेत की सफाई, फसल चक्र और समेकित कीट प्रबंधन अपनाएँ।",
+        "symptoms": "कोई नहीं - पौधा स्वस्थ है",
+        "causes": "अच्छी कृषि पद्धतियों का पालन"
+    },
+    "Apple_scab": {
+        "name": "सेब की पपड़ी",
+        "treatment": "गिरी हुई पत्तियाँ और संक्रमित फल नष्ट करें। नम मौसम में हर 7-10 दिन पर कैप्टान या माइक्लोब्यूटानिल छिड़कें।",
+        "prevention": "पपड़ी-प्रतिरोधी किस्में लगाएँ, छंटाई से छतरी खुली रखें, पतझड़ में गिरी पत्तियाँ हटाएँ।",
+        "symptoms": "पत्तियों और फलों पर जैतूनी हरे से काले मखमली धब्बे, फटे हुए फल, पत्तियों का जल्दी झड़ना",
+        "causes": "वेंचुरिया इनैक्वालिस कवक, ठंडा नम वसंत, संक्रमित पत्तियों का कचरा"
+    },
+    "Black_rot": {
+        "name": "काला सड़न",
+        "treatment": "कैंकर और सूखे फल काटकर हटाएँ। फूल आने से हर 10-14 दिन पर कैप्टान या मैंकोज़ेब छिड़कें।",
+        "prevention": "सूखे फल और मृत लकड़ी हटाएँ, छतरी खुली रखें, कटे भाग नष्ट करें, मौसम की शुरुआत में छिड़काव करें।",
+        "symptoms": "बैंगनी किनारों वाले भूरे धब्बे, फल सड़कर काले सिकुड़े हो जाते हैं",
+        "causes": "बोट्रियोस्फेरिया (सेब) या गिग्नार्डिया (अंगूर) कवक, गर्म नम मौसम"
+    },
+    "Cedar_apple_rust": {
+        "name": "सेब का गेरुआ रोग",
+        "treatment": "गुलाबी कली अवस्था से गर्मी की शुरुआत तक माइक्लोब्यूटानिल या मैंकोज़ेब छिड़कें। पास के जूनिपर पौधों की गांठें हटाएँ।",
+        "prevention": "गेरुआ-प्रतिरोधी किस्में लगाएँ, आसपास के जूनिपर पौधे हटाएँ, वसंत में बचाव छिड़काव करें।",
+        "symptoms": "पत्तियों पर चमकीले पीले-नारंगी धब्बे, नीचे नली जैसी संरचनाएँ, विकृत फल",
+        "causes": "जिम्नोस्पोरेंजियम कवक जो जूनिपर और सेब दोनों पर पलता है, नम वसंत"
+    },
+    "Cercospora_leaf_spot": {
+        "name": "सर्कोस्पोरा पत्ती धब्बा (धूसर धब्बा)",
+        "treatment": "निचली पत्तियों पर धब्बे दिखते ही स्ट्रोबिल्यूरिन या ट्रायज़ोल फफूंदनाशक छिड़कें। नमी बनी रहे तो 14 दिन बाद दोहराएँ।",
+        "prevention": "गैर-मेज़बान फसलों के साथ फसल चक्र, अवशेष जुताई में दबाएँ, सहनशील संकर किस्में लगाएँ।",
+        "symptoms": "शिराओं से घिरे आयताकार धूसर से भूरे धब्बे जो मिलकर पूरी पत्ती सुखा देते हैं",
+        "causes": "सर्कोस्पोरा ज़ी-मेडिस कवक, अधिक आर्द्रता, गर्म रातें, संक्रमित अवशेष"
+    },
+    "Common_rust": {
+        "name": "सामान्य गेरुआ",
+        "treatment": "झंडा निकलने से पहले फफोले दिखें तो मैंकोज़ेब या प्रोपिकोनाज़ोल छिड़कें।",
+        "prevention": "प्रतिरोधी संकर किस्में, समय पर बुवाई, संतुलित नाइट्रोजन, ठंडे नम मौसम में निगरानी।",
+        "symptoms": "पत्ती की दोनों सतहों पर दालचीनी-भूरे चूर्णी फफोले",
+        "causes": "पक्सीनिया सोरघी कवक, हवा से फैलने वाले बीजाणु, ठंडा तापमान (16-23°C) और ओस"
+    },
+    "Northern_Leaf_Blight": {
+        "name": "उत्तरी पत्ती झुलसा",
+        "treatment": "भुट्टे से नीचे की तीसरी पत्ती तक धब्बे पहुँचें तो प्रोपिकोनाज़ोल, एज़ोक्सीस्ट्रोबिन या मैंकोज़ेब छिड़कें।",
+        "prevention": "प्रतिरोधी संकर किस्में, फसल चक्र, संक्रमित अवशेष दबाएँ, लगातार मक्का न उगाएँ।",
+        "symptoms": "पत्तियों पर लंबे सिगार आकार के धूसर-भूरे धब्बे (2.5-15 सेमी)",
+        "causes": "एक्सेरोहिलम टर्सिकम कवक, मध्यम तापमान (18-27°C), पत्तियों का देर तक गीला रहना"
+    },
+    "Esca": {
+        "name": "एस्का (काला खसरा)",
+        "treatment": "संक्रमित शाखाएँ लक्षणों से नीचे तक काटें, बड़े घाव सील करें, मृत बेलें हटाएँ। कोई उपचारात्मक छिड़काव नहीं है।",
+        "prevention": "सूखे मौसम में छंटाई करें, घावों पर लेप लगाएँ, औज़ार कीटाणुरहित करें, स्वस्थ पौध लगाएँ।",
+        "symptoms": "शिराओं के बीच बाघ-धारी जैसे पीले-भूरे निशान, दानों पर काले धब्बे, बेल का अचानक सूखना",
+        "causes": "छंटाई के घावों से घुसने वाले लकड़ी सड़ाने वाले कवक"
+    },
+    "Leaf_blight": {
+        "name": "पत्ती झुलसा (आइसेरियोप्सिस)",
+        "treatment": "संक्रमित पत्तियाँ हटाएँ और नम मौसम में हर 10-15 दिन पर कॉपर ऑक्सीक्लोराइड या मैंकोज़ेब छिड़कें।",
+        "prevention": "छतरी खुली रखें, ऊपर से सिंचाई न करें, गिरी पत्तियाँ इकट्ठा कर नष्ट करें।",
+        "symptoms": "पीले किनारों वाले अनियमित गहरे भूरे धब्बे, पत्तियों का जल्दी झड़ना",
+        "causes": "स्यूडोसर्कोस्पोरा विटिस कवक, मौसम के अंत में गर्म नम मौसम"
+    },
+    "Citrus_greening": {
+        "name": "सिट्रस ग्रीनिंग (हुआंगलोंगबिंग)",
+        "treatment": "कोई इलाज नहीं - बाग बचाने के लिए संक्रमित पेड़ हटाकर नष्ट करें। सिल्लिड कीट को इमिडाक्लोप्रिड या नीम तेल से नियंत्रित करें।",
+        "prevention": "प्रमाणित रोगमुक्त पौधे लगाएँ, सिट्रस सिल्लिड नियंत्रित करें, नियमित निरीक्षण करें।",
+        "symptoms": "पत्तियों पर असमान धब्बेदार पीलापन, छोटे टेढ़े कड़वे फल जो हरे रहते हैं, टहनियों का सूखना",
+        "causes": "लिबेरिबैक्टर जीवाणु जो एशियाई सिट्रस सिल्लिड कीट से फैलता है"
+    },
+    "Leaf_Mold": {
+        "name": "पत्ती फफूंद",
+        "treatment": "हवा का संचार बढ़ाएँ और नमी घटाएँ। संक्रमित पत्तियाँ हटाएँ। हर 7-10 दिन पर क्लोरोथालोनिल या कॉपर फफूंदनाशक छिड़कें।",
+        "prevention": "पॉलीहाउस में आर्द्रता 85% से कम रखें, पौधों में दूरी रखें, जड़ों में पानी दें, प्रतिरोधी किस्में लगाएँ।",
+        "symptoms": "ऊपर हल्के पीले धब्बे और नीचे जैतूनी हरी मखमली फफूंद, पत्तियाँ मुड़कर गिरती हैं",
+        "causes": "पैसालोरा फुल्वा कवक, 85% से अधिक आर्द्रता, कम हवादार पॉलीहाउस"
+    },
+    "Septoria_leaf_spot": {
+        "name": "सेप्टोरिया पत्ती धब्बा",
+        "treatment": "निचली संक्रमित पत्तियाँ हटाएँ। हर 7-10 दिन पर क्लोरोथालोनिल, मैंकोज़ेब या कॉपर फफूंदनाशक छिड़कें।",
+        "prevention": "2-3 साल का फसल चक्र, मिट्टी के छींटे रोकने को मल्च, पौधों को सहारा दें, पत्तियाँ गीली न करें।",
+        "symptoms": "गहरे किनारों और धूसर केंद्र वाले अनेक छोटे गोल धब्बे, निचली पत्तियों से शुरुआत",
+        "causes": "सेप्टोरिया लाइकोपर्सिसी कवक, नम मौसम, मिट्टी और अवशेषों से फैलते बीजाणु"
+    },
+    "Spider_mites": {
+        "name": "मकड़ी माइट (दो-धब्बेदार)",
+        "treatment": "पत्तियों के नीचे पानी की तेज धार मारें, फिर नीम तेल या कीटनाशक साबुन छिड़कें। अधिक प्रकोप में एबामेक्टिन का प्रयोग करें।",
+        "prevention": "पानी की कमी और धूल से बचाएँ, शिकारी माइट को बढ़ावा दें, गर्म सूखे मौसम में हर सप्ताह जाँच करें।",
+        "symptoms": "पत्तियों पर बारीक पीले बिंदु, नीचे महीन जाला, पत्तियाँ कांस्य रंग की होकर सूखती हैं",
+        "causes": "दो-धब्बेदार मकड़ी माइट, गर्म सूखा मौसम, अधिक नाइट्रोजन"
+    },
+    "Target_Spot": {
+        "name": "लक्ष्य धब्बा",
+        "treatment": "संक्रमित पत्तियाँ हटाएँ और हर 7-14 दिन पर क्लोरोथालोनिल, मैंकोज़ेब या एज़ोक्सीस्ट्रोबिन छिड़कें।",
+        "prevention": "छंटाई और सहारे से हवा का संचार बढ़ाएँ, फसल चक्र अपनाएँ, अवशेष हटाएँ, ऊपर से सिंचाई न करें।",
+        "symptoms": "पत्तियों, तनों और फलों पर हल्के केंद्र वाले छल्लेदार भूरे धब्बे",
+        "causes": "कोरिनेस्पोरा कैसीकोला कवक, गर्म नम मौसम, पत्तियों का देर तक गीला रहना"
+    },
+    "Yellow_Leaf_Curl_Virus": {
+        "name": "पीला पत्ती मोड़क विषाणु",
+        "treatment": "कोई इलाज नहीं - संक्रमित पौधे उखाड़कर नष्ट करें। सफेद मक्खी को पीले चिपचिपे जाल, नीम तेल या इमिडाक्लोप्रिड से नियंत्रित करें।",
+        "prevention": "प्रतिरोधी किस्में और विषाणुमुक्त पौध, कीटरोधी जाल में नर्सरी, खरपतवार हटाएँ, सफेद मक्खी का जल्दी नियंत्रण।",
+        "symptoms": "पत्तियों के किनारे ऊपर की ओर मुड़ना और पीले होना, बौने पौधे, फूल झड़ना और बहुत कम फल",
+        "causes": "टमाटर पीला पत्ती मोड़क विषाणु जो सफेद मक्खी (बेमिसिया टैबेसी) से फैलता है"
+    },
+    "Mosaic_virus": {
+        "name": "मोज़ेक विषाणु",
+        "treatment": "कोई इलाज नहीं - संक्रमित पौधे हटाएँ। पौधों के बीच हाथ धोएँ और औज़ारों को दूध या ब्लीच घोल से साफ करें।",
+        "prevention": "प्रमाणित बीज लगाएँ, पौधों के पास तंबाकू का प्रयोग न करें, औज़ार साफ रखें, खरपतवार और माहू नियंत्रित करें।",
+        "symptoms": "पत्तियों पर हल्के और गहरे हरे रंग का चितकबरा पैटर्न, पत्तियों का विकृत होना, बौनापन",
+        "causes": "टमाटर मोज़ेक विषाणु, स्पर्श, औज़ार, हाथों और संक्रमित बीज से फैलता है"
+    },
+    "Unknown": {
+        "name": "अज्ञात",
+        "treatment": "रोग की पहचान नहीं हो सकी। प्रभावित पत्तियों की साफ तस्वीरें लेकर नज़दीकी कृषि विज्ञान केंद्र से संपर्क करें।",
+        "prevention": "फसल की नियमित निगरानी करें, प्रभावित पौधे अलग करें और समेकित कीट प्रबंधन अपनाएँ।",
+        "symptoms": "पहचान नहीं हुई",
+        "causes": "पहचान नहीं हुई"
+    }
+}
+
+# Crop names and crop-specific treatment notes (appended to the disease treatment)
+CROP_INFO = {
+    "Apple": {"name_hi": "सेब", "note": "In apple orchards, time sprays to bud stages and prune in winter to keep the canopy open.",
+              "note_hi": "सेब के बागों में छिड़काव कली अवस्था के अनुसार करें और सर्दियों में छंटाई कर छतरी खुली रखें।"},
+    "Blueberry": {"name_hi": "ब्लूबेरी", "note": "Blueberries need acidic soil (pH 4.5-5.5) and steady moisture.",
+                  "note_hi": "ब्लूबेरी को अम्लीय मिट्टी (pH 4.5-5.5) और लगातार नमी चाहिए।"},
+    "Cherry": {"name_hi": "चेरी", "note": "For cherry trees, prune after harvest and keep the orchard floor free of fallen leaves.",
+               "note_hi": "चेरी के पेड़ों की छंटाई तुड़ाई के बाद करें और बाग में गिरी पत्तियाँ न रहने दें।"},
+    "Corn": {"name_hi": "मक्का", "note": "In maize, scout the lower leaves before tasseling - that is when sprays pay off most.",
+             "note_hi": "मक्का में झंडा निकलने से पहले निचली पत्तियों की जाँच करें - इसी समय छिड़काव सबसे लाभदायक है।"},
+    "Grape": {"name_hi": "अंगूर", "note": "In vineyards, manage canopy by shoot thinning and leaf removal around bunches.",
+              "note_hi": "अंगूर के बाग में टहनियाँ छाँटकर और गुच्छों के पास की पत्तियाँ हटाकर छतरी का प्रबंधन करें।"},
+    "Orange": {"name_hi": "संतरा", "note": "In citrus orchards, check new flushes for psyllids every two weeks.",
+               "note_hi": "नींबू वर्गीय बागों में हर दो सप्ताह नई कोंपलों पर सिल्लिड कीट की जाँच करें।"},
+    "Peach": {"name_hi": "आड़ू", "note": "For peaches, avoid sprinkler irrigation and use windbreaks to reduce leaf injury.",
+              "note_hi": "आड़ू में फव्वारा सिंचाई से बचें और पत्तियों की चोट कम करने के लिए वायुरोधी पेड़ लगाएँ।"},
+    "Pepper": {"name_hi": "शिमला मिर्च", "note": "For bell pepper, treat seed with hot water (50°C for 25 minutes) before sowing.",
+               "note_hi": "शिमला मिर्च के बीज को बुवाई से पहले गर्म पानी (50°C, 25 मिनट) से उपचारित करें।"},
+    "Potato": {"name_hi": "आलू", "note": "In potato, earth up the rows and destroy haulms before harvest to protect tubers.",
+               "note_hi": "आलू में मेड़ों पर मिट्टी चढ़ाएँ और कंदों को बचाने के लिए खुदाई से पहले डंठल नष्ट करें।"},
+    "Raspberry": {"name_hi": "रसभरी", "note": "For raspberries, remove old canes after fruiting and thin new canes.",
+                  "note_hi": "रसभरी में फल आने के बाद पुरानी डालियाँ हटाएँ और नई डालियाँ विरल करें।"},
+    "Soybean": {"name_hi": "सोयाबीन", "note": "In soybean, treat seed with fungicide and keep fields weed-free early in the season.",
+                "note_hi": "सोयाबीन में बीज को फफूंदनाशक से उपचारित करें और शुरुआत में खेत खरपतवार मुक्त रखें।"},
+    "Squash": {"name_hi": "कद्दू", "note": "For squash, trellis vines where possible and water at the base in the morning.",
+               "note_hi": "कद्दू की बेलों को जहाँ संभव हो मचान पर चढ़ाएँ और सुबह जड़ों में पानी दें।"},
+    "Strawberry": {"name_hi": "स्ट्रॉबेरी", "note": "For strawberries, use drip irrigation and straw or plastic mulch under the plants.",
+                   "note_hi": "स्ट्रॉबेरी में टपक सिंचाई करें और पौधों के नीचे पुआल या प्लास्टिक मल्च बिछाएँ।"},
+    "Tomato": {"name_hi": "टमाटर", "note": "For tomatoes, stake plants and prune the lowest leaves so foliage stays off the soil.",
+               "note_hi": "टमाटर के पौधों को सहारा दें और सबसे निचली पत्तियाँ छाँटें ताकि पत्तियाँ मिट्टी से न छुएँ।"},
+}
+
+# Class-label disease parts that don't match a DISEASE_INFO key directly
+CLASS_DISEASE_ALIASES = {
+    "Cercospora_leaf_spot Gray_leaf_spot": "Cercospora_leaf_spot",
+    "Common_rust_": "Common_rust",
+    "Esca_(Black_Measles)": "Esca",
+    "Leaf_blight_(Isariopsis_Leaf_Spot)": "Leaf_blight",
+    "Haunglongbing_(Citrus_greening)": "Citrus_greening",
+    "Spider_mites Two-spotted_spider_mite": "Spider_mites",
+    "Tomato_Yellow_Leaf_Curl_Virus": "Yellow_Leaf_Curl_Virus",
+    "Tomato_mosaic_virus": "Mosaic_virus",
+    "healthy": "Healthy",
+}
+
+# Extra names people (and older models) use for the same diseases
+EXTRA_DISEASE_NAMES = {
+    "Gray_leaf_spot": "Cercospora_leaf_spot",
+    "Black_Measles": "Esca",
+    "Isariopsis_Leaf_Spot": "Leaf_blight",
+    "Haunglongbing": "Citrus_greening",
+    "Two_spotted_spider_mite": "Spider_mites",
+    "Tomato_Yellow_Leaf_Curl_Virus": "Yellow_Leaf_Curl_Virus",
+    "Leaf_curl": "Yellow_Leaf_Curl_Virus",
+    "Tomato_mosaic_virus": "Mosaic_virus",
+}
+
+
+def normalize_disease_name(name: str) -> str:
+    """'Corn_(maize)___Common_rust_' and 'corn maize common rust' both -> 'corn_maize_common_rust'"""
+    return re.sub(r"[^0-9a-z]+", "_", name.lower()).strip("_")
+
+
+class DiseaseCatalog:
+    """
+    Lookup table from every class label (and normalized variants) to a full
+    per-class record. Built once; every lookup is a single dict access.
+    """
+
+    def __init__(self, class_labels: List[str]):
+        self.records: Dict[str, Dict] = {}
+        self._index: Dict[str, Dict] = {}
+
+        # Generic (crop-less) records first so crop-specific variants override them
+        for disease_key in DISEASE_INFO:
+            record = self._build_record(None, disease_key, None)
+            self._add(disease_key, record)
+        for alias, disease_key in EXTRA_DISEASE_NAMES.items():
+            self._add(alias, self._index[normalize_disease_name(disease_key)])
+
+        for label in class_labels:
+            crop_part, disease_part = label.split("___")
+            disease_key = CLASS_DISEASE_ALIASES.get(disease_part, disease_part)
+            crop = re.split(r"[_,(]", crop_part)[0]
+            record = self._build_record(label, disease_key, crop)
+            self.records[label] = record
+
+            for crop_name in {crop_part, crop}:
+                self._add(f"{crop_name} {disease_part}", record)
+                self._add(f"{crop_name} {disease_key}", record)
+
+    def _add(self, name: str, record: Dict):
+        self._index[normalize_disease_name(name)] = record
+
+    def _build_record(self, label: Optional[str], disease_key: str, crop: Optional[str]) -> Dict:
+        info = DISEASE_INFO[disease_key]
+        info_hi = DISEASE_INFO_HI[disease_key]
+        crop_info = CROP_INFO.get(crop, {}) if crop else {}
+        display_name = disease_key.replace("_", " ")
+
+        treatment = info["treatment"]
+        treatment_hi = info_hi["treatment"]
+        if crop_info and disease_key != "Healthy":
+            treatment = f"{treatment} {crop_info['note']}"
+            treatment_hi = f"{treatment_hi} {crop_info['note_hi']}"
+
+        return {
+            "class_label": label,
+            "crop": crop,
+            "disease_key": disease_key,
+            "disease": display_name,
+            "treatment": treatment,
+            "prevention": info["prevention"],
+            "symptoms": info["symptoms"],
+            "causes": info["causes"],
+            "hi": {
+                "crop": crop_info.get("name_hi"),
+                "disease": info_hi["name"],
+                "treatment": treatment_hi,
+                "prevention": info_hi["prevention"],
+                "symptoms": info_hi["symptoms"],
+                "causes": info_hi["causes"]
+            }
+        }
+
+    def lookup(self, name: str) -> Optional[Dict]:
+        """Find the record for a class label or disease name (None if unknown)"""
+        return self._index.get(normalize_disease_name(name))
+
+    def details(self, name: str, language: str = "en") -> Dict:
+        """Record for a disease in the requested language ('en' or 'hi')"""
+        record = self.lookup(name) or self._index["unknown"]
+        if language != "hi":
+            return {key: value for key, value in record.items() if key != "hi"}
+
+        localized = {key: value for key, value in record.items() if key != "hi"}
+        localized.update({key: value for key, value in record["hi"].items() if value})
+        return localized
+
+
+# Singleton instance (built at import, i.e. once at startup)
+disease_catalog = DiseaseCatalog(DISEASE_CLASSES)
+
+
+if __name__ == "__main__":
+    # Test catalog lookups
+    print("Testing Disease Catalog...")
+
+    for name in ["Tomato___Late_blight", "Late blight", "Corn_(maize)___Common_rust_",
+                 "corn common rust", "Gray leaf spot", "Apple___healthy", "Something else"]:
+        record = disease_catalog.details(name)
+        print(f"  {name!r:36} -> {record['crop']} / {record['disease']}")
+
+    record = disease_catalog.details("Potato___Early_blight", language="hi")
+    print(f"\n  Hindi: {record['crop']} - {record['disease']}: {record['treatment'][:60]}...")
+    print(f"\n  Classes: {len(disease_catalog.records)}, index entries: {len(disease_catalog._index)}")
+
+    print("\n[OK] Disease Catalog working correctly!")
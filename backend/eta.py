@@ -0,0 +1,178 @@
+"""
+Delivery ETA Estimation for AgriChain
+Estimates arrival from road distance between geocoded stops, vehicle speed
+profiles by hour of day, and each partner's learned pace (how their past
+deliveries compared with the model)
+"""
+
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from geo import geocode, haversine_km
+
+# Roads are longer than the straight line between two points
+ROAD_FACTOR = 1.35
+# Average moving speed (km/h) outside rush hour: (city, highway); the first
+# CITY_KM of a leg are driven at city speed and the rest at highway speed
+VEHICLE_SPEED_KMPH = {"Bike": (25.0, 45.0), "Van": (22.0, 55.0), "Truck": (18.0, 50.0)}
+CITY_KM = 15.0
+# Speed multipliers by hour of day (morning and evening rush, night runs)
+HOUR_SPEED_FACTOR = {hour: 1.0 for hour in range(24)}
+HOUR_SPEED_FACTOR.update({hour: 0.65 for hour in (8, 9, 10, 17, 18, 19, 20)})
+HOUR_SPEED_FACTOR.update({hour: 1.25 for hour in (22, 23, 0, 1, 2, 3, 4, 5)})
+# Loading at a farm and handing over at a drop
+PICKUP_MINUTES = 10
+DROP_MINUTES = 5
+# Used when a stop can't be placed on the map
+FALLBACK_LEG_MINUTES = 45
+
+# Partner pace = actual / predicted minutes, smoothed over deliveries
+PACE_SMOOTHING = 0.3
+PACE_LIMITS = (0.5, 2.5)
+# Samples this far off the model are simulations or data errors, not pace
+PACE_OUTLIER_RATIO = 5.0
+
+FINISHED_STATUSES = ("delivered", "cancelled", "failed")
+
+
+@lru_cache(maxsize=65536)
+def road_km(origin: str, destination: str) -> Optional[float]:
+    """Memoized origin/destination road distance; None if either end can't be geocoded"""
+    if origin > destination:
+        return road_km(destination, origin)
+    start, end = geocode(origin), geocode(destination)
+    if not start or not end:
+        return None
+    return haversine_km(start, end) * ROAD_FACTOR
+
+
+def leg_minutes(origin: str, destination: str, vehicle: str, at: datetime) -> float:
+    """Driving time for one leg at the speed of the hour it starts in"""
+    distance = road_km(origin, destination)
+    if distance is None:
+        return FALLBACK_LEG_MINUTES
+    city, highway = VEHICLE_SPEED_KMPH.get(vehicle, VEHICLE_SPEED_KMPH["Bike"])
+    hours = min(distance, CITY_KM) / city + max(0.0, distance - CITY_KM) / highway
+    return hours / HOUR_SPEED_FACTOR[at.hour] * 60
+
+
+class EtaModel:
+    def __init__(self):
+        # partner_id -> (pace, samples)
+        self.pace: Dict[str, Tuple[float, int]] = {}
+
+    def partner_pace(self, partner_id: str) -> float:
+        return self.pace.get(partner_id, (1.0, 0))[0]
+
+    def _path_minutes(self, path: List[Tuple[str, str]], vehicle: str, start: datetime) -> float:
+        """Minutes to drive through (kind, location) stops in order, with handling time"""
+        minutes = 0.0
+        for (_, origin), (kind, destination) in zip(path, path[1:]):
+            minutes += leg_minutes(origin, destination, vehicle, start + timedelta(minutes=minutes))
+            minutes += PICKUP_MINUTES if kind == "pickup" else DROP_MINUTES
+        return minutes
+
+    def remaining_path(self, delivery: Dict, position: str,
+                       completed: Optional[Set[str]] = None) -> List[Tuple[str, str]]:
+        """
+        Stops still ahead of the partner, ending at this delivery's drop
+        completed: order_ids of the same route already delivered
+        """
+        status = delivery["status"]
+        stops = delivery.get("route_stops")
+        if not stops:
+            stops = [{"type": "pickup", "order_id": delivery["order_id"], "location": delivery["pickup_location"]},
+                     {"type": "drop", "order_id": delivery["order_id"], "location": delivery["delivery_location"]}]
+        completed = completed or set()
+
+        ahead = []
+        for stop in stops:
+            if stop["type"] == "pickup" and status != "assigned":
+                continue  # Every pickup of the run is loaded before the first drop
+            if stop["type"] == "drop" and stop["order_id"] in completed:
+                continue
+            ahead.append((stop["type"], stop["location"]))
+            if stop["type"] == "drop" and stop["order_id"] == delivery["order_id"]:
+                break
+        return [("start", position)] + ahead
+
+    def estimate(self, delivery: Dict, position: str, now: Optional[datetime] = None,
+                 completed: Optional[Set[str]] = None) -> datetime:
+        """Expected arrival at this delivery's drop, starting from `position` now"""
+        now = now or datetime.now()
+        path = self.remaining_path(delivery, position, completed)
+        minutes = self._path_minutes(path, delivery.get("partner_vehicle", "Bike"), now)
+        return now + timedelta(minutes=minutes * self.partner_pace(delivery.get("partner_id")))
+
+    def learn(self, delivery: Dict):
+        """Fold a finished single-order delivery into its partner's pace"""
+        if delivery.get("status") != "delivered" or delivery.get("route_stops"):
+            return
+        times = {update["status"]: update["timestamp"] for update in delivery.get("tracking_updates", [])}
+        if "picked_up" not in times or "delivered" not in times:
+            return
+        picked_up = datetime.fromisoformat(times["picked_up"])
+        actual = (datetime.fromisoformat(times["delivered"]) - picked_up).total_seconds() / 60
+        predicted = self._path_minutes(
+            [("start", delivery["pickup_location"]), ("drop", delivery["delivery_location"])],
+            delivery.get("partner_vehicle", "Bike"), picked_up
+        )
+        ratio = actual / predicted if predicted > 0 else 0.0
+        if not 1 / PACE_OUTLIER_RATIO <= ratio <= PACE_OUTLIER_RATIO:
+            return
+
+        pace, samples = self.pace.get(delivery["partner_id"], (1.0, 0))
+        pace = ratio if samples == 0 else (1 - PACE_SMOOTHING) * pace + PACE_SMOOTHING * ratio
+        self.pace[delivery["partner_id"]] = (min(max(pace, PACE_LIMITS[0]), PACE_LIMITS[1]), samples + 1)
+
+    def learn_history(self, deliveries: Iterable[Dict]):
+        """Replay past deliveries, oldest first"""
+        for delivery in sorted(deliveries, key=lambda d: d.get("delivered_at") or ""):
+            self.learn(delivery)
+
+
+if __name__ == "__main__":
+    # Learn a slow and a fast partner from synthetic history, then compare ETAs
+    import random
+    import time
+
+    print("Testing ETA model...")
+    model = EtaModel()
+    rng = random.Random(9)
+    places = ["Rohini", "Dwarka", "Saket", "Noida", "Gurgaon", "Karol Bagh", "Azadpur", "Okhla"]
+    base = datetime(2026, 3, 2, 6, 0)
+    history = []
+    for n in range(200):
+        partner_id, speed = rng.choice([("DP-SLOW", 1.6), ("DP-FAST", 0.8)])
+        pickup, drop = rng.sample(places, 2)
+        picked_up = base + timedelta(hours=n)
+        expected = model._path_minutes([("start", pickup), ("drop", drop)], "Bike", picked_up)
+        delivered = picked_up + timedelta(minutes=expected * speed * rng.uniform(0.85, 1.15))
+        history.append({
+            "partner_id": partner_id, "partner_vehicle": "Bike", "status": "delivered",
+            "pickup_location": pickup, "delivery_location": drop, "delivered_at": delivered.isoformat(),
+            "tracking_updates": [{"status": "picked_up", "timestamp": picked_up.isoformat()},
+                                 {"status": "delivered", "timestamp": delivered.isoformat()}]
+        })
+    model.learn_history(history)
+    for partner_id in ("DP-SLOW", "DP-FAST"):
+        pace, samples = model.pace[partner_id]
+        print(f"  {partner_id}: pace {pace:.2f} from {samples} deliveries")
+
+    delivery = {"order_id": "ORD-1", "partner_id": "DP-SLOW", "partner_vehicle": "Bike", "status": "assigned",
+                "pickup_location": "Azadpur", "delivery_location": "Saket"}
+    for hour in (6, 9, 14):
+        now = datetime(2026, 3, 10, hour, 0)
+        eta = model.estimate(delivery, "Rohini", now)
+        print(f"  Rohini -> Azadpur -> Saket at {hour:02}:00: {(eta - now).total_seconds() / 60:.0f} min")
+
+    road_km.cache_clear()
+    pairs = [(rng.choice(places), rng.choice(places)) for _ in range(100_000)]
+    started = time.perf_counter()
+    for origin, destination in pairs:
+        road_km(origin, destination)
+    elapsed = time.perf_counter() - started
+    print(f"  100,000 leg lookups in {elapsed * 1000:.0f} ms ({road_km.cache_info().hits} cache hits)")
+
+    print("\n[OK] ETA model working correctly!")
@@ -0,0 +1,54 @@
+"""
+Cross-process File Locks for AgriChain
+Serializes read-modify-write of shared data files between the workers of one
+deployment (several uvicorn processes over the same data directory).
+"""
+
+import fcntl
+from contextlib import contextmanager
+from pathlib import Path
+
+
+@contextmanager
+def file_lock(path: Path):
+    """
+    Hold an exclusive flock on `path` (created if missing) for the block
+    Lock a sidecar file, not the data file itself: data files are replaced by
+    rename, which would leave other processes locking the old inode.
+    """
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+if __name__ == "__main__":
+    # Threads stand in for processes: each flock is taken on its own open file
+    import tempfile
+    import threading
+    import time
+
+    print("Testing file lock...")
+    with tempfile.TemporaryDirectory() as tmp:
+        lock_path = Path(tmp) / "counter.lock"
+        counter_path = Path(tmp) / "counter.txt"
+        counter_path.write_text("0")
+
+        def bump(times: int):
+            for _ in range(times):
+                with file_lock(lock_path):
+                    value = int(counter_path.read_text())
+                    counter_path.write_text(str(value + 1))
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=bump, args=(500,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(f"  8 x 500 locked increments in {time.perf_counter() - started:.2f}s: "
+              f"{counter_path.read_text()} (expected 4000)")
+
+    print("\n[OK] File lock working correctly!")
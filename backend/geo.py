@@ -0,0 +1,285 @@
+"""
+Offline Geocoding and Spatial Index for AgriChain Deliveries
+Resolves free-text places (partner locations, farm pickups, drop addresses)
+to lat/lon with a built-in gazetteer and finds nearby partners with a grid index
+"""
+
+import math
+import re
+from functools import lru_cache
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+Point = Tuple[float, float]
+
+EARTH_RADIUS_KM = 6371.0
+
+# Approximate centres; specific places first, broad regions last
+GAZETTEER: Dict[str, Point] = {
+    # Delhi localities and mandis
+    "connaught place": (28.6315, 77.2167),
+    "karol bagh": (28.6519, 77.1909),
+    "dwarka": (28.5921, 77.0460),
+    "rohini": (28.7495, 77.0565),
+    "saket": (28.5245, 77.2066),
+    "lajpat nagar": (28.5677, 77.2433),
+    "chandni chowk": (28.6506, 77.2303),
+    "janakpuri": (28.6219, 77.0878),
+    "pitampura": (28.7033, 77.1321),
+    "vasant kunj": (28.5200, 77.1590),
+    "vasant vihar": (28.5606, 77.1619),
+    "mayur vihar": (28.6090, 77.2940),
+    "laxmi nagar": (28.6304, 77.2773),
+    "nehru place": (28.5491, 77.2513),
+    "okhla": (28.5355, 77.2731),
+    "narela": (28.8526, 77.0929),
+    "najafgarh": (28.6092, 76.9798),
+    "shahdara": (28.6733, 77.2898),
+    "azadpur": (28.7068, 77.1796),
+    "ghazipur": (28.6239, 77.3236),
+    "rajouri garden": (28.6415, 77.1209),
+    "paharganj": (28.6448, 77.2167),
+    "greater kailash": (28.5482, 77.2380),
+    "hauz khas": (28.5494, 77.2001),
+    "preet vihar": (28.6415, 77.2950),
+    "model town": (28.7164, 77.1905),
+    "mundka": (28.6833, 77.0300),
+    "bawana": (28.7990, 77.0400),
+    "alipur": (28.7967, 77.1339),
+    "mehrauli": (28.5244, 77.1855),
+    "badarpur": (28.4930, 77.3030),
+    "kalkaji": (28.5383, 77.2579),
+    "patel nagar": (28.6500, 77.1700),
+    "uttam nagar": (28.6210, 77.0550),
+    "kashmere gate": (28.6670, 77.2280),
+    "new delhi": (28.6139, 77.2090),
+    "delhi": (28.6139, 77.2090),
+    # NCR and nearby towns
+    "greater noida": (28.4744, 77.5040),
+    "noida": (28.5355, 77.3910),
+    "gurugram": (28.4595, 77.0266),
+    "faridabad": (28.4089, 77.3178),
+    "ghaziabad": (28.6692, 77.4538),
+    "sonipat": (28.9931, 77.0151),
+    "bahadurgarh": (28.6924, 76.9240),
+    "manesar": (28.3515, 76.9428),
+    "ballabhgarh": (28.3407, 77.3211),
+    "palwal": (28.1487, 77.3320),
+    "meerut": (28.9845, 77.7064),
+    "rohtak": (28.8955, 76.6066),
+    "panipat": (29.3909, 76.9635),
+    "karnal": (29.6857, 76.9905),
+    "hapur": (28.7306, 77.7759),
+    "bulandshahr": (28.4069, 77.8498),
+    "rewari": (28.1990, 76.6183),
+    "jhajjar": (28.6063, 76.6565),
+    "baghpat": (28.9428, 77.2276),
+    "modinagar": (28.8316, 77.5779),
+    "muzaffarnagar": (29.4727, 77.7085),
+    "mathura": (27.4924, 77.6737),
+    "alwar": (27.5530, 76.6346),
+    # Regional cities
+    "chandigarh": (30.7333, 76.7794),
+    "ludhiana": (30.9010, 75.8573),
+    "amritsar": (31.6340, 74.8723),
+    "jaipur": (26.9124, 75.7873),
+    "lucknow": (26.8467, 80.9462),
+    "agra": (27.1767, 78.0081),
+    "dehradun": (30.3165, 78.0322),
+    "mumbai": (19.0760, 72.8777),
+    "pune": (18.5204, 73.8567),
+    "nashik": (19.9975, 73.7898),
+    # States (last resort for "Village Farm, Punjab")
+    "punjab": (31.1471, 75.3412),
+    "haryana": (29.0588, 76.0856),
+    "uttar pradesh": (26.8467, 80.9462),
+    "rajasthan": (27.0238, 74.2179),
+    "maharashtra": (19.7515, 75.7139),
+    "madhya pradesh": (22.9734, 78.6569),
+    "uttarakhand": (30.0668, 79.0193),
+    "himachal pradesh": (31.1048, 77.1734),
+    "gujarat": (22.2587, 71.1924),
+    "bihar": (25.0961, 85.3131),
+}
+
+ALIASES = {
+    "gurgaon": "gurugram",
+    "cp": "connaught place",
+    "ncr": "delhi",
+    "up": "uttar pradesh",
+    "mp": "madhya pradesh",
+    "sonepat": "sonipat",
+    "gzb": "ghaziabad",
+}
+
+MAX_NAME_WORDS = max(len(name.split()) for name in GAZETTEER)
+COORDINATES = re.compile(r"^\s*(-?\d{1,2}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)\s*$")
+
+
+def haversine_km(a: Point, b: Point) -> float:
+    """Great-circle distance between two (lat, lon) points"""
+    lat1, lon1 = map(math.radians, a)
+    lat2, lon2 = map(math.radians, b)
+    h = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+
+
+def _match_part(words: List[str]) -> Optional[Point]:
+    """Longest gazetteer name found as consecutive words"""
+    for size in range(min(MAX_NAME_WORDS, len(words)), 0, -1):
+        for start in range(len(words) - size + 1):
+            name = " ".join(words[start:start + size])
+            name = ALIASES.get(name, name)
+            if name in GAZETTEER:
+                return GAZETTEER[name]
+    return None
+
+
+@lru_cache(maxsize=4096)
+def geocode(place: Optional[str]) -> Optional[Point]:
+    """
+    Resolve a place string to (lat, lon) without network access
+    "lat,lon" strings pass through; otherwise the most specific comma-separated
+    part that names a known place wins ("Sector 18, Noida" -> Noida).
+    """
+    if not place:
+        return None
+    match = COORDINATES.match(place)
+    if match:
+        return float(match.group(1)), float(match.group(2))
+
+    for part in place.lower().split(","):
+        words = re.findall(r"[a-z]+", part)
+        point = _match_part(words)
+        if point:
+            return point
+    return None
+
+
+class GridIndex:
+    """
+    Uniform lat/lon grid of points (about 2 km cells by default)
+    Nearest-neighbour queries search rings of cells outward from the query
+    point and stop once no unvisited cell can hold a closer point.
+    """
+
+    def __init__(self, cell_degrees: float = 0.02):
+        self.cell_degrees = cell_degrees
+        self.cells: Dict[Tuple[int, int], Dict[Hashable, Tuple[Point, float]]] = {}
+        self.items: Dict[Hashable, Tuple[Tuple[int, int], Point, float]] = {}
+
+    def _cell(self, point: Point) -> Tuple[int, int]:
+        return (int(math.floor(point[0] / self.cell_degrees)),
+                int(math.floor(point[1] / self.cell_degrees)))
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.items
+
+    def insert(self, key: Hashable, point: Point, rating: float = 0.0):
+        self.remove(key)
+        cell = self._cell(point)
+        self.cells.setdefault(cell, {})[key] = (point, rating)
+        self.items[key] = (cell, point, rating)
+
+    def remove(self, key: Hashable):
+        entry = self.items.pop(key, None)
+        if entry is not None:
+            bucket = self.cells[entry[0]]
+            del bucket[key]
+            if not bucket:
+                del self.cells[entry[0]]
+
+    def _ring(self, center: Tuple[int, int], radius: int) -> Iterable[Tuple[int, int]]:
+        ci, cj = center
+        if radius == 0:
+            yield center
+            return
+        for dj in range(-radius, radius + 1):
+            yield ci - radius, cj + dj
+            yield ci + radius, cj + dj
+        for di in range(-radius + 1, radius):
+            yield ci + di, cj - radius
+            yield ci + di, cj + radius
+
+    def nearest(self, point: Point, k: int = 5,
+                max_distance_km: Optional[float] = None) -> List[Tuple[float, Hashable, float]]:
+        """Up to k (distance_km, key, rating) tuples, closest first"""
+        if not self.items:
+            return []
+        center = self._cell(point)
+        # Smallest cell side near this latitude bounds how far each ring reaches
+        cell_km = self.cell_degrees * 111.32 * min(1.0, math.cos(math.radians(point[0])))
+        found: List[Tuple[float, Hashable, float]] = []
+        visited = 0
+        radius = 0
+        while visited < len(self.items):
+            if 8 * radius > len(self.cells):
+                # Sparse index far from the query: the rings would mostly be empty
+                # cells, so scanning the occupied ones directly is cheaper
+                found = [(haversine_km(point, item_point), key, rating)
+                         for key, (_, item_point, rating) in self.items.items()]
+                break
+            for cell in self._ring(center, radius):
+                bucket = self.cells.get(cell)
+                if not bucket:
+                    continue
+                for key, (item_point, rating) in bucket.items():
+                    visited += 1
+                    found.append((haversine_km(point, item_point), key, rating))
+
+            # Anything in ring radius+1 is at least radius * cell_km away
+            reach = radius * cell_km
+            if max_distance_km is not None and reach > max_distance_km:
+                break
+            if len(found) >= k:
+                found.sort(key=lambda item: item[0])
+                found = found[:k]
+                if found[-1][0] <= reach:
+                    break
+            radius += 1
+
+        found.sort(key=lambda item: item[0])
+        if max_distance_km is not None:
+            found = [item for item in found if item[0] <= max_distance_km]
+        return found[:k]
+
+
+if __name__ == "__main__":
+    # Geocode sample addresses, then benchmark k-nearest against a full scan
+    import random
+    import time
+
+    print("Testing geocoder...")
+    for place in ("Green Farm, Rohtak", "Sector 18, Noida", "Village Farm, Punjab",
+                  "Atrara, Meerut", "DLF Phase 3, Gurgaon", "28.70,77.10", "Somewhere unknown"):
+        print(f"  {place!r:26} -> {geocode(place)}")
+    print(f"  Dwarka -> Rohini: {haversine_km(geocode('Dwarka'), geocode('Rohini')):.1f} km")
+
+    print("\nBenchmarking partner search (Delhi-NCR bounding box)...")
+    rng = random.Random(11)
+    for count in (10_000, 100_000):
+        index = GridIndex()
+        points = {}
+        for number in range(count):
+            point = (rng.uniform(28.2, 29.0), rng.uniform(76.8, 77.7))
+            points[number] = point
+            index.insert(number, point, rng.uniform(3.5, 5.0))
+
+        queries = [(rng.uniform(28.3, 28.9), rng.uniform(76.9, 77.6)) for _ in range(200)]
+        started = time.perf_counter()
+        results = [index.nearest(query, k=5) for query in queries]
+        grid_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+        started = time.perf_counter()
+        brute = [sorted((haversine_km(query, p), key) for key, p in points.items())[:5]
+                 for query in queries[:20]]
+        brute_ms = (time.perf_counter() - started) * 1000 / 20
+
+        agree = all([key for _, key, _ in results[i]] == [key for _, key in brute[i]] for i in range(20))
+        print(f"  {count:>7,} partners: grid {grid_ms:.3f} ms/query, "
+              f"full scan {brute_ms:.1f} ms/query, same answers: {agree}")
+
+    print("\n[OK] Geo index working correctly!")
@@ -0,0 +1,214 @@
+"""
+GPS Ingestion for AgriChain Delivery Partners
+Keeps the latest pings of every partner in an in-memory ring buffer and
+persists simplified trails (Douglas-Peucker) in periodic batches, so a ping
+costs an append instead of a file rewrite
+"""
+
+import json
+import math
+from collections import deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# (unix_seconds, lat, lon)
+Ping = Tuple[float, float, float]
+
+# One hour of history at a ping every 5 seconds
+GPS_BUFFER_SIZE = 720
+# Largest batch accepted in one request or frame
+MAX_BATCH_POINTS = 1000
+# Trail points closer than this to the simplified line are dropped
+SIMPLIFY_TOLERANCE_M = 15.0
+
+METERS_PER_DEGREE_LAT = 110540.0
+METERS_PER_DEGREE_LON = 111320.0
+
+
+def simplify(points: Sequence[Ping], tolerance_m: float = SIMPLIFY_TOLERANCE_M) -> List[Ping]:
+    """Douglas-Peucker simplification of a track (iterative, distances in metres)"""
+    count = len(points)
+    if count < 3:
+        return list(points)
+
+    # Equirectangular projection around the first point is exact enough for a city
+    kx = METERS_PER_DEGREE_LON * math.cos(math.radians(points[0][1]))
+    xs = [point[2] * kx for point in points]
+    ys = [point[1] * METERS_PER_DEGREE_LAT for point in points]
+    tolerance_sq = tolerance_m * tolerance_m
+
+    keep = [False] * count
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        ax, ay = xs[first], ys[first]
+        dx, dy = xs[last] - ax, ys[last] - ay
+        length_sq = dx * dx + dy * dy
+        farthest, farthest_sq = -1, tolerance_sq
+        for index in range(first + 1, last):
+            px, py = xs[index] - ax, ys[index] - ay
+            # Distance to the segment, not the infinite line, so loops and
+            # stops that return to the start are kept
+            t = 0.0 if length_sq == 0 else min(1.0, max(0.0, (px * dx + py * dy) / length_sq))
+            ex, ey = px - t * dx, py - t * dy
+            distance_sq = ex * ex + ey * ey
+            if distance_sq > farthest_sq:
+                farthest, farthest_sq = index, distance_sq
+        if farthest != -1:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+class GpsIngest:
+    def __init__(self, data_dir: str = "data", buffer_size: int = GPS_BUFFER_SIZE):
+        self.trail_file = Path(data_dir) / "gps_tracks.jsonl"
+        self.buffer_size = buffer_size
+        self.tracks: Dict[str, Deque[Ping]] = {}
+        # Timestamp of the newest ping already written, per partner
+        self._flushed: Dict[str, float] = {}
+        self._dirty = set()
+        self.accepted = 0
+        self.rejected = 0
+        # Called with (partner_id, latest ping) after each batch that moved a partner
+        self._listeners: List[Callable[[str, Ping], None]] = []
+
+    def add_listener(self, callback: Callable[[str, Ping], None]):
+        self._listeners.append(callback)
+
+    def ingest(self, partner_id: str, points: Iterable[Sequence[float]]) -> int:
+        """
+        Buffer a batch of [ts, lat, lon] pings; returns how many were kept
+        Out-of-order, duplicate and out-of-range pings are dropped.
+        """
+        track = self.tracks.get(partner_id)
+        if track is None:
+            track = self.tracks[partner_id] = deque(maxlen=self.buffer_size)
+        last_ts = track[-1][0] if track else float("-inf")
+
+        accepted = rejected = 0
+        append = track.append
+        for point in points:
+            try:
+                ts, lat, lon = point
+                valid = ts > last_ts and -90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0
+            except (TypeError, ValueError):
+                valid = False
+            if not valid:
+                rejected += 1
+                continue
+            append((ts, lat, lon))
+            last_ts = ts
+            accepted += 1
+
+        if accepted:
+            self._dirty.add(partner_id)
+            for callback in self._listeners:
+                try:
+                    callback(partner_id, track[-1])
+                except Exception as e:
+                    print(f"[ERROR] GPS listener failed: {e}")
+        self.accepted += accepted
+        self.rejected += rejected
+        return accepted
+
+    def latest(self, partner_id: str) -> Optional[Ping]:
+        track = self.tracks.get(partner_id)
+        return track[-1] if track else None
+
+    def recent(self, partner_id: str, since: Optional[float] = None) -> List[Ping]:
+        """Buffered pings (optionally newer than `since`), simplified for display"""
+        track = self.tracks.get(partner_id) or ()
+        return simplify([point for point in track if since is None or point[0] > since])
+
+    def flush(self) -> Dict[str, Ping]:
+        """
+        Append each partner's new pings, simplified, to the trail file
+        Returns {partner_id: latest ping} for partners that moved since the last flush.
+        """
+        if not self._dirty:
+            return {}
+        dirty, self._dirty = self._dirty, set()
+
+        lines = []
+        latest = {}
+        for partner_id in dirty:
+            track = self.tracks[partner_id]
+            flushed_ts = self._flushed.get(partner_id, float("-inf"))
+            # Start from the last written point so the simplified segment joins the trail
+            segment = [point for point in track if point[0] >= flushed_ts]
+            if segment and segment[0][0] == flushed_ts:
+                kept = simplify(segment)[1:]
+            else:
+                kept = simplify(segment)
+            if kept:
+                lines.append(json.dumps({"partner_id": partner_id, "points": kept}, separators=(",", ":")))
+            self._flushed[partner_id] = track[-1][0]
+            latest[partner_id] = track[-1]
+
+        try:
+            with open(self.trail_file, 'a', encoding='utf-8') as f:
+                f.write("\n".join(lines) + "\n")
+        except Exception as e:
+            print(f"[ERROR] Failed to save GPS trails: {e}")
+        return latest
+
+
+# Singleton instance
+gps_ingest = GpsIngest()
+
+
+if __name__ == "__main__":
+    # Ingest throughput and trail compression on synthetic riders around Delhi
+    import random
+    import tempfile
+    import time
+
+    print("Testing GPS ingestion...")
+    rng = random.Random(21)
+    riders = 5000
+    batch = 12  # A minute of pings at one every 5 seconds
+
+    # Riders move along roads: mostly straight with occasional turns and stops
+    positions = {f"DP{n}": [28.4 + rng.random() * 0.5, 76.9 + rng.random() * 0.6,
+                            rng.uniform(0, 2 * math.pi)] for n in range(riders)}
+    clock = 1_760_000_000.0
+    payloads = []
+    for minute in range(10):
+        for partner_id, state in positions.items():
+            points = []
+            for step in range(batch):
+                if rng.random() < 0.1:
+                    state[2] += rng.choice((-1, 1)) * math.pi / 2
+                speed = 0.0 if rng.random() < 0.05 else 6.0  # metres per second
+                state[0] += math.cos(state[2]) * speed * 5 / METERS_PER_DEGREE_LAT
+                state[1] += math.sin(state[2]) * speed * 5 / METERS_PER_DEGREE_LON
+                points.append([clock + minute * 60 + step * 5, round(state[0], 6), round(state[1], 6)])
+            payloads.append((partner_id, json.dumps({"points": points})))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ingest = GpsIngest(data_dir=tmp)
+        pings = len(payloads) * batch
+
+        started = time.perf_counter()
+        for partner_id, body in payloads:
+            ingest.ingest(partner_id, json.loads(body)["points"])
+        elapsed = time.perf_counter() - started
+        print(f"  {pings:,} pings from {riders:,} riders: {pings / elapsed:,.0f} pings/s "
+              f"(JSON decode included), rejected {ingest.rejected}")
+
+        started = time.perf_counter()
+        moved = ingest.flush()
+        elapsed = time.perf_counter() - started
+        stored = sum(len(json.loads(line)["points"]) for line in ingest.trail_file.read_text().splitlines())
+        print(f"  Flush of {len(moved):,} trails in {elapsed:.2f}s: {stored:,} of {pings:,} points kept "
+              f"({stored * 100 / pings:.1f}%)")
+
+        # Out of order and duplicates are dropped
+        last = ingest.latest("DP0")
+        print(f"  Stale ping accepted: {ingest.ingest('DP0', [list(last), [last[0] - 5, 28.5, 77.0]])}")
+
+    print("\n[OK] GPS ingestion working correctly!")
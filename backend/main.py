@@ -1,14 +1,16 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Header, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Depends, Header, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 # import numpy as np  # Commented out for deployment - not needed for core features
 from PIL import Image
 import io
 # import cv2  # Commented out for deployment - not needed for core features
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import os
 import json
+import zipfile
+import tempfile
 from datetime import datetime
 from pathlib import Path
 from schemes_scraper import fetch_government_schemes, search_schemes, check_eligibility
@@ -17,7 +19,16 @@ from scheme_scheduler import scheme_scheduler
 from auth import auth_manager
 from orders import order_manager
 from chat_manager import chat_manager
-from delivery_manager import delivery_manager
+from connection_manager import manager
+from chat_broker import create_broker
+from delivery_manager import DeliveryFinishedError, delivery_manager
+from dispatch import dispatch_queue
+from delivery_simulator import DeliverySimulator
+from gps_ingest import MAX_BATCH_POINTS, gps_ingest
+from tracking_hub import tracking_hub
+from tiled_analysis import analyze_large_image, DEFAULT_TILE_SIZE
+from model_registry import model_registry, RuleBasedModel, KerasModel
+from disease_catalog import disease_catalog, DISEASE_CLASSES
 import razorpay
 import hmac
 import hashlib
@@ -41,7 +52,7 @@ class LoginRequest(BaseModel):
 class RegisterRequest(BaseModel):
     email: str
     password: str
-    role: str  # 'farmer' or 'consumer'
+    role: str  # 'farmer' or 'consumer' ('admin' accounts are not self-registered)
     name: str
     phone: str
     location: str
@@ -81,97 +92,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Disease classes (PlantVillage dataset classes)
-DISEASE_CLASSES = [
-    "Apple___Apple_scab",
-    "Apple___Black_rot",
-    "Apple___Cedar_apple_rust",
-    "Apple___healthy",
-    "Blueberry___healthy",
-    "Cherry_(including_sour)___Powdery_mildew",
-    "Cherry_(including_sour)___healthy",
-    "Corn_(maize)___Cercospora_leaf_spot Gray_leaf_spot",
-    "Corn_(maize)___Common_rust_",
-    "Corn_(maize)___Northern_Leaf_Blight",
-    "Corn_(maize)___healthy",
-    "Grape___Black_rot",
-    "Grape___Esca_(Black_Measles)",
-    "Grape___Leaf_blight_(Isariopsis_Leaf_Spot)",
-    "Grape___healthy",
-    "Orange___Haunglongbing_(Citrus_greening)",
-    "Peach___Bacterial_spot",
-    "Peach___healthy",
-    "Pepper,_bell___Bacterial_spot",
-    "Pepper,_bell___healthy",
-    "Potato___Early_blight",
-    "Potato___Late_blight",
-    "Potato___healthy",
-    "Raspberry___healthy",
-    "Soybean___healthy",
-    "Squash___Powdery_mildew",
-    "Strawberry___Leaf_scorch",
-    "Strawberry___healthy",
-    "Tomato___Bacterial_spot",
-    "Tomato___Early_blight",
-    "Tomato___Late_blight",
-    "Tomato___Leaf_Mold",
-    "Tomato___Septoria_leaf_spot",
-    "Tomato___Spider_mites Two-spotted_spider_mite",
-    "Tomato___Target_Spot",
-    "Tomato___Tomato_Yellow_Leaf_Curl_Virus",
-    "Tomato___Tomato_mosaic_virus",
-    "Tomato___healthy"
-]
-
-# Disease information database
-DISEASE_INFO = {
-    "Late_blight": {
-        "treatment": "Apply copper-based fungicide (Bordeaux mixture) immediately. Remove and destroy infected leaves. Spray every 7-10 days during wet weather. Use fungicides like chlorothalonil or mancozeb.",
-        "prevention": "Ensure good air circulation, avoid overhead watering, and apply preventive fungicide sprays during humid weather. Plant resistant varieties. Remove infected plant debris. Maintain proper spacing between plants.",
-        "symptoms": "Dark brown to black lesions on leaves, white mold on leaf undersides, rapid plant death",
-        "causes": "Phytophthora infestans fungus, humid weather (80-100% humidity), cool temperatures (15-20°C)"
-    },
-    "Early_blight": {
-        "treatment": "Remove infected leaves immediately. Apply fungicides containing chlorothalonil, mancozeb, or copper. Spray every 7-14 days. Improve air circulation. Apply organic fungicides like neem oil.",
-        "prevention": "Crop rotation (3-4 year cycle), mulching to prevent soil splash, proper spacing, avoid overhead irrigation, remove plant debris, use resistant varieties.",
-        "symptoms": "Brown spots with concentric rings (target pattern), yellowing leaves, defoliation",
-        "causes": "Alternaria solani fungus, warm temperatures (24-29°C), high humidity, poor air circulation"
-    },
-    "Powdery_mildew": {
-        "treatment": "Spray with sulfur or potassium bicarbonate solution. Mix 1 tablespoon baking soda + 1 tablespoon vegetable oil in 1 gallon water. Apply weekly. Use milk spray (1:10 ratio with water). Apply fungicides if severe.",
-        "prevention": "Plant resistant varieties, maintain proper spacing (18-24 inches), avoid excess nitrogen fertilizer, water at soil level, prune for better air circulation, remove infected leaves promptly.",
-        "symptoms": "White powdery coating on leaves and stems, leaf curling, stunted growth, yellowing",
-        "causes": "Various powdery mildew fungi, high humidity (70-80%), moderate temperatures (20-25°C), shaded areas"
-    },
-    "Bacterial_spot": {
-        "treatment": "Remove infected plant parts. Apply copper-based bactericides. Use streptomycin sulfate for severe cases. Improve drainage. Avoid working with wet plants.",
-        "prevention": "Use disease-free seeds and transplants, crop rotation, avoid overhead watering, sanitize tools, maintain proper spacing, use resistant varieties.",
-        "symptoms": "Small dark spots with yellow halos, leaf dropping, fruit lesions",
-        "causes": "Xanthomonas bacteria, warm humid weather, water splash, contaminated tools"
-    },
-    "Leaf_scorch": {
-        "treatment": "Remove infected leaves. Improve watering schedule. Apply fungicides if fungal. Ensure proper drainage. Add mulch to maintain moisture.",
-        "prevention": "Consistent watering, proper drainage, mulching, avoid water stress, maintain soil nutrition, use resistant varieties.",
-        "symptoms": "Brown leaf edges, leaf curling, premature leaf drop",
-        "causes": "Water stress, fungal infection, poor drainage, nutrient deficiency"
-    },
-    "Healthy": {
-        "treatment": "No treatment needed. Continue current care routine. Monitor regularly for any changes.",
-        "prevention": "Maintain regular monitoring, proper watering schedule, balanced fertilization (NPK 10-10-10), good field sanitation, crop rotation, and integrated pest management.",
-        "symptoms": "None - plant is healthy",
-        "causes": "Good agricultural practices being followed"
-    }
-}
-
-# Global model variable (for future ML model integration)
-model = None
-MODEL_PATH = "crop_disease_model.h5"
+# Model registry - the serving version can be swapped at runtime without a restart
+MODEL_PATH = os.getenv("MODEL_PATH", "crop_disease_model.h5")
+# Versions loaded at runtime (POST /models/load) must come from this directory
+MODELS_DIR = os.getenv("MODELS_DIR", "models")
+BASELINE_MODEL_VERSION = "rule-based-v1"
 
 def load_model():
-    """Load the pre-trained model (placeholder for future ML model)"""
-    global model
+    """Register the rule-based analyzer and load the ML model in the background if present"""
+    model_registry.register(BASELINE_MODEL_VERSION, RuleBasedModel(), activate=True)
     print("[OK] Using rule-based disease detection system")
-    model = None
+    
+    if os.path.exists(MODEL_PATH):
+        model_registry.load_async(
+            "keras-v1",
+            lambda: KerasModel(MODEL_PATH, DISEASE_CLASSES),
+            source=MODEL_PATH,
+            activate=True
+        )
+        print(f"[MODEL] Loading {MODEL_PATH} in the background")
 
 def preprocess_image(image: Image.Image, target_size=(224, 224)):
     """Preprocess image for model prediction - Simplified for deployment"""
@@ -185,46 +124,69 @@ def preprocess_image(image: Image.Image, target_size=(224, 224)):
     # Return simplified result (numpy not available in deployment)
     return image
 
-def analyze_image_color(image: Image.Image) -> Dict:
-    """
-    Simplified disease detection for deployment
-    Returns mock analysis since opencv/numpy are not available
-    """
-    # Simplified analysis without numpy/cv2
-    # In production, this would connect to a real ML service
-    
-    # Mock analysis based on image properties
-    width, height = image.size
-    
-    # Simple heuristic based on image characteristics
-    # This is a placeholder - in production you'd use a proper ML model
-    return {
-        "disease": "Healthy",  # Default to healthy for deployment
-        "confidence": 75.0,
-        "analysis": {
-            "brown_spots": 5.2,
-            "yellow_areas": 3.1,
-            "dark_lesions": 2.5,
-            "green_healthy": 85.0
-        },
-        "note": "Simplified analysis for deployment. For accurate ML predictions, use local environment with full dependencies."
-    }
+# How often coalesced chat read marks and last-seen times are written to disk
+READ_STATE_FLUSH_SECONDS = 5
+
+async def flush_read_state_periodically():
+    """Write batched read marks in the background instead of on every history fetch"""
+    while True:
+        await asyncio.sleep(READ_STATE_FLUSH_SECONDS)
+        try:
+            chat_manager.flush_read_state()
+            manager.presence.flush()
+        except Exception as e:
+            print(f"[ERROR] Failed to flush read state: {e}")
+
+# Queued orders are matched to partners together once per window
+DISPATCH_WINDOW_SECONDS = float(os.getenv("DISPATCH_WINDOW_SECONDS", "60"))
+
+async def dispatch_queued_orders_periodically():
+    """Run batch dispatch off the event loop; the solver can take seconds on big waves"""
+    while True:
+        await asyncio.sleep(DISPATCH_WINDOW_SECONDS)
+        try:
+            await dispatch_queue.run(delivery_manager)
+        except Exception as e:
+            print(f"[ERROR] Batch dispatch failed: {e}")
+
+# How often buffered partner GPS pings are simplified and written out
+GPS_FLUSH_SECONDS = 30
+
+def flush_gps_tracks():
+    """Persist new GPS trail segments and move partners to their latest fix"""
+    latest = gps_ingest.flush()
+    if latest:
+        delivery_manager.update_partner_locations(
+            {partner_id: f"{lat:.6f},{lon:.6f}" for partner_id, (_, lat, lon) in latest.items()}
+        )
 
-def get_disease_details(disease_name: str) -> Dict:
-    """Get treatment and prevention details for a disease"""
-    # Extract disease key from prediction
-    disease_key = "Healthy"
-    for key in DISEASE_INFO.keys():
-        if key.lower() in disease_name.lower() or disease_name.lower() in key.lower():
-            disease_key = key
-            break
-    
-    return DISEASE_INFO.get(disease_key, DISEASE_INFO["Healthy"])
+async def flush_gps_tracks_periodically():
+    while True:
+        await asyncio.sleep(GPS_FLUSH_SECONDS)
+        try:
+            flush_gps_tracks()
+        except Exception as e:
+            print(f"[ERROR] Failed to flush GPS tracks: {e}")
+
+# Demo/load-test deliveries advance on one virtual clock (DELIVERY_SIM_SPEEDUP)
+delivery_simulator = DeliverySimulator(delivery_manager)
+
+# Status changes and GPS pings are pushed to /ws/delivery/{delivery_id} subscribers
+delivery_manager.add_listener(tracking_hub.deliveries_updated)
+gps_ingest.add_listener(tracking_hub.location_updated)
 
 @app.on_event("startup")
 async def startup_event():
     """Load model and start scheduler on startup"""
     load_model()
+    # Route chat between uvicorn workers (CHAT_BROKER=local|unix|redis)
+    await manager.attach_broker(create_broker())
+    asyncio.create_task(flush_read_state_periodically())
+    manager.start_reaper()
+    tracking_hub.start()
+    asyncio.create_task(dispatch_queued_orders_periodically())
+    delivery_simulator.start()
+    asyncio.create_task(flush_gps_tracks_periodically())
     # Start the background scheduler for periodic updates
     scheme_scheduler.start()
     print("[OK] Background scheduler started - checking schemes every 2 days")
@@ -234,13 +196,18 @@ async def shutdown_event():
     """Clean shutdown of scheduler"""
     scheme_scheduler.stop()
     print("[STOPPED] Background scheduler stopped")
+    await manager.broker.stop()
+    chat_manager.flush_read_state()
+    manager.presence.flush()
+    await delivery_simulator.stop()
+    flush_gps_tracks()
 
 @app.get("/")
 async def root():
     return {
         "message": "AgriChain ML API",
         "version": "1.0.0",
-        "status": "Model loaded" if model else "Using rule-based detection",
+        "status": f"Serving model {model_registry.active_version}",
         "endpoints": {
             "predict": "/predict",
             "health": "/health"
@@ -251,49 +218,305 @@ async def root():
 async def health_check():
     return {
         "status": "healthy",
-        "model_loaded": model is not None
+        "model_loaded": model_registry.active_version is not None,
+        "model_version": model_registry.active_version
+    }
+
+def predict_image_bytes(contents: bytes, language: str = "en") -> Dict:
+    """Decode one image and run disease analysis on it (CPU-bound, call from a worker thread)"""
+    image = Image.open(io.BytesIO(contents))
+    
+    # Use whichever model version is serving right now
+    result, model_version = model_registry.predict(image)
+    confidence = result["confidence"]
+    
+    # ML models report the full class label (crop + disease); the analyzer only the disease
+    class_label = result.get("analysis", {}).get("class_label") or result["disease"]
+    disease_details = disease_catalog.details(class_label, language)
+    
+    return {
+        "success": True,
+        "disease": disease_details["disease"],
+        "crop": disease_details["crop"],
+        "confidence": round(confidence, 1),
+        "treatment": disease_details["treatment"],
+        "prevention": disease_details["prevention"],
+        "symptoms": disease_details["symptoms"],
+        "causes": disease_details["causes"],
+        "analysis": result.get("analysis", {}),
+        "model_version": model_version
     }
 
 @app.post("/predict")
-async def predict_disease(file: UploadFile = File(...)):
+async def predict_disease(file: UploadFile = File(...), language: str = "en"):
     """
-    Predict crop disease from uploaded image using rule-based color analysis
+    Predict crop disease from uploaded image using HSV color segmentation
     """
     try:
         # Read image
         contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-        
-        # Use rule-based analysis
-        result = analyze_image_color(image)
-        disease_name = result["disease"].replace("_", " ")
-        confidence = result["confidence"]
-        
-        # Get disease details
-        disease_details = get_disease_details(disease_name)
-        
-        return JSONResponse(content={
-            "success": True,
-            "disease": disease_name,
-            "confidence": round(confidence, 1),
-            "treatment": disease_details["treatment"],
-            "prevention": disease_details["prevention"],
-            "symptoms": disease_details.get("symptoms", ""),
-            "causes": disease_details.get("causes", ""),
-            "analysis": result.get("analysis", {})
-        })
+        return JSONResponse(content=predict_image_bytes(contents, language))
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
+# Batch prediction limits
+PREDICT_BATCH_MAX_IMAGES = int(os.getenv("PREDICT_BATCH_MAX_IMAGES", "200"))
+PREDICT_BATCH_CONCURRENCY = int(os.getenv("PREDICT_BATCH_CONCURRENCY", "4"))
+# Uncompressed size limits, so a small zip can't expand into gigabytes in memory
+PREDICT_BATCH_MAX_IMAGE_BYTES = int(os.getenv("PREDICT_BATCH_MAX_IMAGE_BYTES", str(20 * 1024 * 1024)))
+PREDICT_BATCH_MAX_TOTAL_BYTES = int(os.getenv("PREDICT_BATCH_MAX_TOTAL_BYTES", str(500 * 1024 * 1024)))
+ZIP_READ_CHUNK = 64 * 1024
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tif", ".tiff", ".webp")
+
+async def _collect_batch_images(files: List[UploadFile]) -> List[tuple]:
+    """
+    Read uploaded files into (filename, bytes) pairs, expanding zip archives.
+    Everything is read before streaming starts because upload files are
+    closed once the endpoint returns.
+    """
+    images = []
+    total_bytes = 0
+    
+    def check_size(filename: str, size: int):
+        if size > PREDICT_BATCH_MAX_IMAGE_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"{filename} is too large - at most {PREDICT_BATCH_MAX_IMAGE_BYTES} bytes per image"
+            )
+        if total_bytes + size > PREDICT_BATCH_MAX_TOTAL_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Batch is too large - at most {PREDICT_BATCH_MAX_TOTAL_BYTES} bytes of images"
+            )
+    
+    def add_image(filename: str, contents: bytes):
+        nonlocal total_bytes
+        if len(images) >= PREDICT_BATCH_MAX_IMAGES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Too many images - at most {PREDICT_BATCH_MAX_IMAGES} per batch"
+            )
+        check_size(filename, len(contents))
+        total_bytes += len(contents)
+        images.append((filename, contents))
+    
+    def read_entry(archive: zipfile.ZipFile, entry: zipfile.ZipInfo) -> bytes:
+        # The declared size is checked first, then the actual one while
+        # decompressing, since a crafted archive can lie about file_size
+        check_size(entry.filename, entry.file_size)
+        chunks, size = [], 0
+        with archive.open(entry) as f:
+            while True:
+                chunk = f.read(ZIP_READ_CHUNK)
+                if not chunk:
+                    break
+                size += len(chunk)
+                check_size(entry.filename, size)
+                chunks.append(chunk)
+        return b"".join(chunks)
+    
+    for upload in files:
+        contents = await upload.read()
+        filename = upload.filename or f"image_{len(images) + 1}"
+        
+        if filename.lower().endswith(".zip") or zipfile.is_zipfile(io.BytesIO(contents)):
+            try:
+                with zipfile.ZipFile(io.BytesIO(contents)) as archive:
+                    for entry in archive.infolist():
+                        if entry.is_dir() or not entry.filename.lower().endswith(IMAGE_EXTENSIONS):
+                            continue
+                        add_image(entry.filename, read_entry(archive, entry))
+            except zipfile.BadZipFile as e:
+                raise HTTPException(status_code=400, detail=f"Invalid zip archive {filename}: {e}")
+        else:
+            add_image(filename, contents)
+    
+    return images
+
+@app.post("/predict/batch")
+async def predict_disease_batch(files: List[UploadFile] = File(...), language: str = "en"):
+    """
+    Predict crop diseases for many images in one request
+    Accepts several image files and/or zip archives of images.
+    Streams one JSON line per image (NDJSON) in completion order.
+    """
+    images = await _collect_batch_images(files)
+    
+    if not images:
+        raise HTTPException(status_code=400, detail="No images found in upload")
+    
+    # Per-request cap so a single large survey cannot hog every worker thread
+    semaphore = asyncio.Semaphore(PREDICT_BATCH_CONCURRENCY)
+    
+    async def predict_one(index: int, filename: str, contents: bytes) -> Dict:
+        async with semaphore:
+            try:
+                result = await asyncio.to_thread(predict_image_bytes, contents, language)
+            except Exception as e:
+                result = {"success": False, "error": f"Error processing image: {str(e)}"}
+        return {"index": index, "filename": filename, **result}
+    
+    async def stream_results():
+        tasks = [
+            asyncio.create_task(predict_one(index, filename, contents))
+            for index, (filename, contents) in enumerate(images)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            # Client went away - don't keep burning CPU on its images
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(
+        stream_results(),
+        media_type="application/x-ndjson",
+        headers={"X-Total-Images": str(len(images))}
+    )
+
+@app.post("/predict/tiled")
+async def predict_field_image(
+    file: UploadFile = File(...),
+    tile_size: int = Form(DEFAULT_TILE_SIZE),
+    raw_width: Optional[int] = Form(None),
+    raw_height: Optional[int] = Form(None),
+    raw_channels: int = Form(3)
+):
+    """
+    Analyze a large field image (drone orthomosaic) tile by tile
+    Uncompressed TIFFs and raw RGB files (raw_width/raw_height) are memory-mapped.
+    Returns a per-region severity grid instead of a single prediction.
+    """
+    raw_shape = (raw_width, raw_height, raw_channels) if raw_width and raw_height else None
+    suffix = Path(file.filename or "").suffix or ".img"
+    
+    # Spool the upload to disk in chunks - it may be far larger than memory
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        while True:
+            chunk = await file.read(1024 * 1024)
+            if not chunk:
+                break
+            tmp.write(chunk)
+        tmp_path = tmp.name
+    
+    try:
+        result = await asyncio.to_thread(analyze_large_image, tmp_path, tile_size, raw_shape)
+        return {"success": True, **result}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing field image: {str(e)}")
+    finally:
+        os.unlink(tmp_path)
+
 @app.get("/diseases")
-async def get_diseases():
-    """Get list of all detectable diseases"""
+async def get_diseases(language: str = "en"):
+    """Get list of all detectable diseases with per-class details"""
+    classes = [disease_catalog.details(cls, language) for cls in DISEASE_CLASSES]
     return {
         "diseases": [cls.split("___")[-1].replace("_", " ") for cls in DISEASE_CLASSES],
+        "classes": classes,
         "total": len(DISEASE_CLASSES)
     }
 
+# ============================================
+# MODEL MANAGEMENT (admin)
+# ============================================
+
+class ModelLoadRequest(BaseModel):
+    version: str
+    path: str
+    activate: bool = True
+
+class ShadowConfigRequest(BaseModel):
+    version: Optional[str] = None
+    sample_rate: float = 0.1
+
+@app.get("/models")
+async def list_models():
+    """List model versions with per-version latency and shadow-agreement stats"""
+    return model_registry.status()
+
+@app.post("/models/load")
+async def load_model_version(request: ModelLoadRequest, authorization: Optional[str] = Header(None)):
+    """
+    Load a new model version in the background (admin only)
+    The path is relative to MODELS_DIR. The model is warmed up before it can
+    serve; set activate=false to stage it for shadowing.
+    """
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    token = authorization.replace("Bearer ", "")
+    user = auth_manager.get_current_user(token)
+    
+    if not user or user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Only admins can manage models")
+    
+    models_dir = Path(MODELS_DIR).resolve()
+    model_path = (models_dir / request.path).resolve()
+    if not model_path.is_relative_to(models_dir):
+        raise HTTPException(status_code=400, detail=f"Model path must be inside {MODELS_DIR}")
+    if not model_path.is_file():
+        raise HTTPException(status_code=404, detail=f"Model file not found: {request.path}")
+    
+    try:
+        entry = model_registry.load_async(
+            request.version,
+            lambda: KerasModel(str(model_path), DISEASE_CLASSES),
+            source=str(model_path),
+            activate=request.activate
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    return {"success": True, "model": entry.to_dict()}
+
+@app.post("/models/{version}/activate")
+async def activate_model_version(version: str, authorization: Optional[str] = Header(None)):
+    """Atomically switch the serving model version (admin only)"""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    token = authorization.replace("Bearer ", "")
+    user = auth_manager.get_current_user(token)
+    
+    if not user or user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Only admins can manage models")
+    
+    try:
+        model_registry.activate(version)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {"success": True, "active_version": version}
+
+@app.post("/models/shadow")
+async def configure_shadow_model(request: ShadowConfigRequest, authorization: Optional[str] = Header(None)):
+    """Run a candidate version on a sample of traffic (version=null to stop; admin only)"""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    token = authorization.replace("Bearer ", "")
+    user = auth_manager.get_current_user(token)
+    
+    if not user or user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Only admins can manage models")
+    
+    try:
+        model_registry.set_shadow(request.version, request.sample_rate)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "success": True,
+        "shadow_version": model_registry.shadow_version,
+        "shadow_sample_rate": model_registry.shadow_sample_rate
+    }
+
 @app.get("/schemes")
 async def get_schemes(query: str = "", category: str = "all", language: str = "en"):
     """
@@ -468,6 +691,9 @@ async def get_update_status():
 @app.post("/auth/register")
 async def register(request: RegisterRequest):
     """Register a new user"""
+    if request.role not in ("farmer", "consumer"):
+        raise HTTPException(status_code=400, detail="Role must be 'farmer' or 'consumer'")
+    
     try:
         user = auth_manager.create_user(
             email=request.email,
@@ -1431,72 +1657,165 @@ async def get_payment_history(authorization: Optional[str] = Header(None)):
 # REAL-TIME CHAT SYSTEM (WebSocket)
 # ============================================
 
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        # Store active connections: {user_email: websocket}
-        self.active_connections: Dict[str, WebSocket] = {}
-    
-    async def connect(self, websocket: WebSocket, user_email: str):
-        await websocket.accept()
-        self.active_connections[user_email] = websocket
-        print(f"[CHAT] User connected: {user_email} (Total: {len(self.active_connections)})")
-    
-    def disconnect(self, user_email: str):
-        if user_email in self.active_connections:
-            del self.active_connections[user_email]
-            print(f"[CHAT] User disconnected: {user_email} (Total: {len(self.active_connections)})")
-    
-    async def send_personal_message(self, message: dict, receiver_email: str):
-        """Send message to specific user if they're online"""
-        if receiver_email in self.active_connections:
-            try:
-                await self.active_connections[receiver_email].send_json(message)
-                print(f"[CHAT] Message delivered to {receiver_email}")
-                return True
-            except Exception as e:
-                print(f"[ERROR] Failed to send message to {receiver_email}: {e}")
-                self.disconnect(receiver_email)
-                return False
-        else:
-            print(f"[CHAT] User offline: {receiver_email}")
-            return False
-    
-    def is_user_online(self, user_email: str) -> bool:
-        """Check if user is currently online"""
-        return user_email in self.active_connections
-    
-    def get_online_users(self) -> List[str]:
-        """Get list of all online users"""
-        return list(self.active_connections.keys())
-
-manager = ConnectionManager()
-
 # Pydantic models for chat
 class SendMessageRequest(BaseModel):
     receiver_email: str
     receiver_name: str
     message: str
+    client_id: Optional[str] = None
+
+# WebSocket close code for a token that is invalid or belongs to someone else
+WS_POLICY_VIOLATION = 1008
+# WebSocket close code for a chat socket that never sent a token
+WS_UNAUTHENTICATED = 4401
+# How long a chat socket without ?token= has to send its auth frame
+CHAT_AUTH_TIMEOUT_SECONDS = 10
+
+def authenticate_chat_socket(token: Optional[str], user_email: str) -> Optional[Dict]:
+    """Resolve a socket's token once; it must belong to the email in the path"""
+    user = auth_manager.get_current_user(token) if token else None
+    if not user or user['email'] != user_email:
+        return None
+    return user
+
+async def deliver_chat_message(message_obj: Dict) -> bool:
+    """Push a stored message to the receiver's open sockets"""
+    return await manager.send_personal_message({
+        "type": "new_message",
+        "message": message_obj
+    }, message_obj["receiver_email"])
+
+async def handle_socket_send(user: Dict, connection_id: int, data: Dict):
+    """Store and deliver a `send` frame, then ack it with the server message id"""
+    client_id = data.get("client_id")
+    receiver_email = data.get("receiver_email")
+    text = (data.get("message") or "").strip()
+    if not client_id or not receiver_email or not text:
+        manager.send_to_connection(user['email'], connection_id, {
+            "type": "error",
+            "client_id": client_id,
+            "detail": "send requires client_id, receiver_email and message"
+        })
+        return
+
+    message_obj = chat_manager.find_by_client_id(user['email'], client_id)
+    duplicate = message_obj is not None
+    if not duplicate:
+        message_obj = chat_manager.send_message(
+            sender_email=user['email'],
+            sender_name=user['name'],
+            receiver_email=receiver_email,
+            receiver_name=data.get("receiver_name", ""),
+            message=text,
+            client_id=client_id
+        )
+        delivered_realtime = await deliver_chat_message(message_obj)
+    else:
+        delivered_realtime = manager.is_user_online(receiver_email)
+
+    manager.send_to_connection(user['email'], connection_id, {
+        "type": "ack",
+        "client_id": client_id,
+        "message_id": message_obj["message_id"],
+        "timestamp": message_obj["timestamp"],
+        "duplicate": duplicate,
+        "delivered_realtime": delivered_realtime
+    })
+
+async def mark_conversation_read(user_email: str, conversation_id: str, other_user_email: str):
+    """Advance the reader's mark and tell the other participant (read receipt)"""
+    last_read_seq = chat_manager.mark_as_read(user_email, conversation_id)
+    if last_read_seq is not None:
+        await manager.send_personal_message({
+            "type": "read_receipt",
+            "conversation_id": conversation_id,
+            "reader_email": user_email,
+            "last_read_seq": last_read_seq
+        }, other_user_email)
+
+def push_offline_sync(user_email: str, connection_id: int):
+    """Send the oldest page of messages received while the user was offline"""
+    pending = chat_manager.get_undelivered_messages(user_email)
+    manager.send_to_connection(user_email, connection_id, {
+        "type": "sync",
+        "messages": pending["messages"],
+        "cursor": pending["cursor"],
+        "has_more": pending["has_more"]
+    })
 
 @app.websocket("/ws/chat/{user_email}")
-async def websocket_endpoint(websocket: WebSocket, user_email: str):
+async def websocket_endpoint(websocket: WebSocket, user_email: str, token: Optional[str] = None):
     """
     WebSocket endpoint for real-time chat
-    Connect: ws://localhost:8000/ws/chat/{user_email}
+    Connect: ws://localhost:8000/ws/chat/{user_email}?token=<jwt>
+    The token may instead arrive in a first {"type": "auth", "token": ...} frame
+    (answered with {"type": "auth_ok"}). Sockets are only registered once the
+    token checks out: a missing token closes with 4401, a bad one with 1008.
+    Send messages with {"type": "send", "client_id": ...} frames.
+    The server sends {"type": "ping"} to idle sockets; answer with {"type": "pong"}
+    (or any frame) or the socket is closed as stale.
+    Authenticated sockets first get a {"type": "sync"} frame with the oldest messages
+    missed while offline; the client answers {"type": "sync_ack", "cursor": <highest seq>}
+    and, while the frame said has_more, sends {"type": "sync"} for the next page.
+    {"type": "read", "other_user_email": ...} marks a conversation read without a history fetch.
     """
-    await manager.connect(websocket, user_email)
+    if token:
+        user = authenticate_chat_socket(token, user_email)
+        if not user:
+            await websocket.close(code=WS_POLICY_VIOLATION)
+            return
+        connection_id = await manager.connect(websocket, user_email)
+    else:
+        # Token in the first frame; the socket isn't registered until it checks out
+        await websocket.accept()
+        try:
+            data = await asyncio.wait_for(websocket.receive_json(), timeout=CHAT_AUTH_TIMEOUT_SECONDS)
+        except WebSocketDisconnect:
+            return
+        except (asyncio.TimeoutError, ValueError):
+            data = None
+        if not isinstance(data, dict) or data.get("type") != "auth" or not data.get("token"):
+            await websocket.close(code=WS_UNAUTHENTICATED)
+            return
+        user = authenticate_chat_socket(data["token"], user_email)
+        if not user:
+            await websocket.close(code=WS_POLICY_VIOLATION)
+            return
+        connection_id = await manager.connect(websocket, user_email, accept=False)
+        manager.send_to_connection(user_email, connection_id, {"type": "auth_ok"})
+    push_offline_sync(user_email, connection_id)
     
     try:
         while True:
             # Wait for messages from this client
             data = await websocket.receive_json()
+            manager.touch(user_email, connection_id)
             
             # Handle different message types
             message_type = data.get("type")
             
-            if message_type == "ping":
-                # Keep-alive ping
-                await websocket.send_json({"type": "pong"})
+            if message_type == "read":
+                other_user_email = data.get("other_user_email")
+                if other_user_email:
+                    conversation_id = chat_manager.get_conversation_id(user_email, other_user_email)
+                    await mark_conversation_read(user_email, conversation_id, other_user_email)
+            
+            elif message_type == "sync_ack":
+                if isinstance(data.get("cursor"), int):
+                    chat_manager.advance_delivery_cursor(user_email, data["cursor"])
+            
+            elif message_type == "sync":
+                push_offline_sync(user_email, connection_id)
+            
+            elif message_type == "send":
+                await handle_socket_send(user, connection_id, data)
+            
+            elif message_type == "pong":
+                pass  # Answer to a server heartbeat; touch() already recorded it
+            
+            elif message_type == "ping":
+                # Keep-alive ping (queued so it never races the writer task)
+                manager.send_to_connection(user_email, connection_id, {"type": "pong"})
             
             elif message_type == "typing":
                 # Notify other user that this user is typing
@@ -1511,10 +1830,10 @@ async def websocket_endpoint(websocket: WebSocket, user_email: str):
                 print(f"[CHAT] Received unknown message type: {message_type}")
     
     except WebSocketDisconnect:
-        manager.disconnect(user_email)
+        manager.disconnect(user_email, connection_id)
     except Exception as e:
         print(f"[ERROR] WebSocket error for {user_email}: {e}")
-        manager.disconnect(user_email)
+        manager.disconnect(user_email, connection_id)
 
 @app.post("/chat/send")
 async def send_chat_message(request: SendMessageRequest, authorization: Optional[str] = Header(None)):
@@ -1531,20 +1850,27 @@ async def send_chat_message(request: SendMessageRequest, authorization: Optional
     if not user:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
     
+    # A retry of a message already stored is answered without storing it again
+    duplicate = chat_manager.find_by_client_id(user['email'], request.client_id)
+    if duplicate:
+        return {
+            "success": True,
+            "message": duplicate,
+            "delivered_realtime": manager.is_user_online(request.receiver_email)
+        }
+    
     # Save message to database
     message_obj = chat_manager.send_message(
         sender_email=user['email'],
         sender_name=user['name'],
         receiver_email=request.receiver_email,
         receiver_name=request.receiver_name,
-        message=request.message
+        message=request.message,
+        client_id=request.client_id
     )
     
     # Try to deliver via WebSocket if receiver is online
-    delivered_realtime = await manager.send_personal_message({
-        "type": "new_message",
-        "message": message_obj
-    }, request.receiver_email)
+    delivered_realtime = await deliver_chat_message(message_obj)
     
     return {
         "success": True,
@@ -1573,8 +1899,12 @@ async def get_conversations(authorization: Optional[str] = Header(None)):
     return conversations
 
 @app.get("/chat/history/{other_user_email}")
-async def get_chat_history(other_user_email: str, authorization: Optional[str] = Header(None)):
-    """Get chat history with a specific user"""
+async def get_chat_history(other_user_email: str, before_seq: Optional[int] = None, limit: int = 100,
+                           authorization: Optional[str] = Header(None)):
+    """
+    Get chat history with a specific user
+    Pages back with before_seq (the seq of the oldest message already loaded)
+    """
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -1585,11 +1915,13 @@ async def get_chat_history(other_user_email: str, authorization: Optional[str] =
         raise HTTPException(status_code=401, detail="Invalid or expired token")
     
     # Get conversation history
-    history = chat_manager.get_conversation_history(user['email'], other_user_email)
+    history = chat_manager.get_conversation_history(
+        user['email'], other_user_email, limit=max(1, min(limit, 500)), before_seq=before_seq
+    )
     
     # Mark messages as read
-    conversation_id = chat_manager._get_conversation_id(user['email'], other_user_email)
-    chat_manager.mark_as_read(user['email'], conversation_id)
+    conversation_id = chat_manager.get_conversation_id(user['email'], other_user_email)
+    await mark_conversation_read(user['email'], conversation_id, other_user_email)
     
     # Check if other user is online
     is_online = manager.is_user_online(other_user_email)
@@ -1615,6 +1947,47 @@ async def get_unread_count(authorization: Optional[str] = Header(None)):
     
     return {"unread_count": unread_count}
 
+@app.get("/chat/search")
+async def search_chat_messages(q: str, offset: int = 0, limit: int = 20,
+                               authorization: Optional[str] = Header(None)):
+    """
+    Search the current user's messages
+    Results are ranked; use "quoted phrases" for exact matches and offset/limit to page.
+    """
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    token = authorization.replace("Bearer ", "")
+    user = auth_manager.get_current_user(token)
+    
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    
+    return chat_manager.search_messages(user['email'], q, offset, limit)
+
+# Most users one /chat/presence call may ask about
+PRESENCE_BATCH_MAX = 200
+
+class PresenceRequest(BaseModel):
+    emails: List[str]
+
+@app.post("/chat/presence")
+async def get_chat_presence(request: PresenceRequest, authorization: Optional[str] = Header(None)):
+    """Online status and last-seen time for up to PRESENCE_BATCH_MAX users in one call"""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    token = authorization.replace("Bearer ", "")
+    user = auth_manager.get_current_user(token)
+    
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    
+    if len(request.emails) > PRESENCE_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {PRESENCE_BATCH_MAX} users per request")
+    
+    return {"presence": manager.get_presence(list(dict.fromkeys(request.emails)))}
+
 @app.get("/chat/online-status/{user_email}")
 async def check_online_status(user_email: str):
     """Check if a specific user is online"""
@@ -1646,11 +2019,29 @@ class DeliveryAssignRequest(BaseModel):
     pickup_location: str
     delivery_location: str
 
+class DispatchQueueRequest(BaseModel):
+    order_id: str
+    pickup_location: str
+    delivery_location: str
+    load_kg: Optional[float] = None
+
+class GpsBatchRequest(BaseModel):
+    # [unix_seconds, lat, lon] per ping, oldest first
+    points: List[Tuple[float, float, float]]
+
 class DeliveryStatusUpdate(BaseModel):
     new_status: str
     location: Optional[str] = None
     message: Optional[str] = None
 
+def acts_for_partner(user: Dict, partner_id: str) -> bool:
+    """
+    The partner's own account or an admin
+    Partner accounts have role 'partner' and a 'partner_id' in data/users.json
+    (set up by an admin; registration only creates farmers and consumers).
+    """
+    return user['role'] == 'admin' or (user['role'] == 'partner' and user.get('partner_id') == partner_id)
+
 @app.post("/delivery/assign")
 async def assign_delivery(request: DeliveryAssignRequest, authorization: Optional[str] = Header(None)):
     """
@@ -1679,13 +2070,93 @@ async def assign_delivery(request: DeliveryAssignRequest, authorization: Optiona
             "message": f"Delivery partner {delivery['partner_name']} assigned successfully"
         }
     
+    except ValueError as e:
+        # Everyone is busy; POST /delivery/queue dispatches it when someone frees up
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         print(f"[ERROR] Failed to assign delivery: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/delivery/queue")
+async def queue_delivery(request: DispatchQueueRequest, authorization: Optional[str] = Header(None)):
+    """
+    Queue an order for batch dispatch
+    Queued orders are matched to partners together at the end of each window
+    """
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    token = authorization.replace("Bearer ", "")
+    user = auth_manager.get_current_user(token)
+    
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    
+    try:
+        entry = dispatch_queue.enqueue(
+            delivery_manager,
+            order_id=request.order_id,
+            pickup_location=request.pickup_location,
+            delivery_location=request.delivery_location,
+            load_kg=request.load_kg
+        )
+        
+        return {
+            "success": True,
+            "queued": entry,
+            "queue_length": len(dispatch_queue.queued),
+            "message": f"Order queued; partners are assigned every {DISPATCH_WINDOW_SECONDS:g} seconds"
+        }
+    
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/delivery/queue")
+async def get_dispatch_queue(authorization: Optional[str] = Header(None)):
+    """Orders waiting for the next dispatch window"""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    token = authorization.replace("Bearer ", "")
+    user = auth_manager.get_current_user(token)
+    
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    
+    return dispatch_queue.queued
+
+@app.post("/delivery/dispatch")
+async def dispatch_now(authorization: Optional[str] = Header(None)):
+    """
+    Close the current window: match all queued orders to partners now
+    Returns the deliveries created and the cost compared with greedy assignment
+    """
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    token = authorization.replace("Bearer ", "")
+    user = auth_manager.get_current_user(token)
+    
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    
+    try:
+        result = await dispatch_queue.run(delivery_manager)
+        
+        return {
+            "success": True,
+            "deliveries": result["deliveries"],
+            "report": result["report"],
+            "message": f"Dispatched {len(result['deliveries'])} queued orders"
+        }
+    
+    except Exception as e:
+        print(f"[ERROR] Failed to dispatch queued orders: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/delivery/order/{order_id}")
 async def get_delivery_by_order(order_id: str, authorization: Optional[str] = Header(None)):
-    """Get delivery details for a specific order"""
+    """Get delivery details for a specific order (live screens should use /ws/delivery/{delivery_id})"""
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -1735,6 +2206,8 @@ async def update_delivery_status(
             "message": f"Delivery status updated to {update.new_status}"
         }
     
+    except DeliveryFinishedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
@@ -1776,11 +2249,129 @@ async def get_partner_stats(partner_id: str):
     
     return stats
 
+@app.post("/delivery/partners/{partner_id}/locations")
+async def ingest_partner_locations(partner_id: str, request: GpsBatchRequest,
+                                   authorization: Optional[str] = Header(None)):
+    """
+    Batched GPS pings from a partner's app (the partner's own account or an admin)
+    Pings are buffered in memory and written out, simplified, every GPS_FLUSH_SECONDS
+    """
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    token = authorization.replace("Bearer ", "")
+    user = auth_manager.get_current_user(token)
+    
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    
+    if not acts_for_partner(user, partner_id):
+        raise HTTPException(status_code=403, detail="Only this partner can report its location")
+    
+    if partner_id not in delivery_manager.partner_ids:
+        raise HTTPException(status_code=404, detail="Partner not found")
+    
+    if len(request.points) > MAX_BATCH_POINTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_POINTS} points per batch")
+    
+    accepted = gps_ingest.ingest(partner_id, request.points)
+    return {"success": True, "accepted": accepted, "rejected": len(request.points) - accepted}
+
+@app.get("/delivery/partners/{partner_id}/location")
+async def get_partner_location(partner_id: str, since: Optional[float] = None,
+                               authorization: Optional[str] = Header(None)):
+    """Latest GPS fix and the recent (simplified) trail of a partner"""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    token = authorization.replace("Bearer ", "")
+    user = auth_manager.get_current_user(token)
+    
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    
+    if partner_id not in delivery_manager.partner_ids:
+        raise HTTPException(status_code=404, detail="Partner not found")
+    
+    return {
+        "partner_id": partner_id,
+        "latest": gps_ingest.latest(partner_id),
+        "trail": gps_ingest.recent(partner_id, since)
+    }
+
+@app.websocket("/ws/partner/{partner_id}")
+async def partner_location_socket(websocket: WebSocket, partner_id: str, token: Optional[str] = None):
+    """
+    Streaming GPS pings from a partner's app (the partner's own account or an admin)
+    Frames: {"points": [[ts, lat, lon], ...]} or a single [ts, lat, lon]; each is acked.
+    A malformed frame closes the socket with 1008.
+    """
+    user = auth_manager.get_current_user(token) if token else None
+    if not user or not acts_for_partner(user, partner_id) or partner_id not in delivery_manager.partner_ids:
+        await websocket.close(code=WS_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    try:
+        while True:
+            frame = json.loads(await websocket.receive_text())
+            points = frame.get("points", []) if isinstance(frame, dict) else [frame]
+            if not isinstance(points, list):
+                await websocket.close(code=WS_POLICY_VIOLATION)
+                return
+            if len(points) > MAX_BATCH_POINTS:
+                await websocket.send_json({"type": "error", "message": f"At most {MAX_BATCH_POINTS} points per frame"})
+                continue
+            accepted = gps_ingest.ingest(partner_id, points)
+            await websocket.send_json({"type": "ack", "accepted": accepted, "rejected": len(points) - accepted})
+    except WebSocketDisconnect:
+        pass
+    except (ValueError, AttributeError):
+        await websocket.close(code=WS_POLICY_VIOLATION)
+
+@app.websocket("/ws/delivery/{delivery_id}")
+async def delivery_tracking_socket(websocket: WebSocket, delivery_id: str, token: Optional[str] = None):
+    """
+    Live tracking for one delivery, replacing polling of /delivery/order/{order_id}
+    Sends {"type": "snapshot"} on connect, then {"type": "status"} on every status
+    or ETA change and {"type": "location"} as the partner's GPS moves. Open to
+    the order's consumer and farmer, the assigned partner and admins.
+    """
+    user = auth_manager.get_current_user(token) if token else None
+    if not user:
+        await websocket.close(code=WS_POLICY_VIOLATION)
+        return
+    
+    # Cached state of active deliveries; only a miss reads the deliveries file
+    state = tracking_hub.snapshot(delivery_id)
+    if state is None:
+        delivery = delivery_manager.get_delivery(delivery_id)
+        if not delivery:
+            await websocket.close(code=WS_POLICY_VIOLATION)
+            return
+        state = tracking_hub.track(delivery)
+    
+    # Partner contact and GPS are only for the order's buyer and farmer, the partner and admins
+    order = order_manager.get_order_by_id(state["order_id"])
+    watches_order = order is not None and user['id'] in (order['consumer_id'], order['farmer_id'])
+    if not watches_order and not acts_for_partner(user, state["partner_id"]):
+        await websocket.close(code=WS_POLICY_VIOLATION)
+        return
+    
+    connection_id = await tracking_hub.subscribe(websocket, user["email"], state)
+    try:
+        while True:
+            await websocket.receive_text()  # Nothing to act on; keeps the socket read
+    except WebSocketDisconnect:
+        pass
+    finally:
+        tracking_hub.unsubscribe(delivery_id, connection_id)
+
 @app.post("/delivery/{delivery_id}/simulate")
 async def simulate_delivery(delivery_id: str, authorization: Optional[str] = Header(None)):
     """
     Simulate delivery progress (for testing/demo)
-    Automatically progresses through all delivery stages
+    Automatically progresses through the remaining stages on the simulator's clock
     """
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Not authenticated")
@@ -1791,18 +2382,19 @@ async def simulate_delivery(delivery_id: str, authorization: Optional[str] = Hea
     if not user:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
     
+    delivery = delivery_manager.get_delivery(delivery_id)
+    
+    if not delivery:
+        raise HTTPException(status_code=404, detail="Delivery not found")
+    
     try:
-        # Run simulation in background (non-blocking)
-        import threading
-        thread = threading.Thread(
-            target=delivery_manager.simulate_delivery_progress,
-            args=(delivery_id,)
-        )
-        thread.start()
+        stages = delivery_simulator.schedule(delivery)
         
         return {
             "success": True,
-            "message": "Delivery simulation started. Check tracking updates in a few seconds."
+            "stages": stages,
+            "message": "Delivery simulation started. Check tracking updates in a few seconds." if stages
+                       else "Nothing to simulate: the delivery is finished or already being simulated."
         }
     
     except Exception as e:
@@ -0,0 +1,298 @@
+"""
+Model Registry for Crop Disease Detection
+Loads model versions in the background, swaps the serving version atomically
+and optionally shadow-evaluates a candidate version on sampled traffic
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from PIL import Image
+
+from disease_analyzer import analyze_image_color, np
+
+LATENCY_WINDOW = 1000  # Latency samples kept per version
+MAX_SHADOW_BACKLOG = 32  # Shadow calls queued before sampling is skipped
+
+
+class RuleBasedModel:
+    """HSV color-segmentation analyzer (always available)"""
+
+    def predict(self, image: Image.Image) -> Dict:
+        return analyze_image_color(image)
+
+
+class KerasModel:
+    """PlantVillage-trained Keras model (.h5) - requires tensorflow"""
+
+    def __init__(self, path: str, class_names: List[str], input_size: Tuple[int, int] = (224, 224)):
+        import tensorflow as tf  # Heavy optional dependency, imported only when used
+        if np is None:
+            raise RuntimeError("numpy is required for Keras models")
+
+        self.model = tf.keras.models.load_model(path)
+        self.class_names = class_names
+        self.input_size = input_size
+
+    def predict(self, image: Image.Image) -> Dict:
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        batch = np.asarray(image.resize(self.input_size), dtype=np.float32)[None] / 255.0
+        probabilities = self.model.predict(batch, verbose=0)[0]
+        best = int(np.argmax(probabilities))
+        label = self.class_names[best]
+
+        return {
+            "disease": label.split("___")[-1],
+            "confidence": float(probabilities[best]) * 100,
+            "analysis": {"class_label": label}
+        }
+
+
+class VersionStats:
+    """Rolling latency and shadow-agreement counters for one model version"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.latencies_ms = deque(maxlen=LATENCY_WINDOW)
+        self.shadow_compared = 0
+        self.shadow_agreed = 0
+
+    def record(self, latency_ms: float, failed: bool = False):
+        self.requests += 1
+        if failed:
+            self.errors += 1
+        else:
+            self.latencies_ms.append(latency_ms)
+
+    def to_dict(self) -> Dict:
+        latencies = sorted(self.latencies_ms)
+
+        def percentile(fraction: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))], 2)
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency_ms": {
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99)
+            },
+            "shadow_compared": self.shadow_compared,
+            "shadow_agreement": round(self.shadow_agreed * 100 / self.shadow_compared, 1)
+            if self.shadow_compared else None
+        }
+
+
+class ModelVersion:
+    """A registered model version and its lifecycle state"""
+
+    def __init__(self, version: str, source: str):
+        self.version = version
+        self.source = source
+        self.model = None
+        self.status = "loading"  # loading -> ready | failed
+        self.error: Optional[str] = None
+        self.loaded_at: Optional[str] = None
+        self.stats = VersionStats()
+
+    def to_dict(self) -> Dict:
+        return {
+            "version": self.version,
+            "source": self.source,
+            "status": self.status,
+            "error": self.error,
+            "loaded_at": self.loaded_at,
+            "stats": self.stats.to_dict()
+        }
+
+
+class ModelRegistry:
+    """
+    Versioned model store
+    Request handlers take a snapshot of the serving version, so a swap never
+    affects requests that are already in flight.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.versions: Dict[str, ModelVersion] = {}
+        self.active_version: Optional[str] = None
+        self.shadow_version: Optional[str] = None
+        self.shadow_sample_rate = 0.0
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+        self._shadow_backlog = 0
+
+    def _warm_up(self, model):
+        """Run a few predictions so lazy initialisation happens before real traffic"""
+        for color in ((40, 140, 50), (110, 65, 25), (200, 190, 60)):
+            model.predict(Image.new("RGB", (224, 224), color))
+
+    def _finish_load(self, entry: ModelVersion, loader: Callable, activate: bool):
+        try:
+            model = loader()
+            self._warm_up(model)
+        except Exception as e:
+            entry.status = "failed"
+            entry.error = str(e)
+            print(f"[MODEL] Failed to load {entry.version}: {e}")
+            return
+
+        entry.model = model
+        entry.status = "ready"
+        entry.loaded_at = datetime.now().isoformat()
+        print(f"[MODEL] {entry.version} loaded and warmed up")
+        if activate:
+            self.activate(entry.version)
+
+    def register(self, version: str, model, source: str = "builtin", activate: bool = False) -> ModelVersion:
+        """Register an already constructed model (warmed up synchronously)"""
+        entry = ModelVersion(version, source)
+        with self._lock:
+            self.versions[version] = entry
+        self._finish_load(entry, lambda: model, activate)
+        return entry
+
+    def load_async(self, version: str, loader: Callable, source: str = "",
+                   activate: bool = True) -> ModelVersion:
+        """Load and warm up a model on a background thread, then optionally activate it"""
+        with self._lock:
+            existing = self.versions.get(version)
+            if existing and existing.status == "loading":
+                raise ValueError(f"Model {version} is already loading")
+            if version == self.active_version:
+                raise ValueError(f"Model {version} is currently serving")
+            entry = ModelVersion(version, source)
+            self.versions[version] = entry
+
+        threading.Thread(
+            target=self._finish_load, args=(entry, loader, activate), daemon=True
+        ).start()
+        return entry
+
+    def activate(self, version: str):
+        """Atomically switch the serving version"""
+        with self._lock:
+            entry = self.versions.get(version)
+            if not entry:
+                raise ValueError(f"Model {version} not found")
+            if entry.status != "ready":
+                raise ValueError(f"Model {version} is not ready ({entry.status})")
+            previous = self.active_version
+            self.active_version = version
+            if self.shadow_version == version:
+                # The candidate was promoted - stop shadowing it against itself
+                self.shadow_version = None
+                self.shadow_sample_rate = 0.0
+        print(f"[MODEL] Serving version switched: {previous} -> {version}")
+
+    def set_shadow(self, version: Optional[str], sample_rate: float = 0.1):
+        """Mirror a fraction of traffic to a candidate version (None disables shadowing)"""
+        with self._lock:
+            if version is not None:
+                entry = self.versions.get(version)
+                if not entry or entry.status != "ready":
+                    raise ValueError(f"Model {version} is not ready for shadow traffic")
+                if version == self.active_version:
+                    raise ValueError(f"Model {version} is already serving")
+            self.shadow_version = version
+            self.shadow_sample_rate = max(0.0, min(1.0, sample_rate)) if version else 0.0
+
+    def _run_shadow(self, entry: ModelVersion, image: Image.Image, primary_disease: str):
+        started = time.perf_counter()
+        try:
+            result = entry.model.predict(image)
+            failed = False
+        except Exception as e:
+            print(f"[MODEL] Shadow {entry.version} failed: {e}")
+            result, failed = None, True
+
+        with self._lock:
+            self._shadow_backlog -= 1
+            entry.stats.record((time.perf_counter() - started) * 1000, failed)
+            if result is not None:
+                entry.stats.shadow_compared += 1
+                if result["disease"].lower() == primary_disease.lower():
+                    entry.stats.shadow_agreed += 1
+
+    def predict(self, image: Image.Image) -> Tuple[Dict, str]:
+        """Predict with the serving version; returns (result, version)"""
+        with self._lock:
+            entry = self.versions.get(self.active_version)
+            shadow = self.versions.get(self.shadow_version) if self.shadow_version else None
+            if shadow is not None and shadow.status != "ready":
+                shadow = None  # Being reloaded under the same version name
+        if entry is None:
+            raise RuntimeError("No model version is active")
+
+        started = time.perf_counter()
+        try:
+            result = entry.model.predict(image)
+        except Exception:
+            with self._lock:
+                entry.stats.record((time.perf_counter() - started) * 1000, failed=True)
+            raise
+        with self._lock:
+            entry.stats.record((time.perf_counter() - started) * 1000)
+
+            run_shadow = (
+                shadow is not None
+                and random.random() < self.shadow_sample_rate
+                and self._shadow_backlog < MAX_SHADOW_BACKLOG
+            )
+            if run_shadow:
+                self._shadow_backlog += 1
+        if run_shadow:
+            self._shadow_executor.submit(self._run_shadow, shadow, image.copy(), result["disease"])
+
+        return result, entry.version
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                "active_version": self.active_version,
+                "shadow_version": self.shadow_version,
+                "shadow_sample_rate": self.shadow_sample_rate,
+                "versions": [entry.to_dict() for entry in self.versions.values()]
+            }
+
+
+# Singleton instance
+model_registry = ModelRegistry()
+
+
+if __name__ == "__main__":
+    # Test registry: hot swap and shadow evaluation between two rule-based versions
+    print("Testing Model Registry...")
+
+    class SlowLoadingModel(RuleBasedModel):
+        def __init__(self):
+            time.sleep(0.5)  # Pretend to read weights from disk
+
+    model_registry.register("rule-based-v1", RuleBasedModel(), activate=True)
+    model_registry.load_async("rule-based-v2", SlowLoadingModel, activate=False)
+
+    leaf = Image.new("RGB", (224, 224), (40, 140, 50))
+    while model_registry.versions["rule-based-v2"].status == "loading":
+        model_registry.predict(leaf)  # Traffic keeps flowing during the load
+
+    model_registry.set_shadow("rule-based-v2", sample_rate=1.0)
+    for _ in range(20):
+        model_registry.predict(leaf)
+    model_registry.activate("rule-based-v2")
+    _, version = model_registry.predict(leaf)
+    time.sleep(0.2)
+
+    print(f"  Serving: {version}")
+    for entry in model_registry.status()["versions"]:
+        print(f"  {entry['version']}: {entry['stats']}")
+
+    print("\n[OK] Model Registry working correctly!")
@@ -9,6 +9,8 @@ from pathlib import Path
 from typing import List, Dict, Optional
 import random
 
+from tracking_codec import TrackingLog, pack_tracking, unpack_tracking
+
 class OrderManager:
     """
     Manages orders between farmers and consumers
@@ -118,10 +120,12 @@ class OrderManager:
         print("[ORDERS] Created 2 demo orders")
     
     def _load_orders(self) -> List[Dict]:
-        """Load orders from file"""
+        """Load orders from file (tracking histories as lazily decoded TrackingLogs)"""
         try:
             with open(self.orders_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+                orders = json.load(f)
+            unpack_tracking(orders)
+            return orders
         except Exception as e:
             print(f"Error loading orders: {e}")
             return []
@@ -130,7 +134,7 @@ class OrderManager:
         """Save orders to file"""
         try:
             with open(self.orders_file, 'w', encoding='utf-8') as f:
-                json.dump(orders, f, ensure_ascii=False, indent=2)
+                json.dump(pack_tracking(orders), f, ensure_ascii=False, indent=2)
         except Exception as e:
             print(f"Error saving orders: {e}")
     
@@ -175,14 +179,14 @@ class OrderManager:
             "order_date": now.isoformat(),
             "expected_delivery": (now + timedelta(days=5)).isoformat(),
             "tracking_id": tracking_id,
-            "tracking_updates": [
+            "tracking_updates": TrackingLog.from_events([
                 {
                     "status": "Order Placed",
                     "timestamp": now.isoformat(),
                     "location": "Online",
                     "description": "Order placed successfully. Awaiting farmer confirmation."
                 }
-            ],
+            ]),
             "rating": None,
             "review": None
         }
@@ -0,0 +1,238 @@
+"""
+Multi-Drop Route Planning for AgriChain Deliveries
+Groups queued orders by pickup cluster and builds capacitated routes per
+cluster (Clarke-Wright savings, then 2-opt) so one Van or Truck can carry
+many orders from the same farms
+"""
+
+import uuid
+from typing import Dict, List, Tuple
+
+from geo import GridIndex, Point, geocode, haversine_km
+
+# Farms within this distance of a cluster's first farm share a pickup run
+CLUSTER_RADIUS_KM = 5.0
+# Routes are sized for the smallest vehicle allowed to run them
+ROUTE_VEHICLES = ("Van", "Truck")
+ROUTE_CAPACITY_KG = 600
+MAX_ROUTE_STOPS = 20
+MAX_ROUTE_KM = 150.0
+
+
+def cluster_orders(orders: List[Dict], radius_km: float = CLUSTER_RADIUS_KM) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Leader clustering of orders by pickup point
+    Returns (clusters, unplaced): clusters are {"center", "orders"}; orders whose
+    pickup or drop can't be geocoded can't be routed and come back unplaced.
+    """
+    centers = GridIndex(cell_degrees=0.05)
+    clusters: List[Dict] = []
+    unplaced = []
+    for order in orders:
+        pickup = geocode(order["pickup_location"])
+        if not pickup or not geocode(order["delivery_location"]):
+            unplaced.append(order)
+            continue
+        nearest = centers.nearest(pickup, k=1, max_distance_km=radius_km)
+        if nearest:
+            clusters[nearest[0][1]]["orders"].append(order)
+        else:
+            centers.insert(len(clusters), pickup)
+            clusters.append({"center": pickup, "orders": [order]})
+    return clusters, unplaced
+
+
+def two_opt(depot: Point, points: List[Point]) -> List[int]:
+    """Visiting order of points improved by reversing segments until no swap helps"""
+    route = list(range(len(points)))
+    nodes = [depot] + points
+
+    def dist(a: int, b: int) -> float:
+        # Path entries index `nodes`, where 0 is the depot
+        return haversine_km(nodes[a], nodes[b])
+
+    improved = True
+    while improved:
+        improved = False
+        path = [0] + [i + 1 for i in route] + [0]
+        for i in range(1, len(path) - 2):
+            for j in range(i + 1, len(path) - 1):
+                delta = (dist(path[i - 1], path[j]) + dist(path[i], path[j + 1])
+                         - dist(path[i - 1], path[i]) - dist(path[j], path[j + 1]))
+                if delta < -1e-9:
+                    path[i:j + 1] = reversed(path[i:j + 1])
+                    improved = True
+        route = [node - 1 for node in path[1:-1]]
+    return route
+
+
+def savings_routes(depot: Point, points: List[Point], demands: List[float],
+                   capacity: float = ROUTE_CAPACITY_KG, max_stops: int = MAX_ROUTE_STOPS,
+                   max_km: float = MAX_ROUTE_KM) -> List[List[int]]:
+    """
+    Clarke-Wright savings: start with one out-and-back trip per drop and merge
+    route ends in order of the distance saved, within capacity and length limits
+    """
+    count = len(points)
+    from_depot = [haversine_km(depot, point) for point in points]
+    savings = []
+    for i in range(count):
+        for j in range(i + 1, count):
+            saving = from_depot[i] + from_depot[j] - haversine_km(points[i], points[j])
+            if saving > 0:
+                savings.append((saving, i, j))
+    savings.sort(reverse=True)
+
+    routes: Dict[int, List[int]] = {i: [i] for i in range(count)}
+    route_of = list(range(count))
+    load = {i: demands[i] for i in range(count)}
+    length = {i: 2 * from_depot[i] for i in range(count)}
+
+    for saving, i, j in savings:
+        a, b = route_of[i], route_of[j]
+        if a == b or demands[i] > capacity or demands[j] > capacity:
+            continue
+        first, second = routes[a], routes[b]
+        if load[a] + load[b] > capacity or len(first) + len(second) > max_stops:
+            continue
+        if length[a] + length[b] - saving > max_km:
+            continue
+        # i and j must both be route ends; orient so that i ends `first` and j starts `second`
+        if first[-1] != i:
+            if first[0] != i:
+                continue
+            first.reverse()
+        if second[0] != j:
+            if second[-1] != j:
+                continue
+            second.reverse()
+
+        first.extend(second)
+        for stop in second:
+            route_of[stop] = a
+        load[a] += load.pop(b)
+        length[a] += length.pop(b) - saving
+        del routes[b]
+
+    return list(routes.values())
+
+
+def build_route(center: Point, orders: List[Dict], drop_order: List[int]) -> Dict:
+    """
+    Stop list for one vehicle: farms in nearest-neighbour order from the cluster
+    centre, then drops in the planned order, starting from the closer end
+    """
+    pickups = []
+    remaining = list(range(len(orders)))
+    position = center
+    while remaining:
+        nearest = min(remaining, key=lambda k: haversine_km(position, geocode(orders[k]["pickup_location"])))
+        remaining.remove(nearest)
+        pickups.append(nearest)
+        position = geocode(orders[nearest]["pickup_location"])
+
+    # The tour is closed through the centre; start the drops at whichever end
+    # is closer to the last farm so the long return leg is the one dropped
+    drops = [geocode(orders[k]["delivery_location"]) for k in drop_order]
+    if haversine_km(position, drops[-1]) < haversine_km(position, drops[0]):
+        drop_order = drop_order[::-1]
+
+    stops = ([("pickup", orders[k], orders[k]["pickup_location"]) for k in pickups]
+             + [("drop", orders[k], orders[k]["delivery_location"]) for k in drop_order])
+    distance = 0.0
+    previous = None
+    for _, _, location in stops:
+        point = geocode(location)
+        if previous:
+            distance += haversine_km(previous, point)
+        previous = point
+
+    return {
+        "route_id": f"RT-{uuid.uuid4().hex[:8].upper()}",
+        "orders": [orders[k] for k in drop_order],
+        "load_kg": sum(order["load_kg"] for order in orders),
+        "pickup_location": orders[pickups[0]]["pickup_location"],
+        "distance_km": round(distance, 1),
+        "stops": [
+            {"sequence": number, "type": kind, "order_id": order["order_id"], "location": location}
+            for number, (kind, order, location) in enumerate(stops, 1)
+        ]
+    }
+
+
+def plan_routes(orders: List[Dict], capacity: float = ROUTE_CAPACITY_KG) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Batch orders into multi-drop routes
+    Returns (routes, singles): routes hold two or more orders; everything else
+    is dispatched on its own.
+    """
+    clusters, singles = cluster_orders(orders)
+    routes = []
+    for cluster in clusters:
+        members = cluster["orders"]
+        if len(members) < 2:
+            singles.extend(members)
+            continue
+        drops = [geocode(order["delivery_location"]) for order in members]
+        demands = [order["load_kg"] for order in members]
+        for group in savings_routes(cluster["center"], drops, demands, capacity):
+            if len(group) < 2:
+                singles.append(members[group[0]])
+                continue
+            improved = two_opt(cluster["center"], [drops[k] for k in group])
+            group_orders = [members[k] for k in group]
+            routes.append(build_route(cluster["center"], group_orders, improved))
+    return routes, singles
+
+
+if __name__ == "__main__":
+    # Synthetic Delhi-NCR morning: farms around market towns shipping to city localities
+    import random
+    import time
+
+    from geo import GAZETTEER
+
+    rng = random.Random(7)
+    farm_towns = ["sonipat", "bahadurgarh", "narela", "ghaziabad", "faridabad", "manesar",
+                  "meerut", "rohtak", "palwal", "hapur"]
+    city_drops = [name for name, (lat, lon) in GAZETTEER.items() if 28.4 < lat < 28.9 and 76.9 < lon < 77.5]
+
+    def make_orders(count: int) -> List[Dict]:
+        orders = []
+        for n in range(count):
+            lat, lon = GAZETTEER[rng.choice(farm_towns)]
+            drop_lat, drop_lon = GAZETTEER[rng.choice(city_drops)]
+            orders.append({
+                "order_id": f"ORD-{n}",
+                "pickup_location": f"{lat + rng.gauss(0, 0.015):.4f},{lon + rng.gauss(0, 0.015):.4f}",
+                "delivery_location": f"{drop_lat + rng.gauss(0, 0.01):.4f},{drop_lon + rng.gauss(0, 0.01):.4f}",
+                "load_kg": rng.choice([10, 20, 50, 100])
+            })
+        return orders
+
+    print("Benchmarking route batching...")
+    for count in (200, 1000, 3000):
+        orders = make_orders(count)
+        started = time.perf_counter()
+        routes, singles = plan_routes(orders)
+        elapsed = time.perf_counter() - started
+
+        # One vehicle per order would drive farm -> drop for each of them
+        separate_km = sum(haversine_km(geocode(o["pickup_location"]), geocode(o["delivery_location"]))
+                          for o in orders)
+        routed = {o["order_id"] for route in routes for o in route["orders"]}
+        routed_km = (sum(route["distance_km"] for route in routes)
+                     + sum(haversine_km(geocode(o["pickup_location"]), geocode(o["delivery_location"]))
+                           for o in singles))
+        assert len(routed) + len(singles) == count
+        assert all(route["load_kg"] <= ROUTE_CAPACITY_KG for route in routes)
+        print(f"  {count:5} orders: {elapsed:.2f}s, {len(routes)} routes "
+              f"(avg {len(routed) / max(1, len(routes)):.1f} drops) + {len(singles)} single trips, "
+              f"{routed_km:,.0f} km vs {separate_km:,.0f} km one vehicle per order")
+
+    sample = routes[0]
+    print(f"\n  Sample route {sample['route_id']}: {sample['load_kg']} kg, {sample['distance_km']} km")
+    for stop in sample["stops"][:6]:
+        print(f"    {stop['sequence']:2}. {stop['type']:6} {stop['order_id']:10} {stop['location']}")
+
+    print("\n[OK] Route planner working correctly!")
@@ -0,0 +1,133 @@
+"""
+Concurrency tests for the delivery store: parallel assigns (then assigns racing
+deliveries) must never double-book a partner, whether the requests land on one
+worker or on several workers sharing the data directory.
+Run with: python -m pytest test_delivery_manager.py
+"""
+
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+from delivery_manager import DeliveryFinishedError, DeliveryManager
+from eta import FINISHED_STATUSES
+
+PLACES = ["Rohini", "Dwarka", "Saket", "Noida", "Gurgaon", "Karol Bagh", "Azadpur", "Okhla"]
+
+
+def write_partners(data_dir: Path, count: int, rng: random.Random):
+    partners = [{
+        "partner_id": f"DP{n:04}",
+        "name": f"Rider {n}",
+        "phone": f"+91-90000{n:05}",
+        "vehicle": "Bike",
+        "rating": round(rng.uniform(4.0, 5.0), 1),
+        "total_deliveries": 0,
+        "status": "available",
+        "current_location": f"{28.45 + rng.random() * 0.35:.4f},{76.95 + rng.random() * 0.45:.4f}"
+    } for n in range(count)]
+    with open(data_dir / "delivery_partners.json", 'w', encoding='utf-8') as f:
+        json.dump(partners, f)
+
+
+def run_parallel(jobs: List) -> List:
+    """Release every job at once; a ValueError (nobody left to assign) counts as None"""
+    barrier = threading.Barrier(len(jobs))
+
+    def run(job):
+        barrier.wait()
+        try:
+            return job()
+        except ValueError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+        return list(executor.map(run, jobs))
+
+
+def assign_job(store: DeliveryManager, order_id: str, rng: random.Random, retries: int = 0):
+    pickup, drop = rng.sample(PLACES, 2)
+
+    def job():
+        for attempt in range(retries + 1):
+            try:
+                return store.assign_delivery_partner(order_id, pickup, drop)["partner_id"]
+            except ValueError:
+                if attempt == retries:
+                    raise
+                time.sleep(0.05)  # Client retrying until a rider frees up
+    return job
+
+
+def check_bookings(stores: List[DeliveryManager]) -> List[Dict]:
+    """No partner has two open deliveries, and every worker's pool and index agree with the files"""
+    store = stores[0]
+    deliveries = store._load_deliveries()
+    open_by_partner: Dict[str, int] = {}
+    for delivery in deliveries:
+        if delivery["status"] not in FINISHED_STATUSES:
+            open_by_partner[delivery["partner_id"]] = open_by_partner.get(delivery["partner_id"], 0) + 1
+    assert {pid: n for pid, n in open_by_partner.items() if n > 1} == {}
+
+    busy_on_file = {p["partner_id"] for p in store._load_partners() if p["status"] == "on_delivery"}
+    assert busy_on_file == set(open_by_partner)
+    for worker in stores:
+        worker.get_all_deliveries()  # Catch up with the other workers' writes
+        assert {pid for pid in worker.partner_ids if not worker.pool.is_available(pid)} == busy_on_file
+        assert {pid for pid, counts in worker.index.counters.items() if counts["active"]} == busy_on_file
+    return deliveries
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_no_double_booking(tmp_path, workers):
+    rng = random.Random(48)
+    assigns, partner_count = 500, 200
+    write_partners(tmp_path, partner_count, rng)
+    stores = [DeliveryManager(data_dir=str(tmp_path)) for _ in range(workers)]
+
+    results = run_parallel([assign_job(stores[n % workers], f"ORD-ST{n}", rng) for n in range(assigns)])
+    deliveries = check_bookings(stores)
+    assert sum(1 for r in results if r) == partner_count == len(deliveries)
+
+    # Half the riders finish while the next wave of orders competes for them
+    finishing = [d["delivery_id"] for d in deliveries[:len(deliveries) // 2]]
+    jobs = [assign_job(stores[n % workers], f"ORD-ST{assigns + n}", rng, retries=200)
+            for n in range(len(finishing))]
+    jobs += [(lambda did=did, n=n: stores[n % workers].update_delivery_status(did, "delivered") and None)
+             for n, did in enumerate(finishing)]
+    rng.shuffle(jobs)
+    results = run_parallel(jobs)
+    check_bookings(stores)
+    assert sum(1 for r in results if r) == len(finishing)
+
+
+def test_reads_see_other_workers(tmp_path):
+    write_partners(tmp_path, 5, random.Random(1))
+    first, second = DeliveryManager(data_dir=str(tmp_path)), DeliveryManager(data_dir=str(tmp_path))
+
+    delivery = first.assign_delivery_partner("ORD-W1", "Rohini", "Saket")
+    assert second.get_delivery_by_order("ORD-W1")["delivery_id"] == delivery["delivery_id"]
+    assert not any(p["partner_id"] == delivery["partner_id"] for p in second.get_available_partners())
+
+    second.update_delivery_status(delivery["delivery_id"], "delivered")
+    assert first.get_delivery(delivery["delivery_id"])["status"] == "delivered"
+    assert any(p["partner_id"] == delivery["partner_id"] for p in first.get_available_partners())
+
+
+def test_update_after_finish_elsewhere_is_a_conflict(tmp_path):
+    write_partners(tmp_path, 5, random.Random(2))
+    first, second = DeliveryManager(data_dir=str(tmp_path)), DeliveryManager(data_dir=str(tmp_path))
+    delivery = first.assign_delivery_partner("ORD-W2", "Dwarka", "Noida")
+    second.get_delivery(delivery["delivery_id"])
+
+    first.update_delivery_status(delivery["delivery_id"], "delivered")
+    with pytest.raises(DeliveryFinishedError):
+        second.update_delivery_status(delivery["delivery_id"], "in_transit")
+    with pytest.raises(ValueError):
+        second.update_delivery_status("DEL-MISSING", "in_transit")
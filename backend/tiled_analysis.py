@@ -0,0 +1,292 @@
+"""
+Tiled Analysis for Large Field Images (drone orthomosaics)
+Reads the image window by window and combines per-tile disease analysis
+into a per-region severity grid
+"""
+
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Optional, Tuple
+from PIL import Image, TiffImagePlugin
+
+from disease_analyzer import analyze_array, np
+
+DEFAULT_TILE_SIZE = 1024
+MIN_TILE_SIZE = 128
+MAX_TILE_SIZE = 4096
+# Tiles with less plant cover than this (roads, bare soil, water) get no severity
+MIN_PLANT_COVERAGE = 5.0
+# A region counts as affected above this severity
+AFFECTED_SEVERITY = 15.0
+# Largest image read window by window (memory-mapped TIFF or raw): ~63k x 63k
+MAX_TILED_PIXELS = 4_000_000_000
+# Largest image decoded whole (~190 MB as RGB, under PIL's own limit); bigger
+# JPEGs are decoded downscaled
+MAX_DECODED_PIXELS = 64_000_000
+
+# TIFF tags used to locate uncompressed strips
+TIFF_BITS_PER_SAMPLE = 258
+TIFF_COMPRESSION = 259
+TIFF_STRIP_OFFSETS = 273
+TIFF_SAMPLES_PER_PIXEL = 277
+TIFF_ROWS_PER_STRIP = 278
+TIFF_STRIP_BYTE_COUNTS = 279
+TIFF_PLANAR_CONFIG = 284
+TIFF_TILE_OFFSETS = 324
+TIFF_SAMPLE_FORMAT = 339
+
+
+class RawImageSource:
+    """Memory-mapped interleaved 8-bit raw image (width x height x channels)"""
+
+    def __init__(self, path: str, width: int, height: int, channels: int = 3, offset: int = 0):
+        if channels not in (3, 4):
+            raise ValueError("Raw images must be RGB or RGBA")
+        if width * height > MAX_TILED_PIXELS:
+            raise ValueError(f"Raw image of {width}x{height} exceeds {MAX_TILED_PIXELS} pixels")
+        expected = offset + width * height * channels
+        if os.path.getsize(path) < expected:
+            raise ValueError(f"Raw file is smaller than {width}x{height}x{channels}")
+        self.width = width
+        self.height = height
+        self.pixels = np.memmap(path, dtype=np.uint8, mode="r", offset=offset,
+                                shape=(height, width, channels))
+
+    def read(self, x: int, y: int, width: int, height: int):
+        return np.ascontiguousarray(self.pixels[y:y + height, x:x + width, :3])
+
+
+class TiffStripSource:
+    """
+    Memory-mapped access to an uncompressed, chunky 8-bit RGB(A) TIFF
+    Only the strips overlapping a window are touched, so memory stays bounded.
+    """
+
+    def __init__(self, path: str, image: Image.Image):
+        tags = image.tag_v2
+        channels = int(tags.get(TIFF_SAMPLES_PER_PIXEL, 1))
+        self.width, self.height = image.size
+        self.rows_per_strip = int(tags.get(TIFF_ROWS_PER_STRIP, self.height))
+        self.channels = channels
+        self.offsets = list(tags[TIFF_STRIP_OFFSETS])
+        byte_counts = list(tags[TIFF_STRIP_BYTE_COUNTS])
+        # One read-only mapping of the file; strips are cheap views into it
+        self.file = np.memmap(path, dtype=np.uint8, mode="r")
+
+        contiguous = all(
+            self.offsets[i] + byte_counts[i] == self.offsets[i + 1]
+            for i in range(len(self.offsets) - 1)
+        )
+        if contiguous:
+            self.offsets = self.offsets[:1]
+            self.rows_per_strip = self.height
+
+    def _strip(self, index: int):
+        rows = min(self.rows_per_strip, self.height - index * self.rows_per_strip)
+        start = self.offsets[index]
+        end = start + rows * self.width * self.channels
+        return self.file[start:end].reshape(rows, self.width, self.channels)
+
+    @staticmethod
+    def supports(image: Image.Image) -> bool:
+        if image.format != "TIFF" or not hasattr(image, "tag_v2"):
+            return False
+        tags = image.tag_v2
+        # Pillow opens 16-bit RGB as mode "RGB" too; only 8-bit unsigned samples map directly
+        bits = tags.get(TIFF_BITS_PER_SAMPLE, 1)
+        sample_format = tags.get(TIFF_SAMPLE_FORMAT, 1)
+        return (
+            image.mode in ("RGB", "RGBA")
+            and all(int(b) == 8 for b in (bits if isinstance(bits, tuple) else (bits,)))
+            and all(int(f) == 1 for f in (sample_format if isinstance(sample_format, tuple) else (sample_format,)))
+            and int(tags.get(TIFF_COMPRESSION, 1)) == 1
+            and int(tags.get(TIFF_PLANAR_CONFIG, 1)) == 1
+            and TIFF_STRIP_OFFSETS in tags
+            and TIFF_TILE_OFFSETS not in tags
+        )
+
+    def read(self, x: int, y: int, width: int, height: int):
+        first = y // self.rows_per_strip
+        last = (y + height - 1) // self.rows_per_strip
+        parts = []
+        for index in range(first, last + 1):
+            strip_top = index * self.rows_per_strip
+            top = max(y, strip_top) - strip_top
+            bottom = min(y + height, strip_top + self.rows_per_strip) - strip_top
+            parts.append(self._strip(index)[top:bottom, x:x + width, :3])
+        return np.ascontiguousarray(parts[0] if len(parts) == 1 else np.concatenate(parts))
+
+
+class DecodedImageSource:
+    """
+    Fallback for compressed formats (JPEG, PNG, compressed TIFF)
+    These can't be read by window, so the image is decoded once. JPEGs over
+    MAX_DECODED_PIXELS are decoded at 1/2, 1/4 or 1/8 scale; anything else
+    that large is rejected.
+    """
+
+    def __init__(self, image: Image.Image):
+        full_width, full_height = image.size
+        pixels = full_width * full_height
+        if pixels > MAX_DECODED_PIXELS and image.format == "JPEG":
+            # The JPEG decoder can only shrink by 2, 4 or 8
+            factor = next((f for f in (2, 4, 8) if pixels / (f * f) <= MAX_DECODED_PIXELS), 8)
+            image.draft("RGB", (math.ceil(full_width / factor), math.ceil(full_height / factor)))
+        if image.size[0] * image.size[1] > MAX_DECODED_PIXELS:
+            raise ValueError(f"{image.format} image of {full_width}x{full_height} is too large to decode; "
+                             f"upload it as an uncompressed TIFF")
+
+        decoded = image.convert("RGB") if image.mode != "RGB" else image
+        self.width, self.height = decoded.size
+        # Decoded pixels per original pixel along each axis
+        self.scale = self.width / full_width
+        self.pixels = np.asarray(decoded)
+
+    def read(self, x: int, y: int, width: int, height: int):
+        return np.ascontiguousarray(self.pixels[y:y + height, x:x + width])
+
+
+def open_image_source(path: str, raw_shape: Optional[Tuple[int, int, int]] = None):
+    """
+    Pick the cheapest reader for a file
+    raw_shape = (width, height, channels) marks the file as headerless raw pixels.
+    """
+    if np is None:
+        raise RuntimeError("numpy is required for tiled analysis")
+
+    if raw_shape:
+        width, height, channels = raw_shape
+        return RawImageSource(path, width, height, channels)
+
+    # Orthomosaics are far beyond PIL's decompression-bomb limit, which only
+    # matters for images decoded whole; TIFFs are opened past it (nothing is
+    # decoded yet) and held to our own limits below
+    try:
+        image = Image.open(path)
+    except Image.DecompressionBombError:
+        try:
+            image = TiffImagePlugin.TiffImageFile(path)
+        except SyntaxError:
+            raise ValueError("Image is too large to decode; upload it as an uncompressed TIFF")
+
+    with image:
+        width, height = image.size
+        if width * height > MAX_TILED_PIXELS:
+            raise ValueError(f"Image of {width}x{height} exceeds {MAX_TILED_PIXELS} pixels")
+        if TiffStripSource.supports(image):
+            return TiffStripSource(path, image)
+
+        print(f"[TILED] {image.format} image can't be memory-mapped, decoding fully")
+        return DecodedImageSource(image)
+
+
+def _tile_severity(analysis: Dict) -> Optional[float]:
+    """Share of plant pixels showing symptoms, or None for non-crop tiles"""
+    if analysis.get("plant_coverage", 0) < MIN_PLANT_COVERAGE:
+        return None
+    return round(100.0 - analysis["green_healthy"], 1)
+
+
+def analyze_tiles(source, tile_size: int = DEFAULT_TILE_SIZE,
+                  max_workers: Optional[int] = None) -> Dict:
+    """
+    Analyze every tile of an image source in parallel
+    At most 2 tiles per worker are in memory at any time.
+    """
+    tile_size = max(MIN_TILE_SIZE, min(MAX_TILE_SIZE, tile_size))
+    cols = math.ceil(source.width / tile_size)
+    rows = math.ceil(source.height / tile_size)
+    max_workers = max_workers or min(8, os.cpu_count() or 1)
+
+    severity: List[List[Optional[float]]] = [[None] * cols for _ in range(rows)]
+    diseases: List[List[Optional[str]]] = [[None] * cols for _ in range(rows)]
+    disease_counts: Dict[str, int] = {}
+
+    def run_tile(row: int, col: int) -> Tuple[int, int, Dict]:
+        x, y = col * tile_size, row * tile_size
+        pixels = source.read(x, y, min(tile_size, source.width - x), min(tile_size, source.height - y))
+        return row, col, analyze_array(pixels)
+
+    positions = iter((row, col) for row in range(rows) for col in range(cols))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        while True:
+            while len(pending) < max_workers * 2:
+                position = next(positions, None)
+                if position is None:
+                    break
+                pending.add(executor.submit(run_tile, *position))
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                row, col, result = future.result()
+                tile_severity = _tile_severity(result["analysis"])
+                severity[row][col] = tile_severity
+                if tile_severity is not None:
+                    diseases[row][col] = result["disease"]
+                    disease_counts[result["disease"]] = disease_counts.get(result["disease"], 0) + 1
+
+    crop_tiles = [value for line in severity for value in line if value is not None]
+    affected = [value for value in crop_tiles if value >= AFFECTED_SEVERITY]
+
+    return {
+        "width": source.width,
+        "height": source.height,
+        "scale": getattr(source, "scale", 1.0),
+        "tile_size": tile_size,
+        "rows": rows,
+        "cols": cols,
+        "severity_grid": severity,
+        "disease_grid": diseases,
+        "summary": {
+            "crop_tiles": len(crop_tiles),
+            "mean_severity": round(sum(crop_tiles) / len(crop_tiles), 1) if crop_tiles else 0.0,
+            "max_severity": max(crop_tiles) if crop_tiles else 0.0,
+            "affected_area_percent": round(len(affected) * 100 / len(crop_tiles), 1) if crop_tiles else 0.0,
+            "disease_counts": disease_counts
+        }
+    }
+
+
+def analyze_large_image(path: str, tile_size: int = DEFAULT_TILE_SIZE,
+                        raw_shape: Optional[Tuple[int, int, int]] = None) -> Dict:
+    """Open a field image from disk and build its severity grid"""
+    source = open_image_source(path, raw_shape)
+    return analyze_tiles(source, tile_size)
+
+
+if __name__ == "__main__":
+    # Analyze a synthetic orthomosaic written as an uncompressed TIFF
+    import tempfile
+    import time
+
+    print("Testing tiled analysis...")
+    size = 8192
+    rng = np.random.default_rng(7)
+    field = np.empty((size, size, 3), dtype=np.uint8)
+    field[...] = (45, 135, 50)
+    # A blighted patch in the north-east corner
+    field[:size // 4, -size // 4:] = (100, 60, 25)
+    field[rng.integers(0, size, 5000), rng.integers(0, size, 5000)] = (30, 25, 20)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "field.tif")
+        Image.fromarray(field).save(path, compression="raw")
+        del field
+
+        started = time.perf_counter()
+        source = open_image_source(path)
+        result = analyze_tiles(source, tile_size=1024)
+        elapsed = time.perf_counter() - started
+
+        print(f"  Source: {type(source).__name__}, {result['rows']}x{result['cols']} tiles "
+              f"in {elapsed:.2f}s")
+        for line in result["severity_grid"]:
+            print("  " + " ".join(f"{value:5.1f}" for value in line))
+        print(f"  Summary: {result['summary']}")
+        del source
+
+    print("\n[OK] Tiled analysis working correctly!")
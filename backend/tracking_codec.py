@@ -0,0 +1,342 @@
+"""
+Compact Tracking Histories for AgriChain Orders and Deliveries
+Tracking events are stored column by column: statuses, messages and
+locations become codes into a shared table of stock strings plus a per-log
+table for the rest, and ISO timestamps become microsecond deltas from the
+event before, starting at t0. Each column is one comma-separated string so
+the indented data files keep it on a single line. TrackingLog keeps the old
+list-of-dicts interface and only decodes events when they are read or the
+API serializes them.
+"""
+
+import json
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+FORMAT_VERSION = 1
+TIMESTAMP_KEY = "timestamp"
+
+# Strings most events repeat, coded without a per-log entry.
+# Append only: stored codes index into this tuple.
+STOCK_STRINGS = (
+    # Delivery statuses and messages (delivery_manager.py, delivery_simulator.py)
+    "assigned", "picked_up", "in_transit", "out_for_delivery", "delivered", "failed", "cancelled",
+    "Order is on the way to delivery location", "Order is out for delivery. Will arrive soon!",
+    "Order delivered successfully", "Delivery attempt failed. Will retry.", "Delivery cancelled",
+    "Order picked up from farm", "On the way to delivery location", "Delivery partner nearby",
+    "Successfully delivered", "Unknown",
+    # Order statuses, locations and descriptions (orders.py)
+    "Order Placed", "Confirmed By Farmer", "Confirmed", "Packed", "Shipped", "In Transit",
+    "Out For Delivery", "Delivered", "Cancelled", "Pending", "Online",
+    "Order placed successfully. Awaiting farmer confirmation.",
+    "Payment confirmed, order placed successfully", "Farmer confirmed the order",
+    "Product packed and ready for pickup", "Successfully delivered to customer",
+)
+_STOCK_CODES = {("str", value): code for code, value in enumerate(STOCK_STRINGS)}
+
+
+def _value_key(value) -> Tuple[str, object]:
+    """Interning key; keeps 1, 1.0 and True apart and lets lists and dicts be interned"""
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return (type(value).__name__, value)
+    return ("json", json.dumps(value, sort_keys=True))
+
+
+def _exact_time(value) -> Optional[datetime]:
+    """The datetime an ISO string encodes, if turning it back into a string gives the same text"""
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return parsed if parsed.isoformat() == value else None
+
+
+def _join(values: List[Optional[int]]) -> str:
+    return ",".join("" if value is None else str(value) for value in values)
+
+
+def _split(text: str, count: int) -> List[Optional[int]]:
+    return [int(value) if value else None for value in text.split(",")] if count else []
+
+
+def new_log() -> Dict:
+    return {"v": FORMAT_VERSION, "n": 0, "keys": [], "columns": {}, "strings": [], "t0": None, "dt": ""}
+
+
+class TrackingLog(list):
+    """
+    Append-only list of tracking events backed by the compact form
+    It subclasses list so FastAPI serializes it like one, but the list storage
+    stays empty: iteration and indexing decode events from the columns.
+    """
+
+    def __init__(self, encoded: Optional[Dict] = None):
+        super().__init__()
+        self._log = encoded if encoded is not None else new_log()
+        # Columns parsed out of their strings on first use; None in a code
+        # column means the event doesn't have the key
+        self._columns: Optional[Dict[str, List[Optional[int]]]] = None
+        self._deltas: Optional[List[Optional[int]]] = None
+        self._dirty = False
+        self._lookup: Optional[Dict[Tuple[str, object], int]] = None
+        self._last_time: Optional[datetime] = None
+
+    @classmethod
+    def from_events(cls, events: Iterable[Dict]) -> "TrackingLog":
+        log = cls()
+        log.extend(events)
+        return log
+
+    def encoded(self) -> Dict:
+        """Stored form (shared, not copied)"""
+        if self._dirty:
+            self._log["columns"] = {key: _join(column) for key, column in self._columns.items()}
+            self._log["dt"] = _join(self._deltas)
+            self._dirty = False
+        return self._log
+
+    def _parsed(self) -> Tuple[Dict[str, List[Optional[int]]], List[Optional[int]]]:
+        if self._columns is None:
+            count = self._log["n"]
+            self._columns = {key: _split(text, count) for key, text in self._log["columns"].items()}
+            self._deltas = _split(self._log["dt"], count)
+        return self._columns, self._deltas
+
+    # Reading
+
+    def _value(self, code: int):
+        if code < len(STOCK_STRINGS):
+            return STOCK_STRINGS[code]
+        return self._log["strings"][code - len(STOCK_STRINGS)]
+
+    def _event(self, index: int, time: Optional[datetime]) -> Dict:
+        event = {}
+        columns = self._parsed()[0]
+        for key in self._log["keys"]:
+            if key == TIMESTAMP_KEY and time is not None:
+                event[key] = time.isoformat()
+                continue
+            code = columns[key][index]
+            if code is not None:
+                event[key] = self._value(code)
+        return event
+
+    def _times(self) -> Iterator[Optional[datetime]]:
+        """Timestamp of each event, None where it wasn't delta-coded"""
+        t0 = datetime.fromisoformat(self._log["t0"]) if self._log["t0"] else None
+        elapsed = 0
+        for delta in self._parsed()[1]:
+            if delta is None:
+                yield None
+            else:
+                elapsed += delta
+                yield t0 + timedelta(microseconds=elapsed)
+
+    def _time_at(self, index: int) -> Optional[datetime]:
+        deltas = self._parsed()[1]
+        if deltas[index] is None:
+            return None
+        elapsed = sum(delta for delta in deltas[:index + 1] if delta is not None)
+        return datetime.fromisoformat(self._log["t0"]) + timedelta(microseconds=elapsed)
+
+    def __len__(self) -> int:
+        return self._log["n"]
+
+    def __bool__(self) -> bool:
+        return self._log["n"] > 0
+
+    def __iter__(self) -> Iterator[Dict]:
+        for index, ts in enumerate(self._times()):
+            yield self._event(index, ts)
+
+    def __reversed__(self) -> Iterator[Dict]:
+        return reversed(list(self))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError("tracking log index out of range")
+        return self._event(index, self._time_at(index))
+
+    def __contains__(self, event) -> bool:
+        return any(item == event for item in self)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, list) and list(self) == list(other)
+
+    def __ne__(self, other) -> bool:
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"TrackingLog({list(self)!r})"
+
+    def __reduce__(self):
+        return (self.__class__, (self.encoded(),))
+
+    def copy(self) -> "TrackingLog":
+        return TrackingLog(json.loads(json.dumps(self.encoded())))
+
+    # Writing
+
+    def _code(self, value) -> int:
+        key = _value_key(value)
+        code = _STOCK_CODES.get(key)
+        if code is not None:
+            return code
+        if self._lookup is None:
+            self._lookup = {_value_key(item): len(STOCK_STRINGS) + n for n, item in enumerate(self._log["strings"])}
+        code = self._lookup.get(key)
+        if code is None:
+            code = self._lookup[key] = len(STOCK_STRINGS) + len(self._log["strings"])
+            self._log["strings"].append(value)
+        return code
+
+    def _latest_time(self) -> Optional[datetime]:
+        if self._last_time is None:
+            for ts in self._times():
+                if ts is not None:
+                    self._last_time = ts
+        return self._last_time
+
+    def append(self, event: Dict):
+        log = self._log
+        count = log["n"]
+        columns, deltas = self._parsed()
+        for key in event:
+            if key not in columns:
+                log["keys"].append(key)
+                columns[key] = [None] * count
+
+        # Timestamps that round-trip exactly are stored as deltas; anything
+        # else (missing, another format, another UTC offset) goes in the table
+        delta = None
+        time = _exact_time(event.get(TIMESTAMP_KEY))
+        if time is not None:
+            if log["t0"] is None:
+                log["t0"] = event[TIMESTAMP_KEY]
+                delta = 0
+            else:
+                last = self._latest_time()
+                if time.utcoffset() == last.utcoffset():
+                    delta = (time - last) // timedelta(microseconds=1)
+            if delta is not None:
+                self._last_time = time
+        deltas.append(delta)
+
+        for key, column in columns.items():
+            if key not in event or (key == TIMESTAMP_KEY and delta is not None):
+                column.append(None)
+            else:
+                column.append(self._code(event[key]))
+        log["n"] = count + 1
+        self._dirty = True
+
+    def extend(self, events: Iterable[Dict]):
+        for event in events:
+            self.append(event)
+
+    def __iadd__(self, events: Iterable[Dict]) -> "TrackingLog":
+        self.extend(events)
+        return self
+
+    def _append_only(self, *args, **kwargs):
+        raise TypeError("tracking logs are append-only")
+
+    __setitem__ = __delitem__ = insert = pop = remove = clear = sort = reverse = _append_only
+
+
+def pack_tracking(records: List[Dict], key: str = "tracking_updates") -> List[Dict]:
+    """Records as they are written to disk: shallow copies with tracking logs in compact form"""
+    packed = []
+    for record in records:
+        events = record.get(key)
+        if isinstance(events, TrackingLog):
+            record = {**record, key: events.encoded()}
+        elif isinstance(events, list):
+            record = {**record, key: TrackingLog.from_events(events).encoded()}
+        packed.append(record)
+    return packed
+
+
+def unpack_tracking(records: List[Dict], key: str = "tracking_updates") -> int:
+    """
+    Wrap stored tracking logs in TrackingLog views, in place
+    Returns how many were legacy lists of dicts (migrated; saved compact on the next write).
+    """
+    migrated = 0
+    for record in records:
+        events = record.get(key)
+        if isinstance(events, dict):
+            record[key] = TrackingLog(events)
+        elif isinstance(events, list) and not isinstance(events, TrackingLog):
+            record[key] = TrackingLog.from_events(events)
+            migrated += 1
+    return migrated
+
+
+if __name__ == "__main__":
+    # Size and speed on deliveries with frequent GPS-driven updates
+    import random
+    import time
+
+    print("Testing tracking codec...")
+    rng = random.Random(50)
+    places = ["Rohini", "Dwarka", "Saket", "Noida", "Gurgaon", "Karol Bagh", "Azadpur", "Okhla"]
+    statuses = ["assigned", "picked_up", "in_transit", "out_for_delivery", "delivered"]
+    messages = ["Order picked up from farm", "On the way to delivery location", "Delivery partner nearby",
+                "Successfully delivered"]
+
+    deliveries = []
+    for n in range(2000):
+        clock = datetime(2026, 3, 1, 6) + timedelta(minutes=n)
+        updates = [{"status": "assigned", "message": f"Delivery partner Rider {n % 50} has been assigned",
+                    "location": rng.choice(places), "timestamp": clock.isoformat()}]
+        # A location fix every 30 s while on the road, status changes along the way
+        for step in range(60):
+            clock += timedelta(seconds=30, microseconds=rng.randrange(1_000_000))
+            status = statuses[1 + min(3, step // 15)]
+            updates.append({"status": status, "message": messages[min(3, step // 15)],
+                            "location": f"{28.5 + rng.random() * 0.3:.5f},{77.0 + rng.random() * 0.3:.5f}",
+                            "timestamp": clock.isoformat()})
+        deliveries.append({"delivery_id": f"DEL-{n}", "tracking_updates": updates})
+
+    legacy = json.dumps(deliveries, ensure_ascii=False, indent=2)
+    started = time.perf_counter()
+    packed = pack_tracking(deliveries)
+    encode_s = time.perf_counter() - started
+    compact = json.dumps(packed, ensure_ascii=False, indent=2)
+    print(f"  2,000 deliveries x 61 events: {len(legacy) / 1e6:.1f} MB -> {len(compact) / 1e6:.1f} MB "
+          f"({len(compact) * 100 / len(legacy):.0f}%), encoded in {encode_s:.2f}s")
+
+    loaded = json.loads(compact)
+    started = time.perf_counter()
+    unpack_tracking(loaded)
+    latest = [d["tracking_updates"][-1] for d in loaded]
+    lazy_s = time.perf_counter() - started
+    started = time.perf_counter()
+    expanded = [list(d["tracking_updates"]) for d in loaded]
+    expand_s = time.perf_counter() - started
+    assert expanded == [d["tracking_updates"] for d in deliveries]
+    assert latest == [d["tracking_updates"][-1] for d in deliveries]
+    print(f"  Load + latest event of each: {lazy_s * 1000:.0f} ms; full expansion: {expand_s * 1000:.0f} ms; "
+          f"round trip exact")
+
+    # Odd timestamps and keys survive untouched
+    odd = [{"status": "Order Placed", "timestamp": "2026-03-01T10:00:00Z", "location": "Online"},
+           {"status": "Packed", "timestamp": "2026-03-01T12:00:00+05:30", "note": {"crates": 3}},
+           {"status": "Shipped"}]
+    log = TrackingLog.from_events(odd)
+    restored = TrackingLog(json.loads(json.dumps(log.encoded())))
+    assert restored == odd and restored[-1] == odd[-1]
+    restored.append({"status": "Delivered", "timestamp": "2026-03-01T15:00:00+05:30"})
+    print(f"  Mixed formats round trip: {list(restored)[1:]}")
+
+    print("\n[OK] Tracking codec working correctly!")
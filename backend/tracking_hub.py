@@ -0,0 +1,227 @@
+"""
+Live Delivery Tracking for AgriChain Consumers
+Sockets subscribe to a delivery and get its state pushed as status updates
+and partner GPS pings arrive. The last known state of recently active
+deliveries is cached so a new subscriber gets a snapshot without a file scan.
+"""
+
+import asyncio
+import itertools
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from connection_manager import SEND_QUEUE_SIZE, SLOW_CONSUMER_CLOSE_CODE, Connection
+from eta import FINISHED_STATUSES
+
+# Deliveries whose last known state is kept in memory
+SNAPSHOT_CACHE_SIZE = 10000
+
+
+class TrackingConnection(Connection):
+    """Subscriber socket; queued location updates for a delivery collapse into the newest"""
+
+    def _coalesce_key(self, message: dict) -> Optional[tuple]:
+        if message.get("type") == "location":
+            return ("location", message.get("delivery_id"))
+        return None
+
+
+class TrackingHub:
+    def __init__(self, max_queue: int = SEND_QUEUE_SIZE, cache_size: int = SNAPSHOT_CACHE_SIZE):
+        # {delivery_id: {connection_id: TrackingConnection}}
+        self.subscribers: Dict[str, Dict[int, TrackingConnection]] = {}
+        self.snapshots: "OrderedDict[str, Dict]" = OrderedDict()
+        # partner_id -> cached deliveries still under way, for routing GPS pings
+        self.partner_deliveries: Dict[str, Set[str]] = {}
+        self.max_queue = max_queue
+        self.cache_size = cache_size
+        self._connection_ids = itertools.count(1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+
+    def start(self):
+        """Bind to the running loop so updates from worker threads are handed over to it"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+
+    def _on_loop(self, callback, *args):
+        if self._loop is not None and threading.get_ident() != self._loop_thread:
+            self._loop.call_soon_threadsafe(callback, *args)
+        else:
+            callback(*args)
+
+    @staticmethod
+    def _state(delivery: Dict, location: Optional[Dict] = None) -> Dict:
+        """What a tracking screen needs, without the full tracking history"""
+        updates = delivery.get("tracking_updates") or [{}]
+        return {
+            "delivery_id": delivery["delivery_id"],
+            "order_id": delivery["order_id"],
+            "status": delivery["status"],
+            "partner_id": delivery.get("partner_id"),
+            "partner_name": delivery.get("partner_name"),
+            "partner_phone": delivery.get("partner_phone"),
+            "partner_vehicle": delivery.get("partner_vehicle"),
+            "estimated_delivery_time": delivery.get("estimated_delivery_time"),
+            "last_update": updates[-1],
+            "route_stops": delivery.get("route_stops"),
+            "location": location
+        }
+
+    def _cache(self, state: Dict) -> Dict:
+        delivery_id = state["delivery_id"]
+        previous = self.snapshots.pop(delivery_id, None)
+        if previous and state["location"] is None:
+            state["location"] = previous["location"]
+        self.snapshots[delivery_id] = state
+
+        partner_id = state["partner_id"]
+        if state["status"] in FINISHED_STATUSES:
+            self.partner_deliveries.get(partner_id, set()).discard(delivery_id)
+        elif partner_id:
+            self.partner_deliveries.setdefault(partner_id, set()).add(delivery_id)
+
+        while len(self.snapshots) > self.cache_size:
+            evicted_id, evicted = self.snapshots.popitem(last=False)
+            if evicted_id in self.subscribers:
+                self.snapshots[evicted_id] = evicted  # Still watched; keep it
+                self.snapshots.move_to_end(evicted_id, last=True)
+                break
+            self.partner_deliveries.get(evicted["partner_id"], set()).discard(evicted_id)
+        return state
+
+    def deliveries_updated(self, deliveries: Iterable[Dict]):
+        """DeliveryManager listener: refresh the cache and push to subscribers"""
+        # Copied here, in the writer's thread, before the caller moves on
+        self._on_loop(self._apply_states, [self._state(delivery) for delivery in deliveries])
+
+    def _apply_states(self, states: List[Dict]):
+        for state in states:
+            state = self._cache(state)
+            self._send(state["delivery_id"], {"type": "status", "delivery": state})
+
+    def location_updated(self, partner_id: str, ping: Tuple[float, float, float]):
+        """GpsIngest listener: move every tracked delivery of this partner"""
+        delivery_ids = self.partner_deliveries.get(partner_id)
+        if not delivery_ids:
+            return
+        ts, lat, lon = ping
+        location = {"lat": lat, "lon": lon, "timestamp": ts}
+        for delivery_id in list(delivery_ids):
+            state = self.snapshots.get(delivery_id)
+            if state is not None:
+                state["location"] = location
+            self._send(delivery_id, {"type": "location", "delivery_id": delivery_id, **location})
+
+    def _send(self, delivery_id: str, message: Dict):
+        for connection in list(self.subscribers.get(delivery_id, {}).values()):
+            try:
+                connection.enqueue(message)
+            except OverflowError:
+                print(f"[TRACKING] Disconnecting slow subscriber of {delivery_id}")
+                self._close(delivery_id, connection, SLOW_CONSUMER_CLOSE_CODE)
+
+    def snapshot(self, delivery_id: str) -> Optional[Dict]:
+        state = self.snapshots.get(delivery_id)
+        if state is not None:
+            self.snapshots.move_to_end(delivery_id)
+        return state
+
+    def track(self, delivery: Dict) -> Dict:
+        """Cache a delivery loaded from the store (cache miss) and return its state"""
+        return self._cache(self._state(delivery))
+
+    async def subscribe(self, websocket, subscriber_email: str, state: Dict) -> int:
+        """Accept a socket for one delivery and send it the current state straight away"""
+        await websocket.accept()
+        delivery_id = state["delivery_id"]
+        connection = TrackingConnection(next(self._connection_ids), subscriber_email, websocket, self.max_queue)
+        self.subscribers.setdefault(delivery_id, {})[connection.connection_id] = connection
+        connection.writer = asyncio.create_task(self._write(delivery_id, connection))
+        connection.enqueue({"type": "snapshot", "delivery": state})
+        return connection.connection_id
+
+    async def _write(self, delivery_id: str, connection: TrackingConnection):
+        try:
+            await connection.run_writer()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[ERROR] Failed to push tracking for {delivery_id}: {e}")
+            self.unsubscribe(delivery_id, connection.connection_id)
+
+    def unsubscribe(self, delivery_id: str, connection_id: int):
+        sessions = self.subscribers.get(delivery_id)
+        if sessions and connection_id in sessions:
+            connection = sessions.pop(connection_id)
+            if connection.writer and connection.writer is not asyncio.current_task():
+                connection.writer.cancel()
+            if not sessions:
+                del self.subscribers[delivery_id]
+
+    def _close(self, delivery_id: str, connection: TrackingConnection, code: int):
+        self.unsubscribe(delivery_id, connection.connection_id)
+
+        async def close():
+            try:
+                await connection.websocket.close(code=code)
+            except Exception:
+                pass  # Already gone
+
+        asyncio.create_task(close())
+
+
+# Singleton instance
+tracking_hub = TrackingHub()
+
+
+if __name__ == "__main__":
+    # Fan-out: 1,000 deliveries with 5 watchers each, driven by status and GPS updates
+    import time
+
+    class FakeWebSocket:
+        def __init__(self):
+            self.received = []
+
+        async def accept(self):
+            pass
+
+        async def send_json(self, message):
+            self.received.append(message)
+
+        async def close(self, code=1000):
+            pass
+
+    async def main():
+        print("Testing tracking hub...")
+        hub = TrackingHub()
+        hub.start()
+        deliveries = [{"delivery_id": f"DEL-{n}", "order_id": f"ORD-{n}", "partner_id": f"DP{n % 200}",
+                       "status": "assigned", "tracking_updates": [{"status": "assigned"}]} for n in range(1000)]
+        sockets = []
+        for delivery in deliveries:
+            for _ in range(5):
+                socket = FakeWebSocket()
+                await hub.subscribe(socket, "consumer@test.com", hub.snapshot(delivery["delivery_id"]) or hub.track(delivery))
+                sockets.append(socket)
+
+        started = time.perf_counter()
+        for status in ("picked_up", "in_transit"):
+            for delivery in deliveries:
+                delivery["status"] = status
+            hub.deliveries_updated(deliveries)
+        for second in range(50):
+            for partner in range(200):
+                hub.location_updated(f"DP{partner}", (second, 28.6 + second * 1e-4, 77.2))
+        enqueue_ms = (time.perf_counter() - started) * 1000
+        await asyncio.sleep(0.2)
+
+        counts = [len(socket.received) for socket in sockets]
+        print(f"  2,000 status + 10,000 GPS updates fanned out to 5,000 sockets: {enqueue_ms:.0f} ms to enqueue")
+        print(f"  Messages per socket: min {min(counts)}, max {max(counts)} (GPS bursts coalesce)")
+        print(f"  Snapshot on subscribe: {sockets[0].received[0]['type']}, "
+              f"latest location {hub.snapshot('DEL-0')['location']}")
+
+    asyncio.run(main())
+    print("\n[OK] Tracking hub working correctly!")
@@ -6,6 +6,7 @@ import { getApiEndpoint, getWsEndpoint } from '../config/api';
 
 interface Message {
   message_id: string;
+  seq: number;
   conversation_id: string;
   sender_email: string;
   sender_name: string;
@@ -62,7 +63,11 @@ export const Chat = () => {
   }, [navigate]);
 
   const connectWebSocket = (userEmail: string) => {
-    const websocket = new WebSocket(getWsEndpoint(`/ws/chat/${userEmail}`));
+    const token = localStorage.getItem('token') || '';
+    const websocket = new WebSocket(getWsEndpoint(`/ws/chat/${userEmail}?token=${encodeURIComponent(token)}`));
+    // Live messages are only acked once every page of the offline sync has been,
+    // so the delivery cursor never skips a page still to come
+    let synced = false;
 
     websocket.onopen = () => {
       console.log('[CHAT] WebSocket connected');
@@ -70,10 +75,35 @@ export const Chat = () => {
 
     websocket.onmessage = (event) => {
       const data = JSON.parse(event.data);
-      
-      if (data.type === 'new_message') {
+
+      if (data.type === 'ping') {
+        // Server heartbeat: answer it or the idle socket is closed as stale
+        websocket.send(JSON.stringify({ type: 'pong' }));
+      } else if (data.type === 'sync') {
+        // Messages received while offline, oldest first, one page per frame
+        const missed: Message[] = Array.isArray(data.messages) ? data.messages : [];
+        if (missed.length > 0) {
+          websocket.send(JSON.stringify({ type: 'sync_ack', cursor: missed[missed.length - 1].seq }));
+          if (selectedConversation) {
+            const other = selectedConversation.other_user.email;
+            setMessages(prev => {
+              const known = new Set(prev.map(m => m.message_id));
+              return [...prev, ...missed.filter(m => m.sender_email === other && !known.has(m.message_id))];
+            });
+          }
+          loadConversations();
+        }
+        if (data.has_more) {
+          websocket.send(JSON.stringify({ type: 'sync' }));
+        } else {
+          synced = true;
+        }
+      } else if (data.type === 'new_message') {
         // New message received
         const message = data.message;
+        if (synced) {
+          websocket.send(JSON.stringify({ type: 'sync_ack', cursor: message.seq }));
+        }
         
         // If this message is from the currently open conversation, add it to messages
         if (selectedConversation && 